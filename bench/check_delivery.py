@@ -0,0 +1,184 @@
+"""
+Проверка отправки в Telegram больших записей и длинных сообщений против заглушки Bot API.
+
+Запуск из корня репозитория (нужен только ffmpeg, сеть не используется):
+    python -m bench.check_delivery
+
+Лимит загрузки заглушки (и TELEGRAM_MAX_UPLOAD_SIZE приложения) уменьшается до доли размера
+сгенерированной записи, чтобы пройти оба пути delivery_logic.deliver_file: сжатие видео
+до битрейта, при котором оно влезает в лимит, и нарезку на части без перекодирования,
+когда битрейт получился бы ниже MIN_VIDEO_BITRATE_KBPS; после сбоя посреди нарезки повтор
+досылает только неотправленные части. Длинный отчёт должен уйти
+несколькими сообщениями не длиннее 4096 символов, без потерянных слов и с закрытой
+в каждой части разметкой. Код возврата ненулевой, если хоть одна проверка не прошла.
+"""
+import os
+import re
+import shutil
+import logging
+import argparse
+import tempfile
+
+from bench.replay import TelegramHandler, Checks, start_server, generate_recording
+
+# Запас на поля multipart-формы поверх размера файла
+MULTIPART_OVERHEAD = 64 * 1024
+_PART_HEADER = re.compile(r"^\*Часть \d+/\d+\*\n\n")
+
+
+def words(text: str) -> list[str]:
+    return re.findall(r"\w+", text)
+
+
+def long_report() -> str:
+    """Отчёт длиннее лимита сообщения: жирный текст и блок кода пересекают границы частей"""
+    lines = ["1. 📌 *Краткое резюме*"]
+    lines += [f"Пункт {i}: обсуждение задачи номер {i} и сроков её выполнения командой." for i in range(60)]
+    lines.append("*Ответственные: " + " ".join(f"Участник{i}" for i in range(300)) + "*")
+    lines.append("```")
+    lines += [f"строка_кода_{i} = значение_{i}" for i in range(150)]
+    lines.append("```")
+    lines.append("3. 🧱 _Планы и задачи_: " + "слово " * 1500)
+    return "\n".join(lines)
+
+
+def run(args, check: Checks):
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="zoom-check-delivery-")
+    os.makedirs(work_dir, exist_ok=True)
+    os.environ.update({
+        "TELEGRAM_BOT_TOKEN": "bench",
+        "TELEGRAM_CHAT_ID": "1",
+        "TELEGRAM_API_URL": start_server(TelegramHandler),
+        "TELEGRAM_MAX_RETRIES": "0",
+    })
+    import telegram_logic
+    import delivery_logic
+    from telegram_logic import send_file_to_telegram, send_message_to_telegram, FileTooLargeError, MAX_MESSAGE_LENGTH
+
+    if not args.verbose:
+        logging.disable(logging.INFO)
+    telegram_logic.TELEGRAM_PRIVATE_CHAT_INTERVAL = 0
+    telegram_logic.TELEGRAM_GLOBAL_INTERVAL = 0
+
+    source_path, _ = generate_recording(work_dir, args.duration)
+    video_path = os.path.join(work_dir, "meeting.mp4")
+    shutil.copy(source_path, video_path)
+    size = os.path.getsize(video_path)
+    limit = int(size * args.limit_share)
+
+    def set_limit(value: int):
+        telegram_logic.TELEGRAM_MAX_UPLOAD_SIZE = value
+        delivery_logic.TELEGRAM_MAX_UPLOAD_SIZE = value
+        TelegramHandler.upload_limit = value + MULTIPART_OVERHEAD
+
+    def leftovers() -> list[str]:
+        return sorted(name for name in os.listdir(work_dir) if "_compressed" in name or "_part" in name)
+
+    # Файл в пределах лимита уходит как есть
+    set_limit(size)
+    TelegramHandler.reset()
+    delivery_logic.deliver_file(video_path, caption="Запись")
+    sent = TelegramHandler.sent
+    check("файл в пределах лимита — одно видео", [r["method"] for r in sent] == ["sendVideo"], sent)
+    check("подпись не изменена", sent and sent[0]["fields"].get("caption") == "Запись")
+
+    # Сжатие: битрейт под лимит выше минимального (синтетическая запись сжимается и при малом битрейте)
+    set_limit(limit)
+    delivery_logic.MIN_VIDEO_BITRATE_KBPS = 10
+    TelegramHandler.reset()
+    delivery_logic.deliver_file(video_path, caption="Запись")
+    sent = TelegramHandler.sent
+    check("сжатие — одно видео", [r["method"] for r in sent] == ["sendVideo"], [r["method"] for r in sent])
+    check("сжатое видео в пределах лимита", sent and sent[0]["bytes"] <= limit + MULTIPART_OVERHEAD,
+          f"{sent[0]['bytes'] if sent else '—'} из {limit}")
+    check("отправлен сжатый файл", sent and "_compressed" in sent[0]["fields"].get("filename", ""))
+    check("сжатый файл удалён после отправки", not leftovers(), leftovers())
+
+    # Нарезка: сжатие опустило бы битрейт ниже минимального
+    delivery_logic.MIN_VIDEO_BITRATE_KBPS = 10 ** 6
+    TelegramHandler.reset()
+    delivery_logic.deliver_file(video_path, caption="Запись")
+    sent = TelegramHandler.sent
+    check("нарезка — несколько видео", len(sent) >= 2 and all(r["method"] == "sendVideo" for r in sent),
+          [r["method"] for r in sent])
+    check("каждая часть в пределах лимита", all(r["bytes"] <= limit + MULTIPART_OVERHEAD for r in sent),
+          [r["bytes"] for r in sent])
+    captions = [r["fields"].get("caption") for r in sent]
+    check("подписи частей пронумерованы",
+          captions == [f"Запись (часть {i}/{len(sent)})" for i in range(1, len(sent) + 1)], captions)
+    check("части покрывают запись", sum(r["bytes"] for r in sent) >= size * 0.9,
+          f"{sum(r['bytes'] for r in sent)} из {size}")
+    check("части удалены после отправки", not leftovers(), leftovers())
+
+    # Сбой посреди отправки частей: повтор досылает только неотправленные
+    parts_count = len(sent)
+    sent_parts = []
+    TelegramHandler.reset()
+    TelegramHandler.accept_limit = 1
+    try:
+        delivery_logic.deliver_file(video_path, caption="Запись", sent=sent_parts)
+        check("сбой отправки части прерывает доставку", False, "доставлено")
+    except Exception as e:
+        check("сбой отправки части прерывает доставку", sent_parts == [1], f"{type(e).__name__}, отмечены {sent_parts}")
+    TelegramHandler.accept_limit = None
+    TelegramHandler.reset()
+    delivery_logic.deliver_file(video_path, caption="Запись", sent=sent_parts)
+    captions = [r["fields"].get("caption") for r in TelegramHandler.sent]
+    check("повтор не отправляет часть заново",
+          captions == [f"Запись (часть {i}/{parts_count})" for i in range(2, parts_count + 1)], captions)
+    check("все части отмечены отправленными", sent_parts == list(range(1, parts_count + 1)), sent_parts)
+    check("части удалены после сбоя и повтора", not leftovers(), leftovers())
+
+    # Большой файл не медиа и прямой вызов send_file_to_telegram сверх лимита
+    document_path = os.path.join(work_dir, "notes.txt")
+    with open(document_path, "wb") as f:
+        f.write(b"x" * (limit + 1))
+    TelegramHandler.reset()
+    try:
+        delivery_logic.deliver_file(document_path)
+        check("большой файл не медиа отклоняется", False, "отправлен")
+    except RuntimeError as e:
+        check("большой файл не медиа отклоняется", not TelegramHandler.sent, e)
+    try:
+        send_file_to_telegram(video_path)
+        check("send_file_to_telegram не отправляет файл сверх лимита", False, "отправлен")
+    except FileTooLargeError:
+        check("send_file_to_telegram не отправляет файл сверх лимита", not TelegramHandler.sent)
+
+    # Сообщения
+    TelegramHandler.reset()
+    send_message_to_telegram("Короткое *сообщение*")
+    sent = TelegramHandler.sent
+    check("короткое сообщение уходит одним запросом",
+          len(sent) == 1 and sent[0]["fields"].get("text") == "Короткое *сообщение*", sent)
+
+    report = long_report()
+    TelegramHandler.reset()
+    send_message_to_telegram(report)
+    texts = [r["fields"]["text"] for r in TelegramHandler.sent]
+    check("длинный отчёт разбит на части", len(texts) > 1, f"{len(report)} символов, частей {len(texts)}")
+    check("части не длиннее лимита", all(len(text) <= MAX_MESSAGE_LENGTH for text in texts),
+          [len(text) for text in texts])
+    check("части пронумерованы", all(text.startswith(f"*Часть {i}/{len(texts)}*\n\n") for i, text in enumerate(texts, 1)))
+    bodies = [_PART_HEADER.sub("", text) for text in texts]
+    check("разметка закрыта в каждой части",
+          all(telegram_logic._markdown_state(body, None) is None for body in bodies))
+    check("слова отчёта сохранены по порядку", words(" ".join(bodies)) == words(report))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=int, default=60, help="Длина записи в секундах")
+    parser.add_argument("--limit-share", type=float, default=0.6,
+                        help="Лимит загрузки как доля размера записи (меньше 1)")
+    parser.add_argument("--work-dir", help="Каталог для записи и её частей (по умолчанию временный)")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    check = Checks()
+    run(args, check)
+    check.exit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""
+Проверка скачивания записей: докачка после обрывов и сверка размера с file_size из webhook.
+
+Запуск из корня репозитория (нужен только ffmpeg, сеть не используется):
+    python -m bench.check_download
+
+Запись раздаётся медиасервером из bench.replay, который обрывает заданное число ответов
+посреди передачи. Сегменты уменьшены, чтобы небольшая запись качалась в несколько потоков.
+Проверяется, что оборванный сегмент докачивается с последнего записанного байта и файл
+совпадает с исходным побайтно; что прерванная загрузка продолжается следующим вызовом
+по файлу прогресса, не скачивая заново готовое; что расхождение с file_size даёт
+DownloadIntegrityError; и что сервер без Range обслуживается одним потоком.
+Код возврата ненулевой, если хоть одна проверка не прошла.
+"""
+import os
+import hashlib
+import logging
+import argparse
+import tempfile
+
+from bench.replay import MediaHandler, Checks, start_server, generate_recording
+
+
+def sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def run(args, check: Checks):
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="zoom-check-download-")
+    media_dir = os.path.join(work_dir, "media")
+    os.makedirs(media_dir, exist_ok=True)
+    MediaHandler.root = media_dir
+    media_url = start_server(MediaHandler)
+
+    import zoom_logic
+    from zoom_logic import download_zoom_file, download_metrics, DownloadIntegrityError
+
+    if not args.verbose:
+        logging.disable(logging.WARNING)
+    zoom_logic.DOWNLOAD_MIN_SEGMENT_SIZE = args.segment_kb * 1024
+    max_retries = zoom_logic.DOWNLOAD_MAX_RETRIES
+
+    video_path, _ = generate_recording(media_dir, args.duration)
+    url = f"{media_url}/{os.path.basename(video_path)}"
+    size = os.path.getsize(video_path)
+    reference = sha256(video_path)
+
+    def target(name: str) -> str:
+        path = os.path.join(work_dir, name)
+        for leftover in (path, f"{path}.progress"):
+            if os.path.exists(leftover):
+                os.remove(leftover)
+        return path
+
+    # Обрывы сегментов во время одной загрузки
+    path = target("dropped.mp4")
+    retries = download_metrics.snapshot()["retries"]
+    MediaHandler.drops = args.drops
+    download_zoom_file(url, path, access_token="bench", expected_size=size)
+    check("оборванные сегменты докачаны, файл совпадает", sha256(path) == reference)
+    check("обрывы учтены как повторы", download_metrics.snapshot()["retries"] - retries >= args.drops,
+          download_metrics.snapshot()["retries"] - retries)
+    check("файл прогресса удалён", not os.path.exists(f"{path}.progress"))
+
+    # Загрузка прервана целиком и продолжена следующим вызовом
+    path = target("resumed.mp4")
+    zoom_logic.DOWNLOAD_MAX_RETRIES = 0
+    MediaHandler.drops = 1
+    try:
+        download_zoom_file(url, path, expected_size=size)
+        check("обрыв без повторов прерывает загрузку", False, "загрузка завершилась")
+    except Exception as e:
+        check("обрыв без повторов прерывает загрузку", os.path.exists(f"{path}.progress"), type(e).__name__)
+    zoom_logic.DOWNLOAD_MAX_RETRIES = max_retries
+    MediaHandler.drops = 0
+    sent = MediaHandler.bytes_sent
+    download_zoom_file(url, path, expected_size=size)
+    resumed_bytes = MediaHandler.bytes_sent - sent
+    check("продолжение совпадает с исходным файлом", sha256(path) == reference)
+    check("продолжение не качает готовые части заново", resumed_bytes < size, f"{resumed_bytes} из {size} байт")
+
+    # Расхождение с file_size из webhook
+    path = target("mismatch.mp4")
+    failures = download_metrics.snapshot()["failures"]
+    try:
+        download_zoom_file(url, path, expected_size=size + 1)
+        check("расхождение размера — DownloadIntegrityError", False, "загрузка завершилась")
+    except DownloadIntegrityError as e:
+        check("расхождение размера — DownloadIntegrityError", True, e)
+    check("ошибка учтена в метриках", download_metrics.snapshot()["failures"] == failures + 1)
+
+    # Сервер без Range: один поток, при обрыве — заново
+    path = target("single.mp4")
+    MediaHandler.ranges = False
+    MediaHandler.drops = 1
+    download_zoom_file(url, path, expected_size=size)
+    MediaHandler.ranges = True
+    check("без Range файл скачан одним потоком и совпадает", sha256(path) == reference)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=int, default=60, help="Длина записи в секундах")
+    parser.add_argument("--segment-kb", type=int, default=256, help="Минимальный размер сегмента, КБ")
+    parser.add_argument("--drops", type=int, default=3, help="Сколько ответов оборвать при первой загрузке")
+    parser.add_argument("--work-dir", help="Каталог для записи и загрузок (по умолчанию временный)")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    check = Checks()
+    run(args, check)
+    check.exit()
+
+
+if __name__ == "__main__":
+    main()
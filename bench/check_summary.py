@@ -0,0 +1,103 @@
+"""
+Проверка саммари длинной встречи: map-reduce детерминирован, а повтор с кэшем не обращается к модели.
+
+Запуск из корня репозитория (сеть не используется):
+    python -m bench.check_summary
+
+Транскрипт длинной встречи генерируется в формате transcript.txt, SUMMARY_CHUNK_TOKENS
+уменьшен, чтобы он делился на десятки фрагментов и выжимки сворачивались повторно,
+а SUMMARY_PARTIAL_MAX_TOKENS — вместе с ним, чтобы конфигурация проходила check_summary_config.
+Заглушка OpenAI из bench.replay отвечает со случайной задержкой, поэтому параллельные запросы
+фрагментов завершаются в разном порядке, а её ответ зависит от текста запроса. Проверяется,
+что два прогона с пустым кэшем дают одинаковые запросы и одинаковый отчёт, что одновременно
+идёт не больше SUMMARY_CONCURRENCY запросов, и что повтор с тем же кэшем отдаёт
+те же разделы, не сделав ни одного запроса к модели.
+Код возврата ненулевой, если хоть одна проверка не прошла.
+"""
+import os
+import logging
+import argparse
+import tempfile
+
+from bench.replay import OpenAIHandler, Checks, start_server
+
+
+def long_transcript(paragraphs: int) -> str:
+    from transcript_logic import format_paragraph
+
+    topics = ["бюджет квартала", "релиз мобильного приложения", "найм в команду поддержки", "миграцию базы"]
+    return "\n".join(
+        format_paragraph(
+            i * 20.0,
+            i % 3,
+            f"Обсуждаем {topics[i % len(topics)]}: предлагаю взять задачу номер {i} до пятницы, "
+            f"нужно согласовать сроки с соседней командой и проверить риски по пункту {i * 7 % 13}.",
+        )
+        for i in range(paragraphs)
+    )
+
+
+def run(args, check: Checks):
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="zoom-check-summary-")
+    OpenAIHandler.echo = True
+    OpenAIHandler.jitter = args.jitter
+    os.environ.update({
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"{start_server(OpenAIHandler)}/v1",
+        "SUMMARY_CHUNK_TOKENS": str(args.chunk_tokens),
+        "SUMMARY_PARTIAL_MAX_TOKENS": str(args.partial_tokens),
+        "SUMMARY_CONCURRENCY": str(args.concurrency),
+    })
+    import cache_logic
+    from text_logic import convert_to_plans_and_tasks, check_summary_config, SUMMARY_PARTIAL_PROMPT
+
+    check_summary_config()
+
+    if not args.verbose:
+        logging.disable(logging.INFO)
+    transcript = long_transcript(args.paragraphs)
+
+    def summarize(cache_dir: str) -> tuple[list[str], list[dict]]:
+        cache_logic._cache = cache_logic.DiskCache(os.path.join(work_dir, cache_dir))
+        OpenAIHandler.reset()
+        sections = []
+        convert_to_plans_and_tasks(transcript, on_section=sections.append)
+        return sections, list(OpenAIHandler.calls)
+
+    first_sections, first_calls = summarize("cache-1")
+    second_sections, second_calls = summarize("cache-2")
+    partials = [call for call in first_calls if call["system"] == SUMMARY_PARTIAL_PROMPT]
+    check("транскрипт разбит на фрагменты", len(partials) > 1, f"запросов фрагментов {len(partials)}")
+    # Во втором раунде фрагментами становятся выжимки первого, то есть ответы заглушки
+    folded = [call for call in partials if "ответ на запрос" in call["user"]]
+    check("выжимки свёрнуты повторно", bool(folded), f"запросов второго раунда {len(folded)}")
+    check("одновременных запросов не больше SUMMARY_CONCURRENCY",
+          OpenAIHandler.max_in_flight <= args.concurrency, OpenAIHandler.max_in_flight)
+    check("оба прогона отправили одинаковые запросы",
+          sorted(call["user"] for call in first_calls) == sorted(call["user"] for call in second_calls))
+    check("итоговый запрос одинаков", first_calls[-1] == second_calls[-1])
+    check("отчёт одинаков", first_sections == second_sections and bool(first_sections), first_sections[:1])
+
+    cached_sections, cached_calls = summarize("cache-1")
+    check("повтор с кэшем не обращается к модели", not cached_calls, f"запросов {len(cached_calls)}")
+    check("повтор с кэшем отдаёт те же разделы", cached_sections == first_sections)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--paragraphs", type=int, default=400, help="Сколько абзацев в транскрипте")
+    parser.add_argument("--chunk-tokens", type=int, default=400, help="SUMMARY_CHUNK_TOKENS для прогона")
+    parser.add_argument("--partial-tokens", type=int, default=150, help="SUMMARY_PARTIAL_MAX_TOKENS для прогона")
+    parser.add_argument("--concurrency", type=int, default=4, help="SUMMARY_CONCURRENCY для прогона")
+    parser.add_argument("--jitter", type=float, default=0.05, help="Случайная задержка ответа заглушки, с")
+    parser.add_argument("--work-dir", help="Каталог для кэшей прогонов (по умолчанию временный)")
+    parser.add_argument("--verbose", action="store_true")
+    args = parser.parse_args()
+
+    check = Checks()
+    run(args, check)
+    check.exit()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""
+Образец русской речи с эталонным текстом для python -m bench.transcription.
+
+Запуск из корня репозитория (нужна сеть, скачивается только начало архива):
+    python -m bench.fetch_sample
+    python -m bench.transcription --engine whisper:base --engine faster-whisper:small:int8
+
+Берутся первые записи тестовой части русского FLEURS (google/fleurs, ru_ru, CC BY 4.0):
+метаданные test.tsv и архив test.tar.gz читаются потоком, пока не наберётся --seconds речи.
+Длина каждой записи сверяется с num_samples из метаданных. Записи склеиваются через
+полсекунды тишины в 16 кГц моно WAV, их тексты — в эталон. В манифест рядом пишутся
+источник, ревизия датасета, записи и sha256 результата.
+
+Датасет читается из ревизии FLEURS_REVISION, а образец с --seconds по умолчанию сверяется
+с SAMPLE_SHA256 и REFERENCE_SHA256. Пока они не заполнены, берётся текущая ревизия main,
+и скрипт печатает значения, которые нужно вписать, чтобы закрепить образец.
+--sha256 дополнительно сверяет образец с полученным на другой машине.
+"""
+import io
+import os
+import sys
+import json
+import wave
+import hashlib
+import tarfile
+import argparse
+import tempfile
+import numpy as np
+import requests
+
+from zoom_logic import decode_audio, SAMPLE_RATE
+
+FLEURS_REPO = "google/fleurs"
+# Ревизия (commit) датасета и sha256 образца, собранного из неё с --seconds по умолчанию.
+# Пустые значения — образец ещё не закреплён: их печатает первый прогон с доступом к сети
+FLEURS_REVISION = ""
+SAMPLE_SHA256 = ""
+REFERENCE_SHA256 = ""
+DEFAULT_SECONDS = 120
+SAMPLE_DIR = "bench_data"
+SAMPLE_NAME = "ru_sample"
+PAUSE_SECONDS = 0.5
+
+
+def sample_paths(directory: str = SAMPLE_DIR) -> dict[str, str]:
+    base = os.path.join(directory, SAMPLE_NAME)
+    return {"audio": f"{base}.wav", "reference": f"{base}.txt", "manifest": f"{base}.json"}
+
+
+def file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def fleurs_url(revision: str) -> str:
+    return f"https://huggingface.co/datasets/{FLEURS_REPO}/resolve/{revision}/data/ru_ru"
+
+
+def resolve_revision(branch: str = "main") -> str:
+    """Commit ветки датасета на Hugging Face — для незакреплённого образца"""
+    response = requests.get(f"https://huggingface.co/api/datasets/{FLEURS_REPO}/revision/{branch}", timeout=60)
+    response.raise_for_status()
+    return response.json()["sha"]
+
+
+def pinned_mismatches(manifest: dict) -> list[str]:
+    """Расхождения образца с закреплёнными sha256; пусто, если совпал или не закреплён"""
+    expected = {"audio_sha256": SAMPLE_SHA256, "reference_sha256": REFERENCE_SHA256}
+    return [
+        f"{key} {manifest[key]}, ожидался {value}"
+        for key, value in expected.items()
+        if value and manifest[key] != value
+    ]
+
+
+def read_metadata(base_url: str) -> dict[str, dict]:
+    """Записи test.tsv по имени файла: id, имя файла, исходный текст, нормализованный, слова, отсчёты, пол"""
+    response = requests.get(f"{base_url}/test.tsv", timeout=60)
+    response.raise_for_status()
+    records = {}
+    for line in response.content.decode("utf-8").splitlines():
+        fields = line.split("\t")
+        if len(fields) >= 6 and fields[5].isdigit():
+            records[fields[1]] = {"text": fields[2].strip(), "num_samples": int(fields[5])}
+    return records
+
+
+def read_utterance(data: bytes, expected_samples: int) -> np.ndarray:
+    """Отсчёты записи в 16 кГц моно int16; длина сверяется с метаданными до передискретизации"""
+    with wave.open(io.BytesIO(data)) as wav:
+        frames = wav.getnframes()
+        native = wav.getframerate() == SAMPLE_RATE and wav.getnchannels() == 1 and wav.getsampwidth() == 2
+        pcm = wav.readframes(frames) if native else None
+    if frames != expected_samples:
+        raise RuntimeError(f"В записи {frames} отсчётов, а в метаданных {expected_samples}")
+    if native:
+        return np.frombuffer(pcm, np.int16)
+    with tempfile.NamedTemporaryFile(suffix=".wav") as tmp:
+        tmp.write(data)
+        tmp.flush()
+        return (decode_audio(tmp.name) * 32767).astype(np.int16)
+
+
+def fetch(base_url: str, seconds: float) -> tuple[list[np.ndarray], list[dict]]:
+    metadata = read_metadata(base_url)
+    utterances, records = [], []
+    total = 0.0
+    with requests.get(f"{base_url}/audio/test.tar.gz", stream=True, timeout=(10, 60)) as response:
+        response.raise_for_status()
+        # Архив читается потоком и закрывается, как только речи набралось достаточно
+        with tarfile.open(fileobj=response.raw, mode="r|gz") as archive:
+            for member in archive:
+                name = os.path.basename(member.name)
+                if not member.isfile() or name not in metadata:
+                    continue
+                record = metadata[name]
+                samples = read_utterance(archive.extractfile(member).read(), record["num_samples"])
+                utterances.append(samples)
+                records.append({"file": name, **record})
+                total += len(samples) / SAMPLE_RATE
+                if total >= seconds:
+                    break
+    if not utterances:
+        raise RuntimeError("В архиве нет записей из метаданных")
+    return utterances, records
+
+
+def write_sample(
+    directory: str, utterances: list[np.ndarray], records: list[dict], base_url: str, revision: str | None
+) -> dict:
+    os.makedirs(directory, exist_ok=True)
+    paths = sample_paths(directory)
+    pause = np.zeros(int(PAUSE_SECONDS * SAMPLE_RATE), np.int16)
+    audio = np.concatenate([part for samples in utterances for part in (samples, pause)][:-1])
+    with wave.open(paths["audio"], "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(SAMPLE_RATE)
+        wav.writeframes(audio.tobytes())
+    with open(paths["reference"], "w", encoding="utf-8") as f:
+        f.write("\n".join(record["text"] for record in records) + "\n")
+    manifest = {
+        "source": base_url,
+        "revision": revision,
+        "license": "CC BY 4.0",
+        "seconds": round(len(audio) / SAMPLE_RATE, 2),
+        "utterances": records,
+        "audio_sha256": file_sha256(paths["audio"]),
+        "reference_sha256": file_sha256(paths["reference"]),
+    }
+    with open(paths["manifest"], "w", encoding="utf-8") as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    return manifest
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dir", default=SAMPLE_DIR, help="Куда сохранить образец")
+    parser.add_argument("--seconds", type=float, default=DEFAULT_SECONDS, help="Сколько секунд речи набрать")
+    parser.add_argument("--base-url", help="Зеркало каталога ru_ru FLEURS вместо Hugging Face")
+    parser.add_argument("--sha256", help="Ожидаемый sha256 образца из манифеста другой машины")
+    parser.add_argument("--force", action="store_true", help="Скачать заново, даже если образец уже есть")
+    args = parser.parse_args()
+
+    paths = sample_paths(args.dir)
+    if os.path.exists(paths["manifest"]) and not args.force:
+        with open(paths["manifest"], encoding="utf-8") as f:
+            manifest = json.load(f)
+        if file_sha256(paths["audio"]) != manifest["audio_sha256"]:
+            sys.exit(f"{paths['audio']} не совпадает с манифестом, скачайте заново с --force")
+        print(f"Образец уже есть: {paths['audio']}")
+    else:
+        revision = None if args.base_url else FLEURS_REVISION or resolve_revision()
+        base_url = args.base_url or fleurs_url(revision)
+        utterances, records = fetch(base_url, args.seconds)
+        manifest = write_sample(args.dir, utterances, records, base_url, revision)
+        print(f"Сохранено {len(records)} записей, {manifest['seconds']} с: {paths['audio']}, {paths['reference']}")
+    print(f"sha256 аудио: {manifest['audio_sha256']}")
+
+    # Закреплённые sha256 относятся к образцу с --seconds по умолчанию
+    if args.seconds == DEFAULT_SECONDS:
+        mismatches = pinned_mismatches(manifest)
+        if mismatches:
+            sys.exit(f"Образец не совпадает с закреплённым: {'; '.join(mismatches)}")
+        if not SAMPLE_SHA256 and manifest.get("revision"):
+            print(
+                "Образец не закреплён. Чтобы закрепить его, впишите в bench/fetch_sample.py:\n"
+                f'FLEURS_REVISION = "{manifest["revision"]}"\n'
+                f'SAMPLE_SHA256 = "{manifest["audio_sha256"]}"\n'
+                f'REFERENCE_SHA256 = "{manifest["reference_sha256"]}"'
+            )
+    if args.sha256 and args.sha256 != manifest["audio_sha256"]:
+        sys.exit(f"sha256 образца не совпадает с ожидаемым {args.sha256}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,220 @@
+"""
+Локальный стенд горизонтального масштабирования: API без встроенных воркеров и несколько
+процессов python -m worker на одной машине с общей очередью, рабочим каталогом и кэшем.
+
+Запуск из корня репозитория (нужен только ffmpeg, сеть не используется):
+    python -m bench.local_cluster --workers 3 --meetings 6 --kill-after 5
+
+Записи, Telegram Bot API и OpenAI заменены локальными заглушками из bench.replay.
+С --kill-after через заданное число секунд один из воркеров, выполняющих задачу, убивается
+SIGKILL — без штатной остановки и возврата задач. Его задачи должны перейти к оставшимся
+воркерам после истечения аренды (--lease секунд) и завершиться.
+
+Выводит, какие воркеры выполняли задачи, какие задачи были переданы и итог прогона.
+"""
+import os
+import sys
+import json
+import time
+import signal
+import socket
+import argparse
+import tempfile
+import subprocess
+import urllib.request
+
+from bench.replay import (
+    MediaHandler,
+    OpenAIHandler,
+    TelegramHandler,
+    start_server,
+    generate_recording,
+    generated_payload,
+    prepare_payload,
+)
+
+ADMIN_TOKEN = "bench"
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def request(url: str, body: dict | None = None, admin: bool = False) -> tuple[int, dict]:
+    data = json.dumps(body).encode() if body is not None else None
+    req = urllib.request.Request(url, data=data, headers={"Content-Type": "application/json"})
+    if admin:
+        req.add_header("X-Admin-Token", ADMIN_TOKEN)
+    try:
+        with urllib.request.urlopen(req, timeout=10) as response:
+            return response.status, json.loads(response.read() or b"{}")
+    except urllib.error.HTTPError as e:
+        return e.code, {}
+    except OSError:
+        return 0, {}
+
+
+def spawn(args: list[str], env: dict, log_path: str) -> subprocess.Popen:
+    log = open(log_path, "w")
+    return subprocess.Popen(
+        [sys.executable, *args], cwd=REPO_ROOT, env=env, stdout=log, stderr=subprocess.STDOUT
+    )
+
+
+def run(args) -> dict:
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="zoom-cluster-")
+    media_dir = os.path.join(work_dir, "media")
+    logs_dir = os.path.join(work_dir, "logs")
+    os.makedirs(media_dir, exist_ok=True)
+    os.makedirs(logs_dir, exist_ok=True)
+
+    MediaHandler.root = media_dir
+    OpenAIHandler.latency = args.openai_latency
+    media_url = start_server(MediaHandler)
+    telegram_url = start_server(TelegramHandler)
+    openai_url = start_server(OpenAIHandler)
+    video_path, audio_path = generate_recording(media_dir, args.duration)
+
+    # Все процессы стенда делят очередь, дедупликацию, рабочий каталог, кэш и трассы
+    env = {
+        **os.environ,
+        "TELEGRAM_BOT_TOKEN": "bench",
+        "TELEGRAM_CHAT_ID": "1",
+        "TELEGRAM_API_URL": telegram_url,
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"{openai_url}/v1",
+        "ZOOM_WEBHOOK_SECRET_TOKEN": "",
+        "ADMIN_TOKEN": ADMIN_TOKEN,
+        "TRANSCRIBE_BACKEND": args.backend,
+        "WHISPER_PROCESSES": "1",
+        "MAX_QUEUED_JOBS": str(max(args.meetings, 20)),
+        "JOBS_DB_PATH": os.path.join(work_dir, "jobs.db"),
+        "JOBS_WORK_DIR": os.path.join(work_dir, "jobs_work"),
+        "DEDUP_DB_PATH": os.path.join(work_dir, "dedup.db"),
+        "CACHE_DIR": os.path.join(work_dir, "cache"),
+        "TRACE_DIR": os.path.join(work_dir, "traces"),
+        "JOB_LEASE_SECONDS": str(args.lease),
+        "JOB_HEARTBEAT_INTERVAL": str(max(args.lease / 4, 0.5)),
+        "JOB_POLL_INTERVAL": "0.2",
+        "RUN_EMBEDDED_WORKERS": "0",
+    }
+
+    api_port = free_port()
+    api_url = f"http://127.0.0.1:{api_port}"
+    api = spawn(["-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(api_port)],
+                env, os.path.join(logs_dir, "api.log"))
+    processes = [api]
+
+    try:
+        # Воркеры стартуют после API: к этому времени он создал очередь и вернул прерванные задачи
+        deadline = time.monotonic() + 60
+        while request(f"{api_url}/ready")[0] != 200:
+            if time.monotonic() > deadline or api.poll() is not None:
+                raise RuntimeError(f"API не запустился, см. {logs_dir}/api.log")
+            time.sleep(0.2)
+        processes += [
+            spawn(["-m", "worker"], env, os.path.join(logs_dir, f"worker-{i}.log")) for i in range(args.workers)
+        ]
+
+        started = time.perf_counter()
+        for i in range(args.meetings):
+            template = generated_payload(video_path, audio_path, with_audio=True)
+            payload = prepare_payload(template, i, media_url, media_dir, video_path, audio_path)
+            status, body = request(f"{api_url}/zoom/webhook", payload)
+            if body.get("status") != "accepted":
+                raise RuntimeError(f"Webhook не принят ({status}): {body}")
+
+        # Кто какие задачи выполнял: по снимкам /admin/workers
+        handled = {}
+        killed = None
+        deadline = time.monotonic() + args.timeout
+        while True:
+            _, snapshot = request(f"{api_url}/admin/workers", admin=True)
+            for worker in snapshot.get("workers", []):
+                handled.setdefault(worker["id"], set()).update(job["job_id"] for job in worker["jobs"])
+
+            if args.kill_after is not None and killed is None and time.perf_counter() - started >= args.kill_after:
+                busy = [worker for worker in snapshot.get("workers", []) if worker["jobs"] and worker["alive"]]
+                if busy:
+                    victim = busy[0]
+                    os.kill(victim["pid"], signal.SIGKILL)
+                    killed = {"id": victim["id"], "jobs": [job["job_id"] for job in victim["jobs"]],
+                              "at_seconds": round(time.perf_counter() - started, 2)}
+
+            _, stats = request(f"{api_url}/jobs/status")
+            if stats and stats["done"] + stats["failed"] >= args.meetings:
+                break
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Прогон не завершился за {args.timeout} с: {stats}")
+            time.sleep(0.2)
+        elapsed = time.perf_counter() - started
+
+        _, jobs = request(f"{api_url}/admin/jobs?limit={args.meetings}", admin=True)
+        statuses = {job["id"]: job["status"] for job in jobs.get("jobs", [])}
+        reassigned = []
+        if killed:
+            for job_id in killed["jobs"]:
+                owners = [worker for worker, job_ids in handled.items() if job_id in job_ids and worker != killed["id"]]
+                reassigned.append({"job_id": job_id, "status": statuses.get(job_id), "taken_by": owners})
+    finally:
+        for process in processes:
+            if process.poll() is None:
+                process.send_signal(signal.SIGTERM)
+        for process in processes:
+            try:
+                process.wait(timeout=30)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    return {
+        "meetings": args.meetings,
+        "done": stats["done"],
+        "failed": stats["failed"],
+        "workers": args.workers,
+        "wall_seconds": round(elapsed, 2),
+        "jobs_by_worker": {worker: sorted(job_ids) for worker, job_ids in handled.items()},
+        "killed": killed,
+        "reassigned": reassigned,
+        "work_dir": work_dir,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workers", type=int, default=3, help="Сколько процессов python -m worker запустить")
+    parser.add_argument("--meetings", type=int, default=6, help="Сколько встреч прогнать")
+    parser.add_argument("--duration", type=int, default=60, help="Длина записи в секундах")
+    parser.add_argument("--backend", default="stub", help="Движок транскрибации (stub, whisper, faster-whisper)")
+    parser.add_argument("--openai-latency", type=float, default=2.0, help="Задержка ответа заглушки OpenAI, с")
+    parser.add_argument("--lease", type=float, default=4.0, help="JOB_LEASE_SECONDS для воркеров стенда")
+    parser.add_argument("--kill-after", type=float, help="Через сколько секунд убить SIGKILL занятый воркер")
+    parser.add_argument("--timeout", type=float, default=600)
+    parser.add_argument("--work-dir", help="Каталог для медиа, очереди и логов процессов (по умолчанию временный)")
+    parser.add_argument("--json", help="Сохранить результат в JSON-файл")
+    args = parser.parse_args()
+
+    result = run(args)
+    print(
+        f"Встреч: {result['done']} готово, {result['failed']} упало из {result['meetings']} "
+        f"на {result['workers']} воркерах за {result['wall_seconds']} с"
+    )
+    for worker, job_ids in result["jobs_by_worker"].items():
+        print(f"  {worker}: задачи {', '.join(map(str, job_ids)) or '—'}")
+    if result["killed"]:
+        killed = result["killed"]
+        print(f"Убит воркер {killed['id']} на {killed['at_seconds']} с, его задачи: {killed['jobs']}")
+        for job in result["reassigned"]:
+            print(f"  задача {job['job_id']}: {job['status']}, продолжили {', '.join(job['taken_by']) or '—'}")
+    print(f"Логи процессов: {os.path.join(result['work_dir'], 'logs')}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    recovered = all(job["status"] == "done" and job["taken_by"] for job in result["reassigned"])
+    sys.exit(0 if result["failed"] == 0 and recovered else 1)
+
+
+if __name__ == "__main__":
+    main()
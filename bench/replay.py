@@ -0,0 +1,562 @@
+"""
+Офлайн-прогон всего конвейера: webhook → скачивание → отправка → транскрибация → отчёт.
+
+Запуск из корня репозитория (нужен только ffmpeg, сеть не используется):
+    python -m bench.replay --meetings 4 --durations 60,600 --download-workers 2 \
+        --transcribe-workers 1 --whisper-processes 2
+
+Записи генерируются ffmpeg заданной длины (или берутся из сохранённых payload
+recording.completed через --payload) и раздаются локальным HTTP-сервером с поддержкой Range.
+Telegram Bot API и OpenAI заменены локальными заглушками. По умолчанию используется
+движок транскрибации stub; --backend whisper / faster-whisper меряет настоящую модель.
+
+Выводит время по этапам (из трасс встреч), пиковый RSS процесса и его потомков
+(пул распознавания, ffmpeg) и пропускную способность.
+"""
+import os
+import re
+import sys
+import json
+import time
+import random
+import hashlib
+import logging
+import argparse
+import tempfile
+import threading
+import subprocess
+import statistics
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+
+class MediaHandler(BaseHTTPRequestHandler):
+    """
+    Раздаёт файлы записей с поддержкой Range, как download_url Zoom.
+    Для проверок докачки: drops следующих ответов обрываются после drop_after байт,
+    а с ranges = False сервер отдаёт файл целиком, как без поддержки Range
+    """
+
+    protocol_version = "HTTP/1.1"
+    root = ""
+    lock = threading.Lock()
+    ranges = True
+    drops = 0
+    drop_after = 64 * 1024
+    bytes_sent = 0
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        path = os.path.join(self.root, os.path.basename(self.path.split("?")[0]))
+        if not os.path.isfile(path):
+            self.send_response(404)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        size = os.path.getsize(path)
+        start, end = 0, size - 1
+        match = re.match(r"bytes=(\d+)-(\d*)", self.headers.get("Range", ""))
+        if match and self.ranges:
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else size - 1
+            self.send_response(206)
+            self.send_header("Content-Range", f"bytes {start}-{end}/{size}")
+        else:
+            self.send_response(200)
+        if self.ranges:
+            self.send_header("Accept-Ranges", "bytes")
+        self.send_header("Content-Length", str(end - start + 1))
+        self.end_headers()
+        remaining = end - start + 1
+        with self.lock:
+            drop = MediaHandler.drops > 0 and remaining > self.drop_after
+            if drop:
+                MediaHandler.drops -= 1
+        if drop:
+            # Обрыв соединения посреди ответа: клиент получит меньше байт, чем в Content-Length
+            remaining = self.drop_after
+            self.close_connection = True
+        with open(path, "rb") as f:
+            f.seek(start)
+            try:
+                while remaining:
+                    data = f.read(min(1024 * 1024, remaining))
+                    if not data:
+                        break
+                    self.wfile.write(data)
+                    remaining -= len(data)
+                    with self.lock:
+                        MediaHandler.bytes_sent += len(data)
+            except (BrokenPipeError, ConnectionResetError):
+                pass
+
+
+class TelegramHandler(BaseHTTPRequestHandler):
+    """
+    Заглушка Bot API: принимает любой метод и считает запросы и байты.
+    В sent сохраняются метод, размер и поля каждого запроса (для файлов — поля формы и имя файла),
+    а запросы больше upload_limit отклоняются с 413, как настоящий Bot API. С accept_limit
+    после стольких принятых запросов остальные отклоняются с 500 — как сбой посреди отправки
+    """
+
+    protocol_version = "HTTP/1.1"
+    lock = threading.Lock()
+    requests = {}
+    bytes_received = 0
+    message_id = 0
+    sent = []
+    upload_limit = None
+    accept_limit = None
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", "0"))
+        remaining = length
+        head = b""
+        while remaining:
+            chunk = self.rfile.read(min(1024 * 1024, remaining))
+            remaining -= len(chunk)
+            if len(head) < 64 * 1024:
+                head += chunk[:64 * 1024]
+        method = self.path.rsplit("/", 1)[-1]
+        if self.headers.get("Content-Type", "").startswith("application/json"):
+            fields = json.loads(head or b"{}")
+        else:
+            text = head.decode("utf-8", errors="ignore")
+            fields = dict(re.findall(r'name="(\w+)"\r\n\r\n(.*?)\r\n--', text, re.S))
+            filename = re.search(r'filename="([^"]*)"', text)
+            if filename:
+                fields["filename"] = filename.group(1)
+        with self.lock:
+            TelegramHandler.requests[method] = TelegramHandler.requests.get(method, 0) + 1
+            TelegramHandler.bytes_received += length
+            TelegramHandler.message_id += 1
+            TelegramHandler.sent.append({"method": method, "bytes": length, "fields": fields})
+            message_id = TelegramHandler.message_id
+            rejected = self.accept_limit is not None and len(TelegramHandler.sent) > self.accept_limit
+        if self.upload_limit is not None and length > self.upload_limit:
+            self._reply(413, {"ok": False, "error_code": 413, "description": "Request Entity Too Large"})
+            return
+        if rejected:
+            self._reply(500, {"ok": False, "error_code": 500, "description": "Internal Server Error"})
+            return
+        self._reply(200, {"ok": True, "result": {"message_id": message_id}})
+
+    def _reply(self, status: int, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    @classmethod
+    def reset(cls):
+        with cls.lock:
+            cls.requests = {}
+            cls.bytes_received = 0
+            cls.sent = []
+
+
+class OpenAIHandler(BaseHTTPRequestHandler):
+    """
+    Заглушка chat.completions (в том числе потоковых) с настраиваемой задержкой ответа.
+    Для проверок саммари: jitter добавляет к задержке случайную долю, чтобы параллельные
+    запросы завершались в разном порядке; с echo ответ зависит от текста запроса
+    (в нём хэш сообщения пользователя). В calls сохраняются промпты запросов,
+    в max_in_flight — наибольшее число одновременных запросов
+    """
+
+    protocol_version = "HTTP/1.1"
+    latency = 0.0
+    jitter = 0.0
+    echo = False
+    lock = threading.Lock()
+    calls = []
+    in_flight = 0
+    max_in_flight = 0
+    content = (
+        "1. 📌 Краткое резюме: прогон конвейера на синтетической записи.\n\n"
+        "2. ✅ Решения: нет данных.\n\n"
+        "3. 🧱 Планы и задачи: нет данных."
+    )
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        request = json.loads(self.rfile.read(int(self.headers.get("Content-Length", "0"))) or b"{}")
+        messages = {message["role"]: message["content"] for message in request.get("messages", [])}
+        with self.lock:
+            OpenAIHandler.calls.append(messages)
+            OpenAIHandler.in_flight += 1
+            OpenAIHandler.max_in_flight = max(OpenAIHandler.max_in_flight, OpenAIHandler.in_flight)
+        try:
+            time.sleep(self.latency + random.random() * self.jitter)
+            self._respond(request, self._content(messages.get("user", "")))
+        finally:
+            with self.lock:
+                OpenAIHandler.in_flight -= 1
+
+    def _content(self, user: str) -> str:
+        if not self.echo:
+            return self.content
+        digest = hashlib.sha256(user.encode("utf-8")).hexdigest()[:12]
+        return (
+            f"1. 📌 Краткое резюме: ответ на запрос {digest}.\n\n"
+            "2. ✅ Решения: нет данных.\n\n"
+            "3. 🧱 Планы и задачи: нет данных."
+        )
+
+    def _respond(self, request: dict, content: str):
+        model = request.get("model", "bench")
+        if request.get("stream"):
+            events = []
+            for i in range(0, len(content), 40):
+                events.append({
+                    "id": "bench",
+                    "object": "chat.completion.chunk",
+                    "created": int(time.time()),
+                    "model": model,
+                    "choices": [{"index": 0, "finish_reason": None, "delta": {"content": content[i:i + 40]}}],
+                })
+            body = "".join(f"data: {json.dumps(event)}\n\n" for event in events) + "data: [DONE]\n\n"
+            self._reply("text/event-stream", body.encode())
+            return
+        self._reply("application/json", json.dumps({
+            "id": "bench",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": model,
+            "choices": [{"index": 0, "finish_reason": "stop", "message": {"role": "assistant", "content": content}}],
+            "usage": {"prompt_tokens": 0, "completion_tokens": 0, "total_tokens": 0},
+        }).encode())
+
+    @classmethod
+    def reset(cls):
+        with cls.lock:
+            cls.calls = []
+            cls.max_in_flight = 0
+
+    def _reply(self, content_type: str, body: bytes):
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+class Checks:
+    """Проверки скриптов bench.check_*: печатают итог каждой и помнят провалы для кода возврата"""
+
+    def __init__(self):
+        self.failed = []
+
+    def __call__(self, name: str, ok: bool, detail=""):
+        print(f"{'OK  ' if ok else 'FAIL'} {name}" + (f": {detail}" if detail != "" else ""))
+        if not ok:
+            self.failed.append(name)
+        return ok
+
+    def exit(self):
+        print(f"Провалено проверок: {len(self.failed)}" if self.failed else "Все проверки пройдены")
+        sys.exit(1 if self.failed else 0)
+
+
+def start_server(handler) -> str:
+    server = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def generate_recording(directory: str, seconds: int) -> tuple[str, str]:
+    """
+    Синтетическая запись: тестовая картинка и тон с паузой в секунду каждые 7 секунд,
+    чтобы детектор речи резал фрагменты по паузам. Возвращает пути к mp4 и m4a.
+    """
+    video_path = os.path.join(directory, f"recording_{seconds}s.mp4")
+    audio_path = os.path.join(directory, f"recording_{seconds}s.m4a")
+    tone = "aevalsrc='0.3*sin(2*PI*220*t)*gt(mod(t,7),1)':s=16000"
+    if not os.path.exists(video_path):
+        subprocess.run([
+            "ffmpeg", "-nostdin", "-loglevel", "error", "-y",
+            "-f", "lavfi", "-i", f"testsrc=size=640x360:rate=15:duration={seconds}",
+            "-f", "lavfi", "-i", f"{tone}:d={seconds}",
+            "-c:v", "libx264", "-preset", "ultrafast", "-pix_fmt", "yuv420p",
+            "-c:a", "aac", "-shortest", video_path,
+        ], check=True)
+    if not os.path.exists(audio_path):
+        subprocess.run([
+            "ffmpeg", "-nostdin", "-loglevel", "error", "-y",
+            "-i", video_path, "-vn", "-c:a", "copy", audio_path,
+        ], check=True)
+    return video_path, audio_path
+
+
+def generated_payload(video_path: str, audio_path: str, with_audio: bool) -> dict:
+    files = [
+        {"id": "timeline", "file_type": "TIMELINE", "file_extension": "JSON", "download_url": "timeline.json"},
+        {"file_type": "MP4", "file_extension": "MP4", "recording_type": "shared_screen_with_speaker_view",
+         "download_url": os.path.basename(video_path)},
+    ]
+    if with_audio:
+        files.append({"file_type": "M4A", "file_extension": "M4A", "recording_type": "audio_only",
+                      "download_url": os.path.basename(audio_path)})
+    return {"event": "recording.completed", "payload": {"object": {"topic": "Прогон конвейера", "recording_files": files}}}
+
+
+def prepare_payload(template: dict, index: int, media_url: str, media_dir: str,
+                    video_path: str, audio_path: str) -> dict:
+    """
+    Копия payload с уникальной встречей и ссылками на локальный медиасервер.
+    Видео и аудио подменяются сгенерированными файлами нужной длины.
+    """
+    payload = json.loads(json.dumps(template))
+    payload["download_token"] = "bench"
+    meeting = payload["payload"]["object"]
+    meeting["uuid"] = f"bench-{index}-{time.time_ns()}"
+    for i, recording in enumerate(meeting.get("recording_files", [])):
+        file_type = recording.get("file_type", "").lower()
+        if recording.get("recording_type", "").lower() == "audio_only" or file_type in ["m4a", "audio"]:
+            path = audio_path
+        elif file_type in ["mp4", "video"]:
+            path = video_path
+        else:
+            path = os.path.join(media_dir, "missing.json")
+        recording["id"] = f"{meeting['uuid']}-{i}"
+        recording["download_url"] = f"{media_url}/{os.path.basename(path)}"
+        if os.path.exists(path):
+            recording["file_size"] = os.path.getsize(path)
+    return payload
+
+
+class RssSampler(threading.Thread):
+    """Периодически снимает RSS процесса и всех его потомков (Linux, /proc)"""
+
+    def __init__(self, interval: float = 0.2):
+        super().__init__(daemon=True)
+        self.interval = interval
+        self.peak_self_kb = 0
+        self.peak_total_kb = 0
+        self._stopped = threading.Event()
+
+    @staticmethod
+    def _rss_kb(pid: int) -> int:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        return int(line.split()[1])
+        except OSError:
+            pass
+        return 0
+
+    @staticmethod
+    def _descendants(root: int) -> list[int]:
+        children = {}
+        for name in os.listdir("/proc"):
+            if not name.isdigit():
+                continue
+            try:
+                with open(f"/proc/{name}/stat") as f:
+                    ppid = int(f.read().rsplit(")", 1)[1].split()[1])
+            except (OSError, IndexError, ValueError):
+                continue
+            children.setdefault(ppid, []).append(int(name))
+        result = []
+        stack = [root]
+        while stack:
+            for child in children.get(stack.pop(), []):
+                result.append(child)
+                stack.append(child)
+        return result
+
+    def run(self):
+        pid = os.getpid()
+        while not self._stopped.wait(self.interval):
+            own = self._rss_kb(pid)
+            total = own + sum(self._rss_kb(child) for child in self._descendants(pid))
+            self.peak_self_kb = max(self.peak_self_kb, own)
+            self.peak_total_kb = max(self.peak_total_kb, total)
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+def summarize_stages(spans: list[dict], stages: list[str]) -> dict:
+    durations = {stage: [] for stage in stages}
+    for record in spans:
+        if record["span"] in durations and record["status"] == "ok":
+            durations[record["span"]].append(record["duration_seconds"])
+    return {
+        stage: {
+            "count": len(values),
+            "mean": round(statistics.mean(values), 3),
+            "p50": round(statistics.median(values), 3),
+            "max": round(max(values), 3),
+        }
+        for stage, values in durations.items()
+        if values
+    }
+
+
+def run(args) -> dict:
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="zoom-replay-")
+    media_dir = os.path.join(work_dir, "media")
+    os.makedirs(media_dir, exist_ok=True)
+
+    MediaHandler.root = media_dir
+    OpenAIHandler.latency = args.openai_latency
+    media_url = start_server(MediaHandler)
+    telegram_url = start_server(TelegramHandler)
+    openai_url = start_server(OpenAIHandler)
+
+    durations = [int(value) for value in args.durations.split(",")]
+    recordings = {seconds: generate_recording(media_dir, seconds) for seconds in durations}
+
+    # Модули приложения читают настройки при импорте, поэтому окружение задаётся до импорта
+    os.environ.update({
+        "TELEGRAM_BOT_TOKEN": "bench",
+        "TELEGRAM_CHAT_ID": "1",
+        "TELEGRAM_API_URL": telegram_url,
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"{openai_url}/v1",
+        "ZOOM_WEBHOOK_SECRET_TOKEN": "",
+        "TRANSCRIBE_BACKEND": args.backend,
+        "DIARIZATION_BACKEND": args.diarization,
+        "DOWNLOAD_WORKERS": str(args.download_workers),
+        "TRANSCRIBE_WORKERS": str(args.transcribe_workers),
+        "WHISPER_PROCESSES": str(args.whisper_processes),
+        "MAX_QUEUED_JOBS": str(max(args.meetings, 20)),
+        "JOBS_DB_PATH": os.path.join(work_dir, "jobs.db"),
+        "JOBS_WORK_DIR": os.path.join(work_dir, "jobs_work"),
+        "DEDUP_DB_PATH": os.path.join(work_dir, "dedup.db"),
+        "CACHE_DIR": os.path.join(work_dir, "cache"),
+        "TRACE_DIR": os.path.join(work_dir, "traces"),
+    })
+    if not args.cache:
+        # Отдельный каталог кэша на каждый прогон — транскрибация выполняется по-настоящему
+        os.environ["CACHE_DIR"] = tempfile.mkdtemp(prefix="cache-", dir=work_dir)
+
+    from fastapi.testclient import TestClient
+    import main
+    from queue_logic import STAGES
+    from metrics_logic import read_trace
+    import telegram_logic
+
+    if not args.verbose:
+        # Логи приложения на каждый запрос заглушают итоговую таблицу
+        logging.disable(logging.INFO)
+
+    # Заглушка Telegram не ограничивает частоту — не тратим время прогона на паузы лимитера
+    telegram_logic.TELEGRAM_PRIVATE_CHAT_INTERVAL = 0
+    telegram_logic.TELEGRAM_GLOBAL_INTERVAL = 0
+
+    templates = []
+    for path in args.payload or []:
+        with open(path, encoding="utf-8") as f:
+            templates.append(json.load(f))
+
+    sampler = RssSampler()
+    sampler.start()
+    with TestClient(main.app) as client:
+        load_started = time.perf_counter()
+        while client.get("/ready").status_code != 200:
+            time.sleep(0.1)
+        model_load_seconds = time.perf_counter() - load_started
+
+        meetings = []
+        started = time.perf_counter()
+        for i in range(args.meetings):
+            seconds = durations[i % len(durations)]
+            video_path, audio_path = recordings[seconds]
+            template = templates[i % len(templates)] if templates else \
+                generated_payload(video_path, audio_path, args.audio_only)
+            payload = prepare_payload(template, i, media_url, media_dir, video_path, audio_path)
+            response = client.post("/zoom/webhook", json=payload)
+            if response.json().get("status") != "accepted":
+                raise RuntimeError(f"Webhook не принят: {response.text}")
+            meetings.append((payload["payload"]["object"]["uuid"], seconds))
+
+        deadline = time.monotonic() + args.timeout
+        while True:
+            stats = client.get("/jobs/status").json()
+            if stats["done"] + stats["failed"] >= args.meetings:
+                break
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Прогон не завершился за {args.timeout} с: {stats}")
+            time.sleep(0.2)
+        elapsed = time.perf_counter() - started
+    sampler.stop()
+
+    spans = [record for uuid, _ in meetings for record in read_trace(uuid)]
+    audio_seconds = sum(seconds for _, seconds in meetings)
+    return {
+        "meetings": args.meetings,
+        "done": stats["done"],
+        "failed": stats["failed"],
+        "config": {
+            "backend": args.backend,
+            "diarization": args.diarization,
+            "durations": durations,
+            "download_workers": args.download_workers,
+            "transcribe_workers": args.transcribe_workers,
+            "whisper_processes": args.whisper_processes,
+        },
+        "model_load_seconds": round(model_load_seconds, 2),
+        "wall_seconds": round(elapsed, 2),
+        "meetings_per_hour": round(args.meetings / elapsed * 3600, 1),
+        "audio_hours_per_hour": round(audio_seconds / elapsed, 2),
+        "peak_rss_mb": round(sampler.peak_self_kb / 1024, 1),
+        "peak_rss_with_children_mb": round(sampler.peak_total_kb / 1024, 1),
+        "telegram": {"requests": dict(TelegramHandler.requests), "bytes": TelegramHandler.bytes_received},
+        "stages": summarize_stages(spans, STAGES),
+        "work_dir": work_dir,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--meetings", type=int, default=2, help="Сколько встреч прогнать")
+    parser.add_argument("--durations", default="60", help="Длины записей в секундах через запятую")
+    parser.add_argument("--payload", action="append", help="Сохранённый payload recording.completed (можно несколько)")
+    parser.add_argument("--audio-only", action="store_true", help="Добавить в сгенерированный payload дорожку audio_only")
+    parser.add_argument("--backend", default="stub", help="Движок транскрибации (stub, whisper, faster-whisper)")
+    parser.add_argument("--diarization", default="none", help="Движок диаризации (none, spectral, resemblyzer)")
+    parser.add_argument("--download-workers", type=int, default=2)
+    parser.add_argument("--transcribe-workers", type=int, default=1)
+    parser.add_argument("--whisper-processes", type=int, default=2)
+    parser.add_argument("--openai-latency", type=float, default=0.5, help="Задержка ответа заглушки OpenAI, с")
+    parser.add_argument("--cache", action="store_true", help="Не сбрасывать кэш транскриптов между прогонами")
+    parser.add_argument("--timeout", type=float, default=3600)
+    parser.add_argument("--work-dir", help="Каталог для медиа, очереди и трасс (по умолчанию временный)")
+    parser.add_argument("--verbose", action="store_true", help="Показывать INFO-логи приложения")
+    parser.add_argument("--json", help="Сохранить результат в JSON-файл")
+    args = parser.parse_args()
+
+    result = run(args)
+    print(
+        f"Встреч: {result['done']} готово, {result['failed']} упало из {result['meetings']} "
+        f"за {result['wall_seconds']} с (загрузка модели {result['model_load_seconds']} с)"
+    )
+    print(
+        f"Пропускная способность: {result['meetings_per_hour']} встреч/ч, "
+        f"{result['audio_hours_per_hour']} ч аудио за час"
+    )
+    print(f"Пиковый RSS: {result['peak_rss_mb']} МБ, вместе с потомками {result['peak_rss_with_children_mb']} МБ")
+    print(f"{'этап':<16}{'кол-во':>8}{'среднее':>10}{'p50':>10}{'макс':>10}")
+    for stage, values in result["stages"].items():
+        print(f"{stage:<16}{values['count']:>8}{values['mean']:>10}{values['p50']:>10}{values['max']:>10}")
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    sys.exit(0 if result["failed"] == 0 else 1)
+
+
+if __name__ == "__main__":
+    main()
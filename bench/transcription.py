@@ -0,0 +1,101 @@
+"""
+Замер скорости и качества движков транскрибации.
+
+Запуск из корня репозитория:
+    python -m bench.fetch_sample
+    python -m bench.transcription --engine whisper:base --engine faster-whisper:small:int8
+
+По умолчанию используется образец русской речи из python -m bench.fetch_sample;
+свой образец задаётся через --audio и --reference.
+
+Для каждого движка выводит время загрузки модели, real-time factor
+(время распознавания / длительность аудио) и WER относительно эталонного текста.
+"""
+import os
+import re
+import time
+import argparse
+from bench.fetch_sample import sample_paths
+from transcription_backends import create_backend
+from zoom_logic import decode_audio, SAMPLE_RATE, STREAM_WINDOW_SECONDS
+
+
+def normalize_words(text: str) -> list[str]:
+    text = text.lower().replace("ё", "е")
+    return re.findall(r"\w+", text)
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """WER через расстояние Левенштейна по словам"""
+    ref = normalize_words(reference)
+    hyp = normalize_words(hypothesis)
+    if not ref:
+        return 0.0 if not hyp else 1.0
+    previous = list(range(len(hyp) + 1))
+    for i, ref_word in enumerate(ref, 1):
+        current = [i] + [0] * len(hyp)
+        for j, hyp_word in enumerate(hyp, 1):
+            current[j] = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (ref_word != hyp_word),
+            )
+        previous = current
+    return previous[-1] / len(ref)
+
+
+def run_engine(spec: str, audio, threads: int) -> dict:
+    name, _, rest = spec.partition(":")
+    model_size, _, compute_type = rest.partition(":")
+    kwargs = {"threads": threads}
+    if model_size:
+        kwargs["model_size"] = model_size
+    if compute_type:
+        kwargs["compute_type"] = compute_type
+    backend = create_backend(name, **kwargs)
+
+    started = time.perf_counter()
+    backend.load()
+    load_seconds = time.perf_counter() - started
+
+    window = STREAM_WINDOW_SECONDS * SAMPLE_RATE
+    started = time.perf_counter()
+    parts = [
+        backend.transcribe(audio[offset:offset + window]).strip()
+        for offset in range(0, len(audio), window)
+    ]
+    transcribe_seconds = time.perf_counter() - started
+    return {
+        "engine": spec,
+        "load_seconds": load_seconds,
+        "rtf": transcribe_seconds / (len(audio) / SAMPLE_RATE),
+        "text": " ".join(part for part in parts if part),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Замер RTF и WER движков транскрибации")
+    sample = sample_paths()
+    parser.add_argument("--audio", default=sample["audio"], help="Аудиофайл с русской речью")
+    parser.add_argument("--reference", default=sample["reference"], help="Эталонный текст (UTF-8)")
+    parser.add_argument("--engine", action="append", help="движок[:размер модели[:compute type]]")
+    parser.add_argument("--threads", type=int, default=1, help="Потоков на движок")
+    args = parser.parse_args()
+    missing = [path for path in (args.audio, args.reference) if not os.path.exists(path)]
+    if missing:
+        parser.error(f"нет {', '.join(missing)}: скачайте образец командой python -m bench.fetch_sample")
+
+    audio = decode_audio(args.audio)
+    with open(args.reference, encoding="utf-8") as f:
+        reference = f.read()
+
+    print(f"Аудио: {len(audio) / SAMPLE_RATE:.1f} с, потоков: {args.threads}")
+    print(f"{'движок':<32} {'загрузка, с':>12} {'RTF':>8} {'WER':>8}")
+    for spec in args.engine or ["whisper:base"]:
+        result = run_engine(spec, audio, args.threads)
+        wer = word_error_rate(reference, result["text"])
+        print(f"{result['engine']:<32} {result['load_seconds']:>12.1f} {result['rtf']:>8.3f} {wer:>8.1%}")
+
+
+if __name__ == "__main__":
+    main()
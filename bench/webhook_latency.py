@@ -0,0 +1,194 @@
+"""
+Задержка POST /zoom/webhook, пока тот же процесс транскрибирует встречу.
+
+Запуск из корня репозитория (нужен только ffmpeg, сеть не используется):
+    python -m bench.webhook_latency --duration 300 --stub-rtf 0.3 --target-ms 50
+
+Поднимает uvicorn main:app со встроенными воркерами, как в продакшене на одном инстансе.
+Записи, Telegram Bot API и OpenAI заменены заглушками из bench.replay, движок распознавания —
+stub, который с --stub-rtf занимает процессор пула распознавания так же, как модель
+(STUB_REAL_TIME_FACTOR секунд CPU на секунду аудио). Одна встреча ставится в очередь, и,
+пока её задача на этапе transcribe, webhook засыпается повторами этой встречи (как ретраи
+Zoom) или, с --unique, новыми встречами. Учитываются только ответы, полученные во время
+транскрибации. Код возврата ненулевой, если p99 превышает --target-ms.
+"""
+import os
+import sys
+import json
+import time
+import uuid
+import signal
+import asyncio
+import argparse
+import tempfile
+import statistics
+import httpx
+
+from bench.replay import (
+    MediaHandler,
+    OpenAIHandler,
+    TelegramHandler,
+    start_server,
+    generate_recording,
+    generated_payload,
+    prepare_payload,
+)
+from bench.local_cluster import ADMIN_TOKEN, free_port, request, spawn
+from bench.webhook_load import make_body, percentile
+
+
+def transcribing(api_url: str, meeting_uuid: str) -> bool:
+    """Выполняется ли сейчас этап transcribe задачи встречи"""
+    _, body = request(f"{api_url}/admin/jobs?status=running&limit=1000", admin=True)
+    return any(job["meeting_uuid"] == meeting_uuid and job["stage"] == "transcribe" for job in body.get("jobs", []))
+
+
+async def load(args, api_url: str, payload: dict) -> tuple[list[float], dict]:
+    latencies = []
+    statuses = {}
+    done = asyncio.Event()
+    duplicate = json.dumps(payload).encode()
+
+    async def worker(client: httpx.AsyncClient):
+        while not done.is_set():
+            body = make_body(f"bench-{uuid.uuid4()}") if args.unique else duplicate
+            started = time.perf_counter()
+            try:
+                response = await client.post(
+                    f"{api_url}/zoom/webhook", content=body, headers={"content-type": "application/json"}
+                )
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            elapsed = time.perf_counter() - started
+            if not done.is_set():
+                latencies.append(elapsed)
+                statuses[status] = statuses.get(status, 0) + 1
+            await asyncio.sleep(args.interval_ms / 1000)
+
+    async def watch():
+        # Этап проверяется в отдельном потоке, чтобы не искажать задержку запросов клиента
+        meeting_uuid = payload["payload"]["object"]["uuid"]
+        while await asyncio.to_thread(transcribing, api_url, meeting_uuid):
+            await asyncio.sleep(0.2)
+        done.set()
+
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+        await asyncio.gather(watch(), *(worker(client) for _ in range(args.concurrency)))
+    return latencies, statuses
+
+
+def run(args) -> dict:
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix="zoom-webhook-latency-")
+    media_dir = os.path.join(work_dir, "media")
+    os.makedirs(media_dir, exist_ok=True)
+
+    MediaHandler.root = media_dir
+    media_url = start_server(MediaHandler)
+    telegram_url = start_server(TelegramHandler)
+    openai_url = start_server(OpenAIHandler)
+    video_path, audio_path = generate_recording(media_dir, args.duration)
+
+    env = {
+        **os.environ,
+        "TELEGRAM_BOT_TOKEN": "bench",
+        "TELEGRAM_CHAT_ID": "1",
+        "TELEGRAM_API_URL": telegram_url,
+        "OPENAI_API_KEY": "bench",
+        "OPENAI_BASE_URL": f"{openai_url}/v1",
+        "ZOOM_WEBHOOK_SECRET_TOKEN": "",
+        "ADMIN_TOKEN": ADMIN_TOKEN,
+        "TRANSCRIBE_BACKEND": "stub",
+        "STUB_REAL_TIME_FACTOR": str(args.stub_rtf),
+        "DIARIZATION_BACKEND": args.diarization,
+        "WHISPER_PROCESSES": str(args.whisper_processes),
+        "MAX_QUEUED_JOBS": "100000",
+        "JOBS_DB_PATH": os.path.join(work_dir, "jobs.db"),
+        "JOBS_WORK_DIR": os.path.join(work_dir, "jobs_work"),
+        "DEDUP_DB_PATH": os.path.join(work_dir, "dedup.db"),
+        "CACHE_DIR": os.path.join(work_dir, "cache"),
+        "TRACE_DIR": os.path.join(work_dir, "traces"),
+        "RUN_EMBEDDED_WORKERS": "1",
+    }
+    api_port = free_port()
+    api_url = f"http://127.0.0.1:{api_port}"
+    log_path = os.path.join(work_dir, "api.log")
+    api = spawn(["-m", "uvicorn", "main:app", "--host", "127.0.0.1", "--port", str(api_port)], env, log_path)
+
+    try:
+        deadline = time.monotonic() + 120
+        while request(f"{api_url}/ready")[0] != 200:
+            if time.monotonic() > deadline or api.poll() is not None:
+                raise RuntimeError(f"API не запустился, см. {log_path}")
+            time.sleep(0.2)
+
+        template = generated_payload(video_path, audio_path, with_audio=False)
+        payload = prepare_payload(template, 0, media_url, media_dir, video_path, audio_path)
+        status, body = request(f"{api_url}/zoom/webhook", payload)
+        if body.get("status") != "accepted":
+            raise RuntimeError(f"Webhook не принят ({status}): {body}")
+
+        deadline = time.monotonic() + args.timeout
+        while not transcribing(api_url, payload["payload"]["object"]["uuid"]):
+            _, stats = request(f"{api_url}/jobs/status")
+            if stats.get("done", 0) + stats.get("failed", 0):
+                raise RuntimeError(f"Задача завершилась ({stats}) до начала нагрузки: увеличьте --duration")
+            if time.monotonic() > deadline:
+                raise TimeoutError(f"Задача не дошла до транскрибации за {args.timeout} с")
+            time.sleep(0.1)
+
+        started = time.perf_counter()
+        latencies, statuses = asyncio.run(load(args, api_url, payload))
+        transcribe_seconds = time.perf_counter() - started
+    finally:
+        api.send_signal(signal.SIGTERM)
+        api.wait(timeout=30)
+
+    if not latencies:
+        raise RuntimeError("Ни один запрос не завершился во время транскрибации")
+    return {
+        "requests": len(latencies),
+        "statuses": statuses,
+        "transcribe_seconds": round(transcribe_seconds, 2),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2),
+        "target_ms": args.target_ms,
+        "work_dir": work_dir,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=int, default=300, help="Длина записи в секундах")
+    parser.add_argument("--stub-rtf", type=float, default=0.3,
+                        help="Секунд CPU заглушки распознавания на секунду аудио (STUB_REAL_TIME_FACTOR)")
+    parser.add_argument("--whisper-processes", type=int, default=1)
+    parser.add_argument("--diarization", default="none", help="Движок диаризации (none, spectral, resemblyzer)")
+    parser.add_argument("--concurrency", type=int, default=4, help="Параллельных клиентов webhook")
+    parser.add_argument("--interval-ms", type=float, default=20, help="Пауза клиента между запросами, мс")
+    parser.add_argument("--unique", action="store_true", help="Новая встреча в каждом запросе вместо повторов")
+    parser.add_argument("--target-ms", type=float, default=50, help="Допустимый p99 webhook, мс")
+    parser.add_argument("--timeout", type=float, default=300, help="Сколько ждать начала транскрибации, с")
+    parser.add_argument("--work-dir", help="Каталог для медиа, очереди и лога API (по умолчанию временный)")
+    parser.add_argument("--json", help="Сохранить результат в JSON-файл")
+    args = parser.parse_args()
+
+    result = run(args)
+    print(
+        f"Во время транскрибации ({result['transcribe_seconds']} с): {result['requests']} webhook, "
+        f"статусы {result['statuses']}"
+    )
+    print(
+        f"p50 {result['p50_ms']} мс, p99 {result['p99_ms']} мс, максимум {result['max_ms']} мс "
+        f"(цель p99 ≤ {result['target_ms']} мс)"
+    )
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+    sys.exit(0 if result["p99_ms"] <= args.target_ms else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,183 @@
+"""
+Нагрузочный тест POST /zoom/webhook.
+
+Запуск против локального сервиса (не против продакшена):
+    uvicorn main:app --port 8000
+    python -m bench.webhook_load --url http://127.0.0.1:8000/zoom/webhook \
+        --secret "$ZOOM_WEBHOOK_SECRET_TOKEN" --requests 2000 --concurrency 50
+
+По умолчанию все запросы несут одну и ту же встречу: первый ставит задачу в очередь,
+остальные проходят путь проверки подписи, разбора и дедупликации — как повторы от Zoom.
+С --unique каждая встреча новая (download_url указывает на несуществующий файл,
+поэтому задачи упадут на скачивании). Выводит запросы в секунду и задержки p50/p99.
+
+С --contend-db тест повторяется в условиях, когда очередь делят несколько процессов:
+отдельный поток периодически держит блокировку записи в базе очереди, как воркер
+python -m worker. Параллельно GET / каждые 20 мс проверяет, что ожидание блокировки
+не останавливает event loop — задержка остальных запросов не должна расти вместе с webhook:
+    python -m bench.webhook_load --unique --contend-db jobs.db --lock-ms 300 --lock-interval-ms 1000
+"""
+import time
+import hmac
+import json
+import uuid
+import asyncio
+import hashlib
+import sqlite3
+import argparse
+import threading
+import statistics
+from urllib.parse import urlsplit
+import httpx
+
+
+def make_body(meeting_uuid: str) -> bytes:
+    return json.dumps({
+        "event": "recording.completed",
+        "download_token": "bench",
+        "payload": {
+            "object": {
+                "uuid": meeting_uuid,
+                "topic": "Нагрузочный тест",
+                "recording_files": [
+                    {
+                        "id": meeting_uuid,
+                        "file_type": "MP4",
+                        "file_extension": "MP4",
+                        "file_size": 1,
+                        "download_url": "http://127.0.0.1:9/bench.mp4",
+                    }
+                ],
+            }
+        },
+    }).encode()
+
+
+def sign(secret: str, body: bytes) -> dict:
+    timestamp = str(int(time.time()))
+    if not secret:
+        return {"x-zm-request-timestamp": timestamp}
+    digest = hmac.new(secret.encode(), b"v0:" + timestamp.encode() + b":" + body, hashlib.sha256).hexdigest()
+    return {"x-zm-request-timestamp": timestamp, "x-zm-signature": f"v0={digest}"}
+
+
+def percentile(values: list[float], q: float) -> float:
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * q))]
+
+
+class WriteLockHolder(threading.Thread):
+    """Держит блокировку записи в SQLite lock_ms из каждых interval_ms, как конкурирующий воркер"""
+
+    def __init__(self, db_path: str, lock_ms: float, interval_ms: float):
+        super().__init__(daemon=True)
+        self.db_path = db_path
+        self.lock_seconds = lock_ms / 1000
+        self.interval_seconds = interval_ms / 1000
+        self.locks = 0
+        self._stopped = threading.Event()
+
+    def run(self):
+        conn = sqlite3.connect(self.db_path, isolation_level=None, timeout=30)
+        while not self._stopped.is_set():
+            conn.execute("BEGIN IMMEDIATE")
+            time.sleep(self.lock_seconds)
+            conn.execute("COMMIT")
+            self.locks += 1
+            self._stopped.wait(max(0.0, self.interval_seconds - self.lock_seconds))
+        conn.close()
+
+    def stop(self):
+        self._stopped.set()
+        self.join()
+
+
+async def probe(client: httpx.AsyncClient, url: str, latencies: list[float], done: asyncio.Event):
+    """Лёгкий запрос каждые 20 мс: его задержка показывает, не заблокирован ли event loop"""
+    while not done.is_set():
+        started = time.perf_counter()
+        try:
+            await client.get(url)
+        except httpx.HTTPError:
+            pass
+        latencies.append(time.perf_counter() - started)
+        await asyncio.sleep(0.02)
+
+
+async def run(args) -> dict:
+    latencies = []
+    statuses = {}
+    shared_uuid = f"bench-{uuid.uuid4()}"
+    counter = iter(range(args.requests))
+
+    async def worker(client: httpx.AsyncClient):
+        for _ in counter:
+            body = make_body(f"bench-{uuid.uuid4()}" if args.unique else shared_uuid)
+            headers = {"content-type": "application/json", **sign(args.secret, body)}
+            started = time.perf_counter()
+            try:
+                response = await client.post(args.url, content=body, headers=headers)
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            latencies.append(time.perf_counter() - started)
+            statuses[status] = statuses.get(status, 0) + 1
+
+    contender = None
+    if args.contend_db:
+        contender = WriteLockHolder(args.contend_db, args.lock_ms, args.lock_interval_ms)
+        contender.start()
+    probe_latencies = []
+    probe_done = asyncio.Event()
+    parts = urlsplit(args.url)
+    probe_url = args.probe_url or f"{parts.scheme}://{parts.netloc}/"
+
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client, httpx.AsyncClient(timeout=30) as probe_client:
+        probe_task = asyncio.create_task(probe(probe_client, probe_url, probe_latencies, probe_done))
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(args.concurrency)))
+        elapsed = time.perf_counter() - started
+        probe_done.set()
+        await probe_task
+    if contender:
+        contender.stop()
+
+    return {
+        "requests": len(latencies),
+        "statuses": statuses,
+        "rps": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "max_ms": round(max(latencies) * 1000, 2),
+        "probe_p99_ms": round(percentile(probe_latencies, 0.99) * 1000, 2) if probe_latencies else None,
+        "probe_max_ms": round(max(probe_latencies) * 1000, 2) if probe_latencies else None,
+        "write_locks": contender.locks if contender else 0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--url", default="http://127.0.0.1:8000/zoom/webhook")
+    parser.add_argument("--secret", default="", help="ZOOM_WEBHOOK_SECRET_TOKEN сервиса")
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--unique", action="store_true", help="Новая встреча в каждом запросе")
+    parser.add_argument("--contend-db", help="База очереди сервиса (JOBS_DB_PATH), в которой держать блокировку записи")
+    parser.add_argument("--lock-ms", type=float, default=300, help="Сколько держать блокировку записи, мс")
+    parser.add_argument("--lock-interval-ms", type=float, default=1000, help="Период захвата блокировки, мс")
+    parser.add_argument("--probe-url", help="Лёгкий эндпоинт для проверки event loop (по умолчанию / сервиса)")
+    args = parser.parse_args()
+
+    result = asyncio.run(run(args))
+    print(
+        f"{result['requests']} запросов, статусы {result['statuses']}: {result['rps']} запросов/с, "
+        f"p50 {result['p50_ms']} мс, p99 {result['p99_ms']} мс, максимум {result['max_ms']} мс"
+    )
+    print(f"GET / во время теста: p99 {result['probe_p99_ms']} мс, максимум {result['probe_max_ms']} мс")
+    if args.contend_db:
+        print(f"Блокировок записи конкурирующим процессом: {result['write_locks']}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,119 @@
+import os
+import json
+import shutil
+import hashlib
+import threading
+
+CACHE_DIR = os.getenv("CACHE_DIR", "cache")
+CACHE_MAX_BYTES = int(os.getenv("CACHE_MAX_MB", "500")) * 1024 * 1024
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+class DiskCache:
+    """
+    Кэш текстов на диске с ключом по содержимому.
+    Время последнего обращения хранится в mtime файла; при превышении лимита
+    размера удаляются давно неиспользуемые записи (LRU).
+    """
+
+    def __init__(self, directory: str = CACHE_DIR, max_bytes: int = CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def make_key(*parts) -> str:
+        """Ключ из произвольных JSON-сериализуемых частей (id файла, размер, конфигурация модели...)"""
+        raw = json.dumps(parts, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.txt")
+
+    def get(self, key: str) -> str | None:
+        path = self._path(key)
+        try:
+            with open(path, encoding="utf-8") as f:
+                value = f.read()
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return value
+
+    def contains(self, key: str) -> bool:
+        return os.path.exists(self._path(key))
+
+    def get_file(self, key: str, save_path: str) -> bool:
+        """Копирует запись кэша в файл, не загружая её в память; False — записи нет"""
+        path = self._path(key)
+        try:
+            with open(path, "rb") as src, open(save_path, "wb") as dst:
+                shutil.copyfileobj(src, dst)
+        except FileNotFoundError:
+            return False
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return True
+
+    def set_file(self, key: str, source_path: str):
+        """Кладёт в кэш содержимое файла, не загружая его в память"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        shutil.copyfile(source_path, tmp_path)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def set(self, key: str, value: str):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(value)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """Удаляет самые давно использованные записи, пока кэш не уложится в лимит"""
+        with self._lock:
+            entries = []
+            total = 0
+            for root, _, files in os.walk(self.directory):
+                for name in files:
+                    if not name.endswith(".txt"):
+                        continue
+                    path = os.path.join(root, name)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+                    total += stat.st_size
+            if total <= self.max_bytes:
+                return
+            entries.sort()
+            for _, size, path in entries:
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
+                total -= size
+
+
+def get_cache() -> DiskCache:
+    """Общий кэш транскриптов и саммари"""
+    global _cache
+    with _cache_lock:
+        if _cache is None:
+            _cache = DiskCache()
+        return _cache
@@ -0,0 +1,162 @@
+import os
+import time
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+# Где хранить отметки об обработанных встречах: memory, sqlite или redis.
+# sqlite и redis переживают перезапуск и общие для всех воркеров uvicorn
+DEDUP_BACKEND = os.getenv("DEDUP_BACKEND", "sqlite")
+DEDUP_DB_PATH = os.getenv("DEDUP_DB_PATH", "dedup.db")
+REDIS_URL = os.getenv("REDIS_URL", "redis://localhost:6379/0")
+# Сколько помнить встречу: Zoom повторяет webhook в течение нескольких часов
+DEDUP_TTL_SECONDS = int(os.getenv("DEDUP_TTL_SECONDS", str(7 * 24 * 3600)))
+DEDUP_KEY_PREFIX = "zoom:meeting:"
+# Как часто (в захватах) чистить просроченные записи в SQLite
+SQLITE_PURGE_EVERY = 100
+
+_store = None
+_store_lock = threading.Lock()
+
+
+class IdempotencyStore(ABC):
+    """
+    Хранилище отметок идемпотентности с TTL.
+    claim атомарно занимает ключ и возвращает False, если ключ уже занят и не истёк;
+    release освобождает ключ, чтобы повтор webhook снова мог его занять.
+    """
+
+    @abstractmethod
+    def claim(self, key: str, ttl: int = DEDUP_TTL_SECONDS) -> bool:
+        ...
+
+    @abstractmethod
+    def release(self, key: str):
+        ...
+
+
+class MemoryIdempotencyStore(IdempotencyStore):
+    """Хранилище в памяти процесса: не переживает перезапуск и не общее между воркерами"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Ключи в порядке захвата; при одинаковом TTL это и порядок истечения
+        self._expires = OrderedDict()
+
+    def _purge(self, now: float):
+        while self._expires:
+            key, expires_at = next(iter(self._expires.items()))
+            if expires_at > now:
+                break
+            self._expires.popitem(last=False)
+
+    def claim(self, key: str, ttl: int = DEDUP_TTL_SECONDS) -> bool:
+        now = time.time()
+        with self._lock:
+            self._purge(now)
+            expires_at = self._expires.get(key)
+            if expires_at is not None and expires_at > now:
+                return False
+            self._expires[key] = now + ttl
+            self._expires.move_to_end(key)
+            return True
+
+    def release(self, key: str):
+        with self._lock:
+            self._expires.pop(key, None)
+
+
+class SQLiteIdempotencyStore(IdempotencyStore):
+    """Хранилище в SQLite: общее для процессов на одной машине, захват атомарен за счёт блокировки БД"""
+
+    def __init__(self, db_path: str = DEDUP_DB_PATH):
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        # В режиме WAL этого достаточно для целостности, а захват не ждёт fsync на каждый webhook
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS claims (
+                key TEXT PRIMARY KEY,
+                expires_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS claims_expires ON claims (expires_at);
+            """
+        )
+        self._claims = 0
+
+    def claim(self, key: str, ttl: int = DEDUP_TTL_SECONDS) -> bool:
+        now = time.time()
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                self._conn.execute("DELETE FROM claims WHERE key = ? AND expires_at <= ?", (key, now))
+                cur = self._conn.execute(
+                    "INSERT OR IGNORE INTO claims (key, expires_at) VALUES (?, ?)", (key, now + ttl)
+                )
+                self._claims += 1
+                if self._claims % SQLITE_PURGE_EVERY == 0:
+                    self._conn.execute("DELETE FROM claims WHERE expires_at <= ?", (now,))
+                self._conn.execute("COMMIT")
+            except Exception:
+                self._conn.execute("ROLLBACK")
+                raise
+            return cur.rowcount > 0
+
+    def release(self, key: str):
+        with self._lock:
+            self._conn.execute("DELETE FROM claims WHERE key = ?", (key,))
+
+
+class RedisIdempotencyStore(IdempotencyStore):
+    """
+    Хранилище в Redis: общее для нескольких машин. Подходит любой клиент
+    с интерфейсом redis-py (set с nx/ex и delete), в том числе локальные заменители.
+    """
+
+    def __init__(self, client=None, url: str = REDIS_URL):
+        if client is None:
+            import redis
+
+            client = redis.Redis.from_url(url)
+        self._client = client
+
+    def claim(self, key: str, ttl: int = DEDUP_TTL_SECONDS) -> bool:
+        return bool(self._client.set(key, "1", nx=True, ex=ttl))
+
+    def release(self, key: str):
+        self._client.delete(key)
+
+
+STORES = {
+    "memory": MemoryIdempotencyStore,
+    "sqlite": SQLiteIdempotencyStore,
+    "redis": RedisIdempotencyStore,
+}
+
+
+def get_idempotency_store() -> IdempotencyStore:
+    """Общее хранилище отметок идемпотентности, выбранное DEDUP_BACKEND"""
+    global _store
+    with _store_lock:
+        if _store is None:
+            if DEDUP_BACKEND not in STORES:
+                raise ValueError(f"Неизвестное хранилище дедупликации: {DEDUP_BACKEND}. Доступны: {', '.join(STORES)}")
+            _store = STORES[DEDUP_BACKEND]()
+        return _store
+
+
+def claim_meeting(meeting_uuid: str) -> bool:
+    """Занимает встречу для обработки; False — встреча уже принята другим запросом или воркером"""
+    if not meeting_uuid:
+        return True
+    return get_idempotency_store().claim(DEDUP_KEY_PREFIX + meeting_uuid)
+
+
+def release_meeting(meeting_uuid: str):
+    """Освобождает встречу, чтобы повтор webhook от Zoom обработал её снова"""
+    if not meeting_uuid:
+        return
+    get_idempotency_store().release(DEDUP_KEY_PREFIX + meeting_uuid)
@@ -0,0 +1,139 @@
+import os
+import logging
+import subprocess
+from telegram_logic import send_file_to_telegram, TELEGRAM_MAX_UPLOAD_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Запас под контейнер и неточность битрейта, чтобы результат гарантированно влез в лимит
+SIZE_SAFETY_FACTOR = 0.9
+AUDIO_BITRATE_KBPS = 64
+# Ниже этого битрейта видео становится неразборчивым — тогда режем запись на части
+MIN_VIDEO_BITRATE_KBPS = int(os.getenv("MIN_VIDEO_BITRATE_KBPS", "200"))
+
+VIDEO_EXTENSIONS = [".mp4", ".mov", ".avi", ".mkv"]
+AUDIO_EXTENSIONS = [".mp3", ".m4a", ".wav", ".ogg"]
+
+
+def _run_ffmpeg(args: list[str]):
+    result = subprocess.run(
+        ["ffmpeg", "-nostdin", "-loglevel", "error", "-y", *args],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    if result.returncode != 0:
+        error = result.stderr.decode("utf-8", errors="ignore").strip()
+        raise RuntimeError(f"ffmpeg завершился с кодом {result.returncode}: {error}")
+
+
+def probe_duration(file_path: str) -> float:
+    """Длительность медиафайла в секундах по данным ffprobe"""
+    result = subprocess.run(
+        ["ffprobe", "-v", "error", "-show_entries", "format=duration", "-of", "csv=p=0", file_path],
+        stdin=subprocess.DEVNULL,
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        raise RuntimeError(f"ffprobe не смог прочитать {file_path}: {result.stderr.strip()}")
+    return float(result.stdout.strip())
+
+
+def compress_video(file_path: str, max_bytes: int) -> str | None:
+    """
+    Перекодирует видео в битрейт, при котором файл укладывается в max_bytes.
+    Возвращает None, если для этого пришлось бы опуститься ниже MIN_VIDEO_BITRATE_KBPS.
+    """
+    duration = probe_duration(file_path)
+    total_kbps = max_bytes * 8 * SIZE_SAFETY_FACTOR / duration / 1000
+    video_kbps = int(total_kbps - AUDIO_BITRATE_KBPS)
+    if video_kbps < MIN_VIDEO_BITRATE_KBPS:
+        return None
+
+    base, _ = os.path.splitext(file_path)
+    output_path = f"{base}_compressed.mp4"
+    logger.info(f"Сжимаю {os.path.basename(file_path)} до {video_kbps} кбит/с")
+    _run_ffmpeg([
+        "-i", file_path,
+        "-c:v", "libx264", "-preset", "veryfast",
+        "-b:v", f"{video_kbps}k", "-maxrate", f"{video_kbps}k", "-bufsize", f"{video_kbps * 2}k",
+        "-c:a", "aac", "-b:a", f"{AUDIO_BITRATE_KBPS}k",
+        "-movflags", "+faststart",
+        output_path,
+    ])
+    if os.path.getsize(output_path) > max_bytes:
+        os.remove(output_path)
+        return None
+    return output_path
+
+
+def split_media(file_path: str, max_bytes: int) -> list[str]:
+    """Режет запись без перекодирования на последовательные части не больше max_bytes"""
+    duration = probe_duration(file_path)
+    parts_count = os.path.getsize(file_path) / (max_bytes * SIZE_SAFETY_FACTOR)
+    segment_seconds = max(1, int(duration / parts_count))
+
+    base, extension = os.path.splitext(file_path)
+    pattern = f"{base}_part%03d{extension}"
+    logger.info(f"Режу {os.path.basename(file_path)} на части по {segment_seconds} с")
+    _run_ffmpeg([
+        "-i", file_path,
+        "-map", "0", "-c", "copy",
+        "-f", "segment", "-segment_time", str(segment_seconds), "-reset_timestamps", "1",
+        pattern,
+    ])
+
+    directory = os.path.dirname(file_path) or "."
+    prefix = os.path.basename(f"{base}_part")
+    parts = sorted(
+        os.path.join(directory, name)
+        for name in os.listdir(directory)
+        if name.startswith(prefix) and name.endswith(extension)
+    )
+    too_large = [part for part in parts if os.path.getsize(part) > max_bytes]
+    if too_large:
+        # Части режутся по ключевым кадрам; если ключевых кадров мало, часть может не влезть
+        for part in parts:
+            os.remove(part)
+        raise RuntimeError(f"Не удалось нарезать {os.path.basename(file_path)} на части до {max_bytes} байт")
+    return parts
+
+
+def deliver_file(file_path: str, caption: str | None = None, sent: list[int] | None = None) -> list[dict]:
+    """
+    Отправляет файл в Telegram с учётом лимита загрузки.
+    Если файл не влезает (публичный Bot API без Local Bot API server), видео сжимается
+    до целевого битрейта, а если это невозможно — запись режется на части.
+    sent — номера уже отправленных частей: они пропускаются, а номер каждой отправленной
+    части дописывается в список, чтобы повтор после сбоя продолжил с неотправленной.
+    """
+    if os.path.getsize(file_path) <= TELEGRAM_MAX_UPLOAD_SIZE:
+        return [send_file_to_telegram(file_path, caption=caption)]
+
+    extension = os.path.splitext(file_path)[1].lower()
+    if extension not in VIDEO_EXTENSIONS + AUDIO_EXTENSIONS:
+        raise RuntimeError(f"Файл {os.path.basename(file_path)} больше лимита Telegram и не является медиафайлом")
+
+    if extension in VIDEO_EXTENSIONS:
+        compressed_path = compress_video(file_path, TELEGRAM_MAX_UPLOAD_SIZE)
+        if compressed_path:
+            try:
+                return [send_file_to_telegram(compressed_path, caption=caption)]
+            finally:
+                os.remove(compressed_path)
+
+    parts = split_media(file_path, TELEGRAM_MAX_UPLOAD_SIZE)
+    results = []
+    try:
+        for i, part in enumerate(parts, 1):
+            if sent is not None and i in sent:
+                continue
+            part_caption = f"{caption} (часть {i}/{len(parts)})" if caption else f"Часть {i}/{len(parts)}"
+            results.append(send_file_to_telegram(part, caption=part_caption))
+            if sent is not None:
+                sent.append(i)
+    finally:
+        for part in parts:
+            os.remove(part)
+    return results
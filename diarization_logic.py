@@ -0,0 +1,274 @@
+import os
+import queue
+import logging
+import threading
+import numpy as np
+from abc import ABC, abstractmethod
+from metrics_logic import span
+from zoom_logic import SAMPLE_RATE, STREAM_BUFFER_WINDOWS, VAD_FRAME_SECONDS, VAD_SILENCE_RMS
+
+logger = logging.getLogger(__name__)
+
+# Разметка спикеров: none — выключена, spectral — встроенные спектральные признаки (только numpy),
+# resemblyzer — эмбеддинги голоса нейросетью на CPU (pip install resemblyzer), заметно точнее
+DIARIZATION_BACKEND = os.getenv("DIARIZATION_BACKEND", "none")
+# Окно, для которого считается эмбеддинг голоса; короче — точнее границы реплик, но шумнее признаки
+DIARIZATION_WINDOW_SECONDS = float(os.getenv("DIARIZATION_WINDOW_SECONDS", "1.5"))
+# Порог косинусной близости окна к голосу спикера; 0 — порог по умолчанию для движка
+DIARIZATION_THRESHOLD = float(os.getenv("DIARIZATION_THRESHOLD", "0"))
+DIARIZATION_MAX_SPEAKERS = int(os.getenv("DIARIZATION_MAX_SPEAKERS", "8"))
+# Спикер, которому досталось меньше этой доли окон, считается шумом и растворяется в ближайшем
+DIARIZATION_MIN_SPEAKER_SHARE = 0.03
+DIARIZATION_REFINE_ITERATIONS = 3
+# Окно, где речь занимает меньше этой доли кадров, не размечается
+MIN_VOICED_SHARE = 0.3
+
+_embedder = None
+_embedder_lock = threading.Lock()
+
+
+class SpeakerEmbedder(ABC):
+    """Движок эмбеддингов голоса: вектор для окна 16 кГц моно float32 или None, если в окне нет речи"""
+
+    name = ""
+    default_threshold = 0.0
+
+    def load(self):
+        pass
+
+    @abstractmethod
+    def embed(self, samples: np.ndarray) -> np.ndarray | None:
+        ...
+
+    def normalize(self, embeddings: np.ndarray) -> np.ndarray:
+        """Подготовка всех эмбеддингов встречи к кластеризации"""
+        return embeddings
+
+
+class SpectralEmbedder(SpeakerEmbedder):
+    """
+    Встроенный движок без зависимостей: среднее и разброс MFCC по окну.
+    Различает голоса по тембру; для совещаний с похожими голосами лучше resemblyzer
+    """
+
+    name = "spectral"
+    default_threshold = 0.3
+
+    FRAME = 400
+    HOP = 160
+    FFT = 512
+    MEL_BANDS = 40
+    CEPSTRA = 20
+
+    def load(self):
+        self._window = np.hamming(self.FRAME).astype(np.float32)
+        self._mel = self._mel_filters()
+        # DCT-II без нулевого коэффициента: признаки не зависят от громкости
+        n = np.arange(self.MEL_BANDS)
+        self._dct = np.cos(np.pi / self.MEL_BANDS * (n[None, :] + 0.5) * np.arange(1, self.CEPSTRA + 1)[:, None])
+
+    def _mel_filters(self) -> np.ndarray:
+        def to_mel(hz):
+            return 2595 * np.log10(1 + hz / 700)
+
+        def to_hz(mel):
+            return 700 * (10 ** (mel / 2595) - 1)
+
+        points = to_hz(np.linspace(to_mel(64), to_mel(7600), self.MEL_BANDS + 2))
+        bins = np.floor((self.FFT + 1) * points / SAMPLE_RATE).astype(int)
+        filters = np.zeros((self.MEL_BANDS, self.FFT // 2 + 1), dtype=np.float32)
+        for i in range(self.MEL_BANDS):
+            left, center, right = bins[i], bins[i + 1], bins[i + 2]
+            if center > left:
+                filters[i, left:center] = (np.arange(left, center) - left) / (center - left)
+            if right > center:
+                filters[i, center:right] = (right - np.arange(center, right)) / (right - center)
+        return filters
+
+    def embed(self, samples: np.ndarray) -> np.ndarray | None:
+        count = 1 + (len(samples) - self.FRAME) // self.HOP
+        if count <= 0:
+            return None
+        frames = np.lib.stride_tricks.sliding_window_view(samples, self.FRAME)[::self.HOP][:count]
+        voiced = np.sqrt((frames ** 2).mean(axis=1)) >= VAD_SILENCE_RMS
+        if voiced.mean() < MIN_VOICED_SHARE:
+            return None
+        spectrum = np.abs(np.fft.rfft(frames[voiced] * self._window, self.FFT)) ** 2
+        cepstra = np.log(spectrum @ self._mel.T + 1e-10) @ self._dct.T
+        return np.concatenate([cepstra.mean(axis=0), cepstra.std(axis=0)])
+
+    def normalize(self, embeddings: np.ndarray) -> np.ndarray:
+        # Без стандартизации косинусную близость определяет общая для всех голосов форма спектра
+        return (embeddings - embeddings.mean(axis=0)) / (embeddings.std(axis=0) + 1e-6)
+
+
+class ResemblyzerEmbedder(SpeakerEmbedder):
+    """Эмбеддинги голоса GE2E-моделью resemblyzer на CPU"""
+
+    name = "resemblyzer"
+    default_threshold = 0.75
+
+    def load(self):
+        from resemblyzer import VoiceEncoder
+
+        self._encoder = VoiceEncoder("cpu", verbose=False)
+
+    def embed(self, samples: np.ndarray) -> np.ndarray | None:
+        frame = int(SAMPLE_RATE * VAD_FRAME_SECONDS)
+        count = len(samples) // frame
+        rms = np.sqrt((samples[: count * frame].reshape(count, frame) ** 2).mean(axis=1))
+        if count == 0 or (rms >= VAD_SILENCE_RMS).mean() < MIN_VOICED_SHARE:
+            return None
+        return self._encoder.embed_utterance(samples)
+
+
+EMBEDDERS = {embedder.name: embedder for embedder in (SpectralEmbedder, ResemblyzerEmbedder)}
+
+
+def get_speaker_embedder() -> SpeakerEmbedder:
+    """Ленивая загрузка движка эмбеддингов, выбранного через DIARIZATION_BACKEND"""
+    global _embedder
+    with _embedder_lock:
+        if _embedder is None:
+            if DIARIZATION_BACKEND not in EMBEDDERS:
+                raise ValueError(
+                    f"Неизвестный движок диаризации: {DIARIZATION_BACKEND}. Доступны: none, {', '.join(EMBEDDERS)}"
+                )
+            embedder = EMBEDDERS[DIARIZATION_BACKEND]()
+            embedder.load()
+            _embedder = embedder
+        return _embedder
+
+
+def diarization_config() -> dict:
+    """Параметры, от которых зависит разметка спикеров (входят в ключ кэша транскрипта)"""
+    if DIARIZATION_BACKEND == "none":
+        return {"diarization": "none"}
+    return {
+        "diarization": DIARIZATION_BACKEND,
+        "window_seconds": DIARIZATION_WINDOW_SECONDS,
+        "threshold": DIARIZATION_THRESHOLD,
+        "max_speakers": DIARIZATION_MAX_SPEAKERS,
+    }
+
+
+def cluster_embeddings(embeddings: np.ndarray, threshold: float,
+                       max_speakers: int = DIARIZATION_MAX_SPEAKERS) -> np.ndarray:
+    """
+    Разбивает окна на спикеров: окно присоединяется к ближайшему голосу, если близость выше порога,
+    иначе открывает новый; затем окна несколько раз переназначаются к уточнённым центрам,
+    а слишком редкие «спикеры» растворяются в ближайших. Номера спикеров — в порядке первой реплики
+    """
+    vectors = embeddings / (np.linalg.norm(embeddings, axis=1, keepdims=True) + 1e-9)
+    labels = np.empty(len(vectors), dtype=int)
+    sums = []
+    for i, vector in enumerate(vectors):
+        if sums:
+            centroids = np.array(sums)
+            similarity = centroids @ vector / (np.linalg.norm(centroids, axis=1) + 1e-9)
+            best = int(np.argmax(similarity))
+            if similarity[best] >= threshold or len(sums) >= max_speakers:
+                labels[i] = best
+                sums[best] += vector
+                continue
+        labels[i] = len(sums)
+        sums.append(vector.copy())
+
+    def reassign(allowed: np.ndarray) -> np.ndarray:
+        centroids = np.array([vectors[labels == label].mean(axis=0) for label in allowed])
+        centroids /= np.linalg.norm(centroids, axis=1, keepdims=True) + 1e-9
+        return allowed[np.argmax(vectors @ centroids.T, axis=1)]
+
+    for _ in range(DIARIZATION_REFINE_ITERATIONS):
+        labels = reassign(np.unique(labels))
+    present, counts = np.unique(labels, return_counts=True)
+    frequent = present[counts >= max(2, DIARIZATION_MIN_SPEAKER_SHARE * len(labels))]
+    if 0 < len(frequent) < len(present):
+        labels = reassign(frequent)
+
+    order = {}
+    for label in labels:
+        order.setdefault(label, len(order))
+    return np.array([order[label] for label in labels], dtype=int)
+
+
+class Diarizer:
+    """
+    Разметка спикеров, идущая параллельно с распознаванием: фрагменты аудио, уходящие в Whisper,
+    параллельно нарезаются на окна и превращаются в эмбеддинги голоса в отдельном потоке.
+    Кластеризация выполняется в finish(), когда известны все окна встречи
+    """
+
+    def __init__(self, embedder: SpeakerEmbedder | None = None):
+        self._embedder = embedder or get_speaker_embedder()
+        # Очередь ограничена, как и у распознавания: отставшая диаризация притормаживает чтение аудио
+        self._chunks = queue.Queue(maxsize=STREAM_BUFFER_WINDOWS)
+        self._windows = []
+        self._embeddings = []
+        self._error = None
+        self._stopped = False
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def feed(self, offset: float, pcm: bytes):
+        """Фрагмент 16 кГц моно PCM s16le, начинающийся на offset секунд от начала записи"""
+        self._chunks.put((offset, pcm))
+
+    def _run(self):
+        while True:
+            item = self._chunks.get()
+            if item is None:
+                break
+            if self._error is not None:
+                continue
+            try:
+                self._embed_chunk(*item)
+            except Exception as e:
+                self._error = e
+
+    def _embed_chunk(self, offset: float, pcm: bytes):
+        samples = np.frombuffer(pcm, np.int16).astype(np.float32) / 32768.0
+        window = int(DIARIZATION_WINDOW_SECONDS * SAMPLE_RATE)
+        for start in range(0, len(samples), window):
+            piece = samples[start:start + window]
+            if len(piece) < window // 2:
+                break
+            embedding = self._embedder.embed(piece)
+            if embedding is not None:
+                self._windows.append((offset + start / SAMPLE_RATE, offset + (start + len(piece)) / SAMPLE_RATE))
+                self._embeddings.append(embedding)
+
+    def close(self):
+        """Останавливает поток эмбеддингов (в том числе при ошибке распознавания)"""
+        if not self._stopped:
+            self._stopped = True
+            self._chunks.put(None)
+        self._thread.join()
+
+    def finish(self) -> list[tuple[float, float, int]]:
+        """Реплики (начало, конец, номер спикера) по порядку времени"""
+        self.close()
+        if self._error is not None:
+            raise self._error
+        if not self._embeddings:
+            return []
+        threshold = DIARIZATION_THRESHOLD or self._embedder.default_threshold
+        with span("diarize", backend=self._embedder.name, windows=len(self._windows)):
+            labels = cluster_embeddings(self._embedder.normalize(np.array(self._embeddings)), threshold)
+
+        turns = []
+        for (start, end), speaker in zip(self._windows, labels.tolist()):
+            # Соседние окна одного спикера склеиваются в реплику
+            if turns and turns[-1][2] == speaker and start - turns[-1][1] < DIARIZATION_WINDOW_SECONDS:
+                turns[-1] = (turns[-1][0], end, speaker)
+            else:
+                turns.append((start, end, speaker))
+        logger.info(f"Диаризация: спикеров {int(labels.max()) + 1}, окон {len(labels)}, реплик {len(turns)}")
+        return turns
+
+
+def create_diarizer() -> Diarizer | None:
+    """Диаризатор для одной встречи; None, если разметка спикеров выключена"""
+    if DIARIZATION_BACKEND == "none":
+        return None
+    return Diarizer()
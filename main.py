@@ -1,51 +1,103 @@
 import os
+import json
+import time
+import random
 import asyncio
-import tempfile
 import logging
 import hmac
 import hashlib
-from collections import deque
-from fastapi import FastAPI, Request
-from telegram_logic import send_message_to_telegram, send_file_to_telegram
-from zoom_logic import download_zoom_file, transcribe_audio
-from text_logic import convert_to_plans_and_tasks
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, BackgroundTasks, HTTPException
+from fastapi.responses import JSONResponse, PlainTextResponse
+from telegram_logic import metrics as telegram_metrics
+from zoom_logic import (
+    shutdown_transcription_pool,
+    warm_up_transcription_pool,
+    download_metrics,
+    model_readiness,
+    PRELOAD_MODEL,
+)
+from queue_logic import JobQueue, STAGES
+from metrics_logic import register_collector, render_metrics, read_trace
+from dedup_logic import claim_meeting, release_meeting
+from pipeline_logic import (
+    WorkerPool,
+    notify_tenant,
+    missing_stage_inputs,
+    rerun_start_stage,
+    DELIVERY_MARKERS,
+    DOWNLOAD_WORKERS,
+    TRANSCRIBE_WORKERS,
+    MAX_TRANSCRIBE_BACKLOG,
+)
+from tenant_logic import get_tenants
+from text_logic import check_summary_config
 
 # Настройка логирования
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 ZOOM_WEBHOOK_SECRET_TOKEN = os.getenv("ZOOM_WEBHOOK_SECRET_TOKEN", "")
-# Храним последние обработанные встречи, чтобы избежать повторной обработки
-PROCESSED_MEETINGS = set()
-PROCESSED_QUEUE = deque(maxlen=200)
+# Насколько старый x-zm-request-timestamp ещё принимаем
+WEBHOOK_MAX_AGE_SECONDS = int(os.getenv("WEBHOOK_MAX_AGE_SECONDS", "300"))
+# Доля webhook, тело которых пишется в лог целиком (при уровне DEBUG — все)
+WEBHOOK_LOG_SAMPLE_RATE = float(os.getenv("WEBHOOK_LOG_SAMPLE_RATE", "0"))
+# Максимум незавершённых задач в очереди; сверх него webhook отвечает 503 и Zoom повторит позже
+MAX_QUEUED_JOBS = int(os.getenv("MAX_QUEUED_JOBS", "20"))
+# Токен для /admin-эндпоинтов (заголовок X-Admin-Token); без него эндпоинты отключены
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+# Запускать воркеры конвейера внутри API. 0 — инстанс только принимает webhook и ставит задачи
+# в общую очередь, а обрабатывают их отдельные процессы python -m worker
+RUN_EMBEDDED_WORKERS = os.getenv("RUN_EMBEDDED_WORKERS", "1") == "1"
+# Файлы записи Zoom, в которых нет аудио: их не скачиваем и не транскрибируем
+NON_MEDIA_FILE_TYPES = ["timeline", "transcript", "chat", "cc", "csv", "summary"]
 
 
-def mark_meeting_processed(meeting_uuid: str):
-    if not meeting_uuid:
-        return
-    if meeting_uuid not in PROCESSED_MEETINGS:
-        PROCESSED_MEETINGS.add(meeting_uuid)
-        PROCESSED_QUEUE.append(meeting_uuid)
-        # Если превысили лимит — удаляем самый старый
-        while len(PROCESSED_MEETINGS) > PROCESSED_QUEUE.maxlen:
-            old = PROCESSED_QUEUE.popleft()
-            PROCESSED_MEETINGS.discard(old)
+def _notify_telegram(text: str, tenant: str | None = None):
+    """Отправка уведомления в чат арендатора без исключений — для фоновых задач webhook"""
+    try:
+        notify_tenant(tenant, text)
+    except Exception as e:
+        logger.warning(f"Не удалось отправить уведомление в Telegram: {e}")
 
 
-def is_meeting_processed(meeting_uuid: str) -> bool:
-    return meeting_uuid in PROCESSED_MEETINGS
+job_queue = JobQueue()
+register_collector(job_queue.collect)
+worker_pool = None
 
 
-def unmark_meeting_processed(meeting_uuid: str):
-    if not meeting_uuid:
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global worker_pool
+    check_summary_config()
+    tenants = get_tenants()
+    unsigned = [tenant.name for tenant in tenants.tenants if not tenant.webhook_secret]
+    if unsigned:
+        logger.warning(f"Не задан секрет Zoom у арендаторов {', '.join(unsigned)} — их webhook не проверяются")
+    recovered = job_queue.recover()
+    if recovered:
+        logger.info(f"Возвращено в очередь прерванных задач: {recovered}")
+    if not RUN_EMBEDDED_WORKERS:
+        logger.info("Встроенные воркеры отключены — задачи обрабатывают процессы python -m worker")
+        yield
         return
-    PROCESSED_MEETINGS.discard(meeting_uuid)
-    try:
-        PROCESSED_QUEUE.remove(meeting_uuid)
-    except ValueError:
-        pass
+    worker_pool = WorkerPool(job_queue, on_job_failed=release_meeting)
+    worker_pool.start()
+    warmup = None
+    if PRELOAD_MODEL:
+        # Модель грузится в фоне: webhook начинает принимать запросы сразу, а /ready
+        # отвечает 503, пока пул распознавания не прогрет
+        warmup = asyncio.create_task(asyncio.to_thread(warm_up_transcription_pool))
+    yield
+    if warmup:
+        # Прогрев не должен пережить остановку: ждать загрузку модели перед выходом незачем
+        warmup.cancel()
+        await asyncio.gather(warmup, return_exceptions=True)
+    await worker_pool.stop()
+    shutdown_transcription_pool()
+
 
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
 
 
 @app.get("/")
@@ -53,11 +105,26 @@ def root():
     return {"status": "ok", "message": "Zoom to Telegram Bot is running"}
 
 
+@app.get("/ready")
+def ready():
+    """
+    Готовность инстанса: модель распознавания загружена и прогрета.
+    При PRELOAD_MODEL=0 модель грузится при первой встрече, и инстанс считается готовым сразу;
+    без встроенных воркеров (RUN_EMBEDDED_WORKERS=0) модель API не нужна вовсе.
+    """
+    model = model_readiness.snapshot()
+    is_ready = model["state"] == "ready" or not PRELOAD_MODEL or not RUN_EMBEDDED_WORKERS
+    return JSONResponse(
+        status_code=200 if is_ready else 503,
+        content={"ready": is_ready, "preload": PRELOAD_MODEL, "model": model},
+    )
+
+
 @app.get("/test")
-def test():
-    """Тестовая отправка сообщения в Telegram"""
+def test(tenant: str | None = None):
+    """Тестовая отправка сообщения в Telegram (в чат арендатора, если он указан)"""
     try:
-        send_message_to_telegram("Тестовое сообщение с Railway 🚂")
+        notify_tenant(tenant, "Тестовое сообщение с Railway 🚂")
         return {"sent": True}
     except Exception as e:
         return {"sent": False, "error": str(e)}
@@ -91,16 +158,12 @@ async def zoom_webhook_get(request: Request):
     Обрабатывает GET запрос от Zoom для валидации webhook (challenge-response)
     Zoom отправляет GET запрос с параметром 'plainToken' и ожидает его в ответе
     """
-    logger.info("=" * 50)
     logger.info("GET запрос на /zoom/webhook - валидация webhook от Zoom")
-    logger.info(f"Headers: {dict(request.headers)}")
-    logger.info(f"Query params: {dict(request.query_params)}")
     
     # Zoom отправляет challenge-токен для валидации
     plain_token = request.query_params.get("plainToken")
     
     if plain_token:
-        logger.info(f"Получен challenge token: {plain_token}")
         response = {"plainToken": plain_token}
 
         if ZOOM_WEBHOOK_SECRET_TOKEN:
@@ -133,83 +196,240 @@ async def webhook_status():
     }
 
 
+@app.get("/jobs/status")
+def jobs_status():
+    """
+    Состояние очереди обработки: глубина, выполняемые задачи и время ожидания по этапам,
+    а также метрики скачивания и отправки в Telegram
+    """
+    stats = job_queue.stats()
+    stats["workers"] = {
+        "download": DOWNLOAD_WORKERS,
+        "transcribe": TRANSCRIBE_WORKERS,
+        "max_transcribe_backlog": MAX_TRANSCRIBE_BACKLOG,
+        "max_queued_jobs": MAX_QUEUED_JOBS,
+    }
+    stats["downloads"] = download_metrics.snapshot()
+    stats["telegram"] = telegram_metrics.snapshot()
+    return stats
+
+
+@app.get("/metrics")
+def prometheus_metrics():
+    """
+    Метрики в формате Prometheus: длительность и ошибки этапов, объём скачанного и отправленного,
+    распознанные секунды аудио и real-time factor, глубина очереди
+    """
+    return PlainTextResponse(render_metrics(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def _check_admin_token(request: Request):
+    if not ADMIN_TOKEN:
+        raise HTTPException(status_code=403, detail="ADMIN_TOKEN не задан")
+    if not hmac.compare_digest(request.headers.get("x-admin-token", ""), ADMIN_TOKEN):
+        raise HTTPException(status_code=401, detail="Неверный токен")
+
+
+@app.get("/admin/tenants")
+def admin_tenants(request: Request):
+    """Таблица арендаторов (без секретов) и их незавершённые задачи"""
+    _check_admin_token(request)
+    active = job_queue.stats()["tenants"]
+    return {
+        "tenants": [
+            {**tenant.snapshot(), "jobs": active.get(tenant.name, {})} for tenant in get_tenants().tenants
+        ]
+    }
+
+
+@app.get("/admin/workers")
+def admin_workers(request: Request):
+    """Воркеры, работающие с очередью: последнее сердцебиение, пулы и выполняемые задачи"""
+    _check_admin_token(request)
+    return {"embedded": RUN_EMBEDDED_WORKERS, "workers": job_queue.list_workers()}
+
+
+@app.get("/admin/jobs")
+def admin_jobs(request: Request, status: str | None = None, limit: int = 50):
+    """Список задач с этапом, статусом, ошибкой и сохранёнными артефактами"""
+    _check_admin_token(request)
+    return {"jobs": job_queue.list_jobs(status=status, limit=limit)}
+
+
+@app.post("/admin/jobs/{job_id}/rerun")
+async def admin_rerun_job(request: Request, job_id: int, stage: str):
+    """Перезапускает задачу с указанного этапа; последующие этапы выполнятся заново"""
+    _check_admin_token(request)
+    if stage not in STAGES:
+        raise HTTPException(status_code=400, detail=f"Неизвестный этап {stage}. Доступны: {', '.join(STAGES)}")
+    job = await asyncio.to_thread(job_queue.get, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Задача не найдена")
+    # Этап без своих входных файлов упал бы сразу; подсказываем, с какого этапа начать
+    missing = await asyncio.to_thread(missing_stage_inputs, stage, job["payload"])
+    if missing:
+        start = await asyncio.to_thread(rerun_start_stage, stage, job["payload"])
+        raise HTTPException(
+            status_code=409, detail=f"Этап {stage} нельзя перезапустить: {missing}. Перезапустите с этапа {start}"
+        )
+    if not await asyncio.to_thread(job_queue.rerun, job_id, stage, reset_fields=DELIVERY_MARKERS):
+        raise HTTPException(status_code=409, detail="Задача сейчас выполняется")
+    if worker_pool:
+        worker_pool.notify(stage)
+    return {"status": "queued", "job_id": job_id, "stage": stage}
+
+
+def _zoom_signature(secret: str, timestamp: str, body: bytes) -> str:
+    message = b"v0:" + timestamp.encode() + b":" + body
+    digest = hmac.new(secret.encode(), message, hashlib.sha256).hexdigest()
+    return f"v0={digest}"
+
+
+def verify_zoom_signature(headers, body: bytes, secret: str = ZOOM_WEBHOOK_SECRET_TOKEN) -> bool:
+    """
+    Проверяет подпись Zoom: x-zm-signature = v0=HMAC-SHA256(секрет, "v0:{timestamp}:{тело}").
+    Старые запросы отклоняются, чтобы перехваченный webhook нельзя было отправить повторно.
+    """
+    if not secret:
+        return True
+    timestamp = headers.get("x-zm-request-timestamp", "")
+    signature = headers.get("x-zm-signature", "")
+    try:
+        if abs(time.time() - int(timestamp)) > WEBHOOK_MAX_AGE_SECONDS:
+            return False
+    except ValueError:
+        return False
+    return hmac.compare_digest(signature, _zoom_signature(secret, timestamp, body))
+
+
+def _webhook_secret(headers, body: bytes) -> str | None:
+    """
+    Секрет арендатора, которым подписан webhook; пустая строка — подпись не подошла,
+    но есть арендаторы без секрета; None — webhook отклоняется
+    """
+    tenants = get_tenants()
+    for secret in tenants.webhook_secrets():
+        if verify_zoom_signature(headers, body, secret):
+            return secret
+    return "" if tenants.allows_unsigned() else None
+
+
+def _should_log_payload() -> bool:
+    return logger.isEnabledFor(logging.DEBUG) or random.random() < WEBHOOK_LOG_SAMPLE_RATE
+
+
+@app.get("/admin/traces/{meeting_uuid:path}")
+def admin_trace(request: Request, meeting_uuid: str):
+    """Спаны обработки встречи (при включённом TRACE_DIR) для разбора медленных задач"""
+    _check_admin_token(request)
+    return {"meeting_uuid": meeting_uuid, "spans": read_trace(meeting_uuid)}
+
+
+def _enqueue_recording(tenant, meeting_uuid: str | None, job_payload: dict) -> tuple[str, dict | None]:
+    """
+    Захватывает встречу и ставит задачу в очередь с учётом квот.
+    Возвращает ("accepted", задача), ("duplicate", None) или ("busy", None)
+    """
+    # Захват атомарен и общий для всех воркеров: повтор webhook принимается только один раз
+    if not claim_meeting(meeting_uuid):
+        logger.info(f"Встреча {meeting_uuid} уже обработана — пропускаю повторный webhook")
+        return "duplicate", None
+
+    # Квота арендатора не даёт одной команде занять всю очередь
+    tenant_full = tenant.max_queued_jobs and job_queue.active_count(tenant.name) >= tenant.max_queued_jobs
+    if tenant_full or job_queue.active_count() >= MAX_QUEUED_JOBS:
+        release_meeting(meeting_uuid)
+        scope = f"арендатора {tenant.name}" if tenant_full else "обработки"
+        logger.warning(f"Очередь {scope} переполнена — прошу Zoom повторить webhook позже")
+        return "busy", None
+
+    try:
+        job_id = job_queue.enqueue(meeting_uuid, job_payload, tenant=tenant.name)
+    except Exception:
+        release_meeting(meeting_uuid)
+        raise
+    if job_id is None:
+        logger.info(f"Встреча {meeting_uuid} уже в очереди — пропускаю повторный webhook")
+        return "duplicate", None
+    return "accepted", job_queue.get(job_id)
+
+
 @app.post("/zoom/webhook")
-async def zoom_webhook(request: Request):
+async def zoom_webhook(request: Request, background_tasks: BackgroundTasks):
     """
     Обрабатывает webhook от Zoom о завершении записи встречи.
     Ожидает событие 'recording.completed' с download_url.
+    Тело читается один раз, подпись проверяется до разбора JSON; обработка записи
+    ставится в очередь, поэтому ответ Zoom уходит за миллисекунды.
     """
     try:
-        # Логируем все входящие запросы
-        logger.info("=" * 50)
-        logger.info("POST запрос на /zoom/webhook получен")
-        logger.info(f"Headers: {dict(request.headers)}")
-        
-        # Пробуем получить данные
+        body = await request.body()
+        secret = _webhook_secret(request.headers, body)
+        if secret is None:
+            logger.warning("Webhook с неверной подписью Zoom отклонён")
+            return JSONResponse(status_code=401, content={"status": "error", "error": "Invalid signature"})
+
         try:
-            data = await request.json()
-            logger.info(f"Webhook data: {data}")
-        except Exception as json_error:
-            # Если не JSON, пробуем получить как текст
-            body = await request.body()
+            data = json.loads(body)
+        except ValueError as json_error:
             logger.error(f"Ошибка парсинга JSON: {json_error}")
-            logger.error(f"Raw body: {body.decode('utf-8', errors='ignore')}")
             return {"status": "error", "error": "Invalid JSON"}
-        
+        if _should_log_payload():
+            logger.info(f"Webhook data: {data}")
+
         # Проверяем тип события
         event = data.get("event", "")
-        logger.info(f"Тип события: {event}")
-        
+
         # Обработка валидации URL от Zoom (challenge-response)
         if event == "endpoint.url_validation":
             payload = data.get("payload", {})
             plain_token = payload.get("plainToken")
             if plain_token:
-                logger.info(f"Валидация URL: получен plainToken: {plain_token}")
+                logger.info("Валидация URL: получен plainToken")
                 response = {"plainToken": plain_token}
 
-                if ZOOM_WEBHOOK_SECRET_TOKEN:
+                # Отвечаем секретом того арендатора, чьим приложением Zoom подписан запрос
+                if secret:
                     encrypted_token = hmac.new(
-                        ZOOM_WEBHOOK_SECRET_TOKEN.encode(),
+                        secret.encode(),
                         plain_token.encode(),
                         hashlib.sha256,
                     ).hexdigest()
                     response["encryptedToken"] = encrypted_token
                 else:
                     logger.warning(
-                        "ZOOM_WEBHOOK_SECRET_TOKEN не установлен — validation может не пройти"
+                        "Секрет Zoom для запроса не найден — validation может не пройти"
                     )
                 return response
             else:
                 logger.warning("Валидация URL: plainToken не найден в payload")
                 return {"status": "error", "error": "plainToken not found"}
         
+        tenant = get_tenants().route(data)
+        if tenant is None:
+            logger.info(f"Событие {event} не относится ни к одному арендатору — игнорирую")
+            return {"status": "unrouted", "event": event}
+        # Подпись чужим секретом не даёт отправить встречу в чат другой команды
+        if tenant.webhook_secret != secret:
+            logger.warning(f"Webhook для арендатора {tenant.name} подписан не его секретом — отклонён")
+            return JSONResponse(status_code=401, content={"status": "error", "error": "Invalid signature"})
+
         if event != "recording.completed":
             logger.info(f"Игнорируем событие: {event}")
             # Отправляем уведомление о других событиях для отладки
-            try:
-                send_message_to_telegram(f"📥 Получено событие от Zoom: {event}")
-            except:
-                pass
+            background_tasks.add_task(_notify_telegram, f"📥 Получено событие от Zoom: {event}", tenant.name)
             return {"status": "ignored", "event": event}
         
         # Извлекаем download_url из payload
         payload = data.get("payload", {})
-        logger.info(f"Payload: {payload}")
-        
         object_data = payload.get("object", {})
         meeting_uuid = object_data.get("uuid")
-        if meeting_uuid and is_meeting_processed(meeting_uuid):
-            logger.info(f"Встреча {meeting_uuid} уже обработана — пропускаю повторный webhook")
-            return {"status": "duplicate", "meeting": meeting_uuid}
         recording_files = object_data.get("recording_files", [])
         
-        logger.info(f"Найдено файлов записи: {len(recording_files)}")
-        
         if not recording_files:
             error_msg = "⚠️ Запись завершена, но файлы не найдены"
             logger.warning(error_msg)
-            send_message_to_telegram(error_msg)
+            background_tasks.add_task(_notify_telegram, error_msg, tenant.name)
             return {"status": "no_files"}
         
         audio_file = None
@@ -217,102 +437,58 @@ async def zoom_webhook(request: Request):
         for file in recording_files:
             file_type = file.get("file_type", "").lower()
             file_extension = file.get("file_extension", "").lower()
-            logger.info(f"Файл: type={file_type}, ext={file_extension}")
-            if not audio_file and (file_type == "audio" or file_extension in ["mp3", "m4a", "wav"]):
-                audio_file = file
-            if not video_file and (file_type in ["shared_screen_with_speaker_view", "video"] or file_extension in ["mp4", "mov", "mkv"]):
+            recording_type = file.get("recording_type", "").lower()
+            logger.debug(f"Файл: type={file_type}, ext={file_extension}, recording_type={recording_type}")
+            if file_type in NON_MEDIA_FILE_TYPES:
+                continue
+            if recording_type == "audio_only" or file_type in ["audio", "m4a"] or file_extension in ["mp3", "m4a", "wav"]:
+                # Дорожка audio_only приоритетнее прочих аудиофайлов
+                if not audio_file or (recording_type == "audio_only" and audio_file.get("recording_type") != "audio_only"):
+                    audio_file = file
+            elif not video_file and (
+                recording_type in ["shared_screen_with_speaker_view", "speaker_view", "gallery_view", "shared_screen"]
+                or file_type in ["mp4", "video"]
+                or file_extension in ["mp4", "mov", "mkv"]
+            ):
                 video_file = file
         
-        if not audio_file:
-            audio_file = recording_files[0]
+        if not video_file and not audio_file:
+            error_msg = "⚠️ Запись завершена, но аудио и видео файлы не найдены"
+            logger.warning(error_msg)
+            background_tasks.add_task(_notify_telegram, error_msg, tenant.name)
+            return {"status": "no_files"}
         if not video_file:
             video_file = audio_file
         
         meeting_topic = object_data.get("topic", "Встреча")
         download_token = data.get("download_token")
-        logger.info(f"Тема встречи: {meeting_topic}")
-        
-        logger.info("Запускаю асинхронную обработку записи...")
-        mark_meeting_processed(meeting_uuid)
-        asyncio.create_task(
-            process_recording_async(
-                audio_file, video_file, meeting_topic, download_token, meeting_uuid
-            )
-        )
-        
-        logger.info("Webhook обработан успешно")
+
+        job_payload = {
+            "audio_recording": audio_file,
+            "video_recording": video_file,
+            "meeting_topic": meeting_topic,
+            "download_token": download_token,
+            "meeting_uuid": meeting_uuid,
+            "tenant": tenant.name,
+        }
+        # Дедупликация и очередь — SQLite (или Redis): пока другой процесс держит блокировку записи,
+        # ждём в потоке, а не в event loop, чтобы не задерживать остальные запросы
+        status, job = await asyncio.to_thread(_enqueue_recording, tenant, meeting_uuid, job_payload)
+        if status == "busy":
+            return JSONResponse(status_code=503, content={"status": "busy", "meeting": meeting_topic})
+        if status == "duplicate":
+            return {"status": "duplicate", "meeting": meeting_uuid}
+        job_id = job["id"]
+
+        logger.info(f"Запись «{meeting_topic}» ({tenant.name}) поставлена в очередь обработки: задача {job_id}")
+        # Повтор по упавшей встрече продолжает задачу с этапа, на котором она упала
+        if worker_pool:
+            worker_pool.notify(job["stage"])
         return {"status": "accepted", "meeting": meeting_topic}
             
     except Exception as e:
         error_msg = f"❌ Ошибка обработки webhook: {str(e)}"
         logger.error(error_msg, exc_info=True)
-        try:
-            send_message_to_telegram(error_msg)
-        except:
-            pass
+        background_tasks.add_task(_notify_telegram, error_msg)
         return {"status": "error", "error": str(e)}
 
-
-async def process_recording_async(
-    audio_recording: dict,
-    video_recording: dict,
-    meeting_topic: str,
-    download_token: str | None = None,
-    meeting_uuid: str | None = None,
-):
-    """
-    Асинхронная обработка записи: скачивание, транскрипция и отправка в Telegram
-    """
-    try:
-        logger.info(f"Начало обработки записи: {meeting_topic}")
-        # Отправляем уведомление о начале обработки
-        send_message_to_telegram(f"🎥 Обрабатываю запись: *{meeting_topic}*")
-        
-        # Скачиваем файл во временную директорию
-        with tempfile.TemporaryDirectory() as temp_dir:
-            video_extension = video_recording.get("file_extension", "mp4")
-            video_path = os.path.join(temp_dir, f"recording_video.{video_extension}")
-            download_zoom_file(
-                video_recording.get("download_url"),
-                video_path,
-                access_token=download_token,
-            )
-            send_message_to_telegram(f"📹 Отправляю запись встречи: *{meeting_topic}*")
-            send_file_to_telegram(video_path, caption=f"🎥 Запись встречи: {meeting_topic}")
-            
-            audio_extension = audio_recording.get("file_extension", video_extension)
-            audio_path = video_path
-            if audio_recording.get("id") != video_recording.get("id") or audio_extension.lower() != video_extension.lower():
-                audio_path = os.path.join(temp_dir, f"recording_audio.{audio_extension}")
-                download_zoom_file(
-                    audio_recording.get("download_url"),
-                    audio_path,
-                    access_token=download_token,
-                )
-            
-            send_message_to_telegram("🎤 Транскрибирую аудио...")
-            transcription = transcribe_audio(audio_path)
-            
-            # Сохраняем транскрипт в файл
-            transcript_path = os.path.join(temp_dir, "transcript.txt")
-            with open(transcript_path, "w", encoding="utf-8") as transcript_file:
-                transcript_file.write(transcription.strip())
-            send_file_to_telegram(
-                transcript_path, caption=f"🗒️ Полная транскрибация: {meeting_topic}"
-            )
-            
-            # Преобразуем в формат "планы и задачи"
-            send_message_to_telegram("📝 Форматирую в планы и задачи...")
-            formatted_text = convert_to_plans_and_tasks(transcription)
-            
-            final_message = f"📋 *Планы и задачи из встречи: {meeting_topic}*\n\n{formatted_text}"
-            send_message_to_telegram(final_message)
-            
-    except Exception as e:
-        error_msg = f"❌ Ошибка обработки записи: {str(e)}"
-        logger.error(error_msg, exc_info=True)
-        try:
-            send_message_to_telegram(error_msg)
-        except:
-            pass
-        unmark_meeting_processed(meeting_uuid or "")
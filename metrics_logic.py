@@ -0,0 +1,197 @@
+import os
+import re
+import json
+import time
+import logging
+import threading
+import contextvars
+from contextlib import contextmanager
+
+logger = logging.getLogger(__name__)
+
+METRICS_PREFIX = "zoombot"
+# Каталог для трасс обработки встреч (JSON Lines, файл на встречу); пусто — трассировка выключена
+TRACE_DIR = os.getenv("TRACE_DIR", "")
+
+# Этапы длятся от долей секунды (отправка сообщения) до часа (транскрибация длинной встречи)
+STAGE_BUCKETS = (0.1, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 1800, 3600)
+RTF_BUCKETS = (0.05, 0.1, 0.2, 0.3, 0.5, 0.75, 1, 1.5, 2, 5)
+
+_collectors = []
+_trace = contextvars.ContextVar("trace", default=None)
+_trace_lock = threading.Lock()
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: dict) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in sorted(labels.items())) + "}"
+
+
+class Counter:
+    """Монотонный счётчик с метками"""
+
+    def __init__(self, name: str, help_text: str):
+        self.name = f"{METRICS_PREFIX}_{name}"
+        self.help_text = help_text
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in self._values.items():
+                lines.append(f"{self.name}{_format_labels(dict(key))} {value}")
+        return lines
+
+
+class Histogram:
+    """Гистограмма с фиксированными границами корзин и метками"""
+
+    def __init__(self, name: str, help_text: str, buckets: tuple = STAGE_BUCKETS):
+        self.name = f"{METRICS_PREFIX}_{name}"
+        self.help_text = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._lock = threading.Lock()
+        self._values = {}
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._values.setdefault(key, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series["buckets"][i] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in self._values.items():
+                labels = dict(key)
+                for bound, bucket_count in zip(self.buckets, series["buckets"]):
+                    lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': bound})} {bucket_count}")
+                lines.append(f"{self.name}_bucket{_format_labels({**labels, 'le': '+Inf'})} {series['count']}")
+                lines.append(f"{self.name}_sum{_format_labels(labels)} {round(series['sum'], 6)}")
+                lines.append(f"{self.name}_count{_format_labels(labels)} {series['count']}")
+        return lines
+
+
+stage_duration = Histogram("stage_duration_seconds", "Длительность этапа обработки записи")
+stage_errors = Counter("stage_errors_total", "Упавшие этапы обработки записи")
+worker_errors = Counter("worker_errors_total", "Ошибки воркеров вне этапов: очередь, квоты, колбэки")
+job_duration = Histogram("job_duration_seconds", "Время от постановки задачи в очередь до доставки отчёта")
+audio_seconds = Counter("audio_seconds_total", "Секунды распознанного аудио")
+transcription_rtf = Histogram(
+    "transcription_real_time_factor", "Время распознавания, делённое на длительность аудио", RTF_BUCKETS
+)
+summary_duration = Histogram("summary_duration_seconds", "Длительность формирования отчёта через OpenAI")
+
+_METRICS = [stage_duration, stage_errors, worker_errors, job_duration, audio_seconds, transcription_rtf, summary_duration]
+
+
+def register_collector(collect):
+    """
+    Регистрирует источник метрик, который считается в момент запроса /metrics.
+    collect() возвращает список (имя, тип, описание, значение, метки).
+    """
+    _collectors.append(collect)
+
+
+def render_metrics() -> str:
+    """Все метрики в текстовом формате Prometheus"""
+    lines = []
+    for metric in _METRICS:
+        lines.extend(metric.render())
+    described = set()
+    for collect in _collectors:
+        try:
+            samples = collect()
+        except Exception as e:
+            logger.warning(f"Не удалось собрать метрики: {e}")
+            continue
+        for name, metric_type, help_text, value, labels in samples:
+            full_name = f"{METRICS_PREFIX}_{name}"
+            if full_name not in described:
+                lines.append(f"# HELP {full_name} {help_text}")
+                lines.append(f"# TYPE {full_name} {metric_type}")
+                described.add(full_name)
+            lines.append(f"{full_name}{_format_labels(labels or {})} {value}")
+    return "\n".join(lines) + "\n"
+
+
+def _trace_path(meeting_uuid: str) -> str:
+    # В uuid встречи Zoom бывают / и +, поэтому приводим его к безопасному имени файла
+    return os.path.join(TRACE_DIR, re.sub(r"[^A-Za-z0-9_.=-]", "_", meeting_uuid) + ".jsonl")
+
+
+@contextmanager
+def trace_job(meeting_uuid: str | None, job_id: int):
+    """Привязывает спаны в текущем потоке к трассе встречи"""
+    token = _trace.set({"meeting_uuid": meeting_uuid or f"job-{job_id}", "job_id": job_id})
+    try:
+        yield
+    finally:
+        _trace.reset(token)
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Спан трассы: время начала, длительность, статус и атрибуты операции.
+    Пишется в TRACE_DIR, только если трассировка включена и спан выполняется внутри trace_job.
+    Атрибуты можно дополнить по ходу выполнения через возвращаемый словарь.
+    """
+    trace = _trace.get()
+    if not TRACE_DIR or trace is None:
+        yield attributes
+        return
+    started_at = time.time()
+    started = time.perf_counter()
+    status = "ok"
+    error = None
+    try:
+        yield attributes
+    except BaseException as e:
+        status = "error"
+        error = str(e)
+        raise
+    finally:
+        record = {
+            "meeting_uuid": trace["meeting_uuid"],
+            "job_id": trace["job_id"],
+            "span": name,
+            "start": round(started_at, 3),
+            "duration_seconds": round(time.perf_counter() - started, 3),
+            "status": status,
+            "error": error,
+            "attributes": attributes,
+        }
+        try:
+            with _trace_lock:
+                os.makedirs(TRACE_DIR, exist_ok=True)
+                with open(_trace_path(trace["meeting_uuid"]), "a", encoding="utf-8") as f:
+                    f.write(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        except OSError as e:
+            logger.warning(f"Не удалось записать спан {name}: {e}")
+
+
+def read_trace(meeting_uuid: str) -> list[dict]:
+    """Спаны встречи в порядке записи"""
+    if not TRACE_DIR:
+        return []
+    try:
+        with open(_trace_path(meeting_uuid), encoding="utf-8") as f:
+            return [json.loads(line) for line in f if line.strip()]
+    except FileNotFoundError:
+        return []
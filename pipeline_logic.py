@@ -0,0 +1,510 @@
+import os
+import json
+import time
+import shutil
+import asyncio
+import logging
+from telegram_logic import send_message_to_telegram, send_file_to_telegram, StatusMessage, telegram_target
+from zoom_logic import download_zoom_file, extract_audio, stream_transcribe, transcription_config
+from text_logic import convert_to_plans_and_tasks, split_sections
+from diarization_logic import create_diarizer, diarization_config
+from transcript_logic import make_segment, assign_speakers, write_transcript, iter_segments, TRANSCRIPT_FORMATS
+from delivery_logic import deliver_file
+from cache_logic import get_cache
+from metrics_logic import trace_job, span, stage_duration, stage_errors, job_duration, worker_errors
+from tenant_logic import get_tenants, get_tenant
+from queue_logic import (
+    JobQueue,
+    next_stage,
+    STAGES,
+    STAGE_DOWNLOAD_VIDEO,
+    STAGE_DELIVER_VIDEO,
+    STAGE_OBTAIN_AUDIO,
+    STAGE_TRANSCRIBE,
+    STAGE_SUMMARIZE,
+    STAGE_DELIVER,
+    STAGE_DONE,
+    STATUS_PENDING,
+)
+
+logger = logging.getLogger(__name__)
+
+# Рабочие файлы задач храним вне TemporaryDirectory: они нужны до завершения задачи,
+# чтобы повтор после сбоя продолжил работу с упавшего этапа
+JOBS_WORK_DIR = os.getenv("JOBS_WORK_DIR", "jobs_work")
+DOWNLOAD_WORKERS = int(os.getenv("DOWNLOAD_WORKERS", "2"))
+TRANSCRIBE_WORKERS = int(os.getenv("TRANSCRIBE_WORKERS", "1"))
+# Сколько скачанных записей может ждать транскрибации, прежде чем скачивание приостановится
+MAX_TRANSCRIBE_BACKLOG = int(os.getenv("MAX_TRANSCRIBE_BACKLOG", str(TRANSCRIBE_WORKERS * 2)))
+JOB_POLL_INTERVAL = float(os.getenv("JOB_POLL_INTERVAL", "1.0"))
+# Как часто воркер продлевает аренду своих задач и ищет задачи упавших воркеров;
+# должно быть заметно меньше JOB_LEASE_SECONDS
+JOB_HEARTBEAT_INTERVAL = float(os.getenv("JOB_HEARTBEAT_INTERVAL", "10"))
+# Пауза воркера после ошибки очереди (например, database is locked), чтобы не крутиться вхолостую
+WORKER_ERROR_BACKOFF = float(os.getenv("WORKER_ERROR_BACKOFF", "5"))
+# Через сколько секунд без сердцебиения запись о воркере удаляется из /admin/workers
+WORKER_FORGET_SECONDS = 24 * 3600
+# Отдельный аудиофайл не скачивается заранее: ffmpeg декодирует его прямо из download_url
+STREAMING_TRANSCRIPTION = os.getenv("STREAMING_TRANSCRIPTION", "1") == "1"
+
+
+# Отметки payload об уже отправленных в Telegram частях записи, файлах и разделах: повтор
+# упавшего этапа по ним не дублирует сообщения, а ручной перезапуск через /admin их сбрасывает
+DELIVERY_MARKERS = ("video_parts_sent", "transcript_files_sent", "summary_sections_sent")
+
+
+def get_job_work_dir(job_id: int) -> str:
+    return os.path.join(JOBS_WORK_DIR, str(job_id))
+
+
+def _has_separate_audio(payload: dict) -> bool:
+    audio_recording = payload.get("audio_recording")
+    return bool(audio_recording) and audio_recording.get("download_url") != payload["video_recording"].get("download_url")
+
+
+def _transcript_cache_key(payload: dict) -> str | None:
+    """
+    Ключ кэша транскрипта: id и размер файла записи, из которого берётся аудио,
+    настройки распознавания и диаризации. В кэше лежат сегменты (transcript.json)
+    """
+    recording = payload["audio_recording"] if _has_separate_audio(payload) else payload["video_recording"]
+    if not recording.get("id"):
+        return None
+    return get_cache().make_key(
+        "segments", recording["id"], recording.get("file_size"), transcription_config(), diarization_config()
+    )
+
+
+def download_video_stage(job_id: int, payload: dict) -> dict:
+    """Скачивает видео записи в рабочую папку задачи"""
+    video_recording = payload["video_recording"]
+    meeting_topic = payload["meeting_topic"]
+
+    logger.info(f"Начало обработки записи: {meeting_topic}")
+    # Шаги обработки показываем одним сообщением, которое редактируется на месте
+    status = StatusMessage(payload.get("status_message_id"))
+    status.update(f"🎥 Обрабатываю запись: *{meeting_topic}*")
+    payload["status_message_id"] = status.message_id
+
+    work_dir = get_job_work_dir(job_id)
+    os.makedirs(work_dir, exist_ok=True)
+
+    video_extension = video_recording.get("file_extension", "mp4")
+    video_path = os.path.join(work_dir, f"recording_video.{video_extension}")
+    expected_size = video_recording.get("file_size")
+    # Файл прерванной загрузки уже выделен на полный размер, поэтому о завершённом скачивании
+    # говорит только отсутствие файла прогресса; иначе download_zoom_file докачает сегменты
+    downloaded = expected_size and os.path.exists(video_path) and not os.path.exists(f"{video_path}.progress") \
+        and os.path.getsize(video_path) == expected_size
+    if downloaded:
+        logger.info(f"Видео встречи {meeting_topic} уже скачано, пропускаю скачивание")
+    else:
+        download_zoom_file(
+            video_recording.get("download_url"),
+            video_path,
+            access_token=payload.get("download_token"),
+            expected_size=expected_size,
+        )
+    payload["video_path"] = video_path
+    return payload
+
+
+def deliver_video_stage(job_id: int, payload: dict) -> dict:
+    """Отправляет видео в Telegram (со сжатием или нарезкой, если оно больше лимита)"""
+    meeting_topic = payload["meeting_topic"]
+    StatusMessage(payload.get("status_message_id")).update(f"📹 Отправляю запись встречи: *{meeting_topic}*")
+    deliver_file(
+        payload["video_path"],
+        caption=f"🎥 Запись встречи: {meeting_topic}",
+        sent=payload.setdefault("video_parts_sent", []),
+    )
+    return payload
+
+
+def obtain_audio_stage(job_id: int, payload: dict) -> dict:
+    """
+    Готовит источник аудио для транскрибации.
+    Если у записи есть отдельная дорожка audio_only, транскрибируется она; иначе из видео
+    извлекается 16 кГц моно дорожка. После этого видео удаляется.
+    """
+    audio_recording = payload.get("audio_recording")
+    work_dir = get_job_work_dir(job_id)
+    video_path = payload.get("video_path")
+
+    cache_key = _transcript_cache_key(payload)
+    if cache_key and get_cache().contains(cache_key):
+        # Транскрипт уже есть в кэше — аудио для распознавания не готовим
+        audio_source = None
+    elif _has_separate_audio(payload):
+        if STREAMING_TRANSCRIPTION:
+            audio_source = audio_recording.get("download_url")
+        else:
+            audio_extension = audio_recording.get("file_extension", "m4a")
+            audio_source = os.path.join(work_dir, f"recording_audio.{audio_extension}")
+            download_zoom_file(
+                audio_recording.get("download_url"),
+                audio_source,
+                access_token=payload.get("download_token"),
+                expected_size=audio_recording.get("file_size"),
+            )
+    else:
+        audio_source = extract_audio(video_path, os.path.join(work_dir, "recording_audio.flac"))
+
+    # Видео больше не нужно: в очереди на транскрибацию ждёт только компактное аудио
+    if video_path and os.path.exists(video_path):
+        os.remove(video_path)
+    payload["video_path"] = None
+    payload["audio_source"] = audio_source
+    return payload
+
+
+def _transcribe_segments(payload: dict, segments_path: str) -> list[tuple[float, float, int]] | None:
+    """
+    Распознаёт аудио, дописывая сегменты в JSON Lines по мере готовности, и параллельно
+    размечает спикеров. Возвращает реплики спикеров или None без диаризации.
+    Сбой диаризации не роняет этап: транскрипт остаётся без спикеров
+    """
+    diarizer = None
+    try:
+        diarizer = create_diarizer()
+    except Exception as e:
+        logger.warning(f"Диаризация недоступна, транскрипт будет без спикеров: {e}")
+
+    with open(segments_path, "w", encoding="utf-8") as segments_file:
+        def on_segment(start: float, end: float, text: str):
+            segments_file.write(json.dumps(make_segment(start, end, text), ensure_ascii=False) + "\n")
+            segments_file.flush()
+
+        try:
+            stream_transcribe(
+                payload["audio_source"],
+                access_token=payload.get("download_token"),
+                on_segment=on_segment,
+                diarizer=diarizer,
+            )
+        except BaseException:
+            if diarizer:
+                diarizer.close()
+            raise
+
+    if not diarizer:
+        return None
+    try:
+        return diarizer.finish()
+    except Exception as e:
+        logger.warning(f"Не удалось разметить спикеров: {e}")
+        return None
+
+
+def transcribe_stage(job_id: int, payload: dict) -> dict:
+    """
+    Транскрибирует аудио в сегменты со временем и спикерами, сохраняет транскрипт
+    в txt, srt, vtt и json и отправляет в Telegram форматы из TRANSCRIPT_FORMATS.
+    Отправленные файлы отмечаются в payload, поэтому повтор этапа их не дублирует
+    """
+    meeting_topic = payload["meeting_topic"]
+    work_dir = get_job_work_dir(job_id)
+    os.makedirs(work_dir, exist_ok=True)
+
+    status = StatusMessage(payload.get("status_message_id"))
+    status.update(f"🎤 Транскрибирую аудио: *{meeting_topic}*")
+    segments_path = os.path.join(work_dir, "segments.jsonl")
+    # Повторный webhook или повтор после сбоя не запускает распознавание заново
+    cache = get_cache()
+    cache_key = _transcript_cache_key(payload)
+    turns = None
+    # В кэше лежит transcript.json со спикерами; он читается построчно, как segments.jsonl
+    if cache_key and cache.get_file(cache_key, segments_path):
+        logger.info(f"Транскрипт встречи {meeting_topic} найден в кэше")
+        cached = True
+    elif payload.get("audio_source") is None:
+        raise RuntimeError("Транскрипт вытеснен из кэша до транскрибации, а аудио не подготовлено")
+    else:
+        turns = _transcribe_segments(payload, segments_path)
+        cached = False
+
+    # Сегменты читаются с диска по одному: транскрипт длинной встречи не собирается в памяти
+    segments = iter_segments(segments_path)
+    if turns:
+        segments = assign_speakers(segments, turns)
+    paths = write_transcript(segments, os.path.join(work_dir, "transcript"))
+    if cache_key and not cached:
+        cache.set_file(cache_key, paths["json"])
+
+    sent = payload.setdefault("transcript_files_sent", [])
+    for name in TRANSCRIPT_FORMATS:
+        if name not in paths or name in sent:
+            continue
+        caption = f"🗒️ Полная транскрибация: {meeting_topic}"
+        if name != "txt":
+            caption = f"🗒️ Транскрибация с таймкодами ({name.upper()}): {meeting_topic}"
+        send_file_to_telegram(paths[name], caption=caption)
+        sent.append(name)
+    payload["transcript_path"] = paths["txt"]
+    payload["transcript_files"] = paths
+    return payload
+
+
+def _deliver_summary_section(payload: dict, index: int, section: str):
+    """
+    Отправляет раздел отчёта, если он ещё не отправлен; первый раздел идёт с заголовком встречи.
+    Счётчик отправленных разделов сохраняется в payload, поэтому повтор этапа их не дублирует.
+    """
+    if index < payload.get("summary_sections_sent", 0):
+        return
+    if index == 0:
+        section = f"📋 *Планы и задачи из встречи: {payload['meeting_topic']}*\n\n{section}"
+    send_message_to_telegram(section)
+    payload["summary_sections_sent"] = index + 1
+
+
+def summarize_stage(job_id: int, payload: dict) -> dict:
+    """
+    Преобразует транскрипт в планы и задачи. Отчёт приходит от модели потоком:
+    каждый готовый раздел сразу дописывается в summary.md и отправляется в Telegram
+    """
+    meeting_topic = payload["meeting_topic"]
+    StatusMessage(payload.get("status_message_id")).update(f"📝 Форматирую в планы и задачи: *{meeting_topic}*")
+    with open(payload["transcript_path"], encoding="utf-8") as transcript_file:
+        transcription = transcript_file.read().strip()
+
+    summary_path = os.path.join(get_job_work_dir(job_id), "summary.md")
+    sections = 0
+    with open(summary_path, "w", encoding="utf-8") as summary_file:
+        def on_section(section: str):
+            nonlocal sections
+            summary_file.write(section + "\n\n")
+            summary_file.flush()
+            _deliver_summary_section(payload, sections, section)
+            sections += 1
+
+        convert_to_plans_and_tasks(
+            transcription, get_tenant(payload.get("tenant")).summary_prompt, on_section=on_section
+        )
+    payload["summary_path"] = summary_path
+    return payload
+
+
+def deliver_stage(job_id: int, payload: dict) -> dict:
+    """Досылает неотправленные разделы отчёта, отмечает встречу обработанной и удаляет рабочие файлы задачи"""
+    meeting_topic = payload["meeting_topic"]
+    with open(payload["summary_path"], encoding="utf-8") as summary_file:
+        for index, section in enumerate(split_sections(summary_file.read())):
+            _deliver_summary_section(payload, index, section)
+    StatusMessage(payload.get("status_message_id")).update(f"✅ Запись обработана: *{meeting_topic}*")
+
+    # Артефакты нужны только для повтора этапов; после доставки они больше не нужны
+    shutil.rmtree(get_job_work_dir(job_id), ignore_errors=True)
+    return payload
+
+
+def _file_exists(path: str | None) -> bool:
+    return bool(path) and os.path.exists(path)
+
+
+def missing_stage_inputs(stage: str, payload: dict) -> str | None:
+    """
+    Чего не хватает этапу, чтобы выполниться заново, или None. Артефакты живут недолго:
+    obtain_audio удаляет видео, а deliver — всю рабочую папку задачи
+    """
+    if stage == STAGE_DELIVER_VIDEO and not _file_exists(payload.get("video_path")):
+        return "видео уже удалено"
+    if stage in (STAGE_OBTAIN_AUDIO, STAGE_TRANSCRIBE):
+        cache_key = _transcript_cache_key(payload)
+        if cache_key and get_cache().contains(cache_key):
+            return None
+    if stage == STAGE_OBTAIN_AUDIO and not _has_separate_audio(payload) \
+            and not _file_exists(payload.get("video_path")):
+        return "видео уже удалено"
+    if stage == STAGE_TRANSCRIBE:
+        audio_source = payload.get("audio_source")
+        if not audio_source or not (audio_source.startswith(("http://", "https://")) or os.path.exists(audio_source)):
+            return "аудио уже удалено, а транскрипта нет в кэше"
+    if stage == STAGE_SUMMARIZE and not _file_exists(payload.get("transcript_path")):
+        return "транскрипт уже удалён"
+    if stage == STAGE_DELIVER and not _file_exists(payload.get("summary_path")):
+        return "отчёт уже удалён"
+    return None
+
+
+def rerun_start_stage(stage: str, payload: dict) -> str:
+    """Ближайший к stage более ранний этап, которому хватает артефактов; скачивание возможно всегда"""
+    for candidate in reversed(STAGES[:STAGES.index(stage) + 1]):
+        if missing_stage_inputs(candidate, payload) is None:
+            return candidate
+    return STAGE_DOWNLOAD_VIDEO
+
+
+STAGE_HANDLERS = {
+    STAGE_DOWNLOAD_VIDEO: download_video_stage,
+    STAGE_DELIVER_VIDEO: deliver_video_stage,
+    STAGE_OBTAIN_AUDIO: obtain_audio_stage,
+    STAGE_TRANSCRIBE: transcribe_stage,
+    STAGE_SUMMARIZE: summarize_stage,
+    STAGE_DELIVER: deliver_stage,
+}
+
+def run_stage(job_id: int, stage: str, payload: dict) -> dict:
+    """
+    Выполняет этап задачи в бот и чат её арендатора;
+    спаны этапа и вложенных операций попадают в трассу встречи
+    """
+    tenant = get_tenant(payload.get("tenant"))
+    with telegram_target(tenant.telegram_bot_token, tenant.telegram_chat_id), \
+            trace_job(payload.get("meeting_uuid"), job_id), span(stage, tenant=tenant.name):
+        return STAGE_HANDLERS[stage](job_id, payload)
+
+
+def notify_tenant(tenant_name: str | None, text: str):
+    """Отправляет сообщение в чат арендатора"""
+    tenant = get_tenant(tenant_name)
+    with telegram_target(tenant.telegram_bot_token, tenant.telegram_chat_id):
+        send_message_to_telegram(text)
+
+
+# Этапы, завязанные на сеть и диск, и этапы, завязанные на CPU и OpenAI, выполняются
+# разными воркерами со своими лимитами параллельности
+DOWNLOAD_POOL_STAGES = [STAGE_DOWNLOAD_VIDEO, STAGE_DELIVER_VIDEO, STAGE_OBTAIN_AUDIO]
+TRANSCRIBE_POOL_STAGES = [STAGE_TRANSCRIBE, STAGE_SUMMARIZE, STAGE_DELIVER]
+
+
+POOLS = {
+    "download": DOWNLOAD_POOL_STAGES,
+    "transcribe": TRANSCRIBE_POOL_STAGES,
+}
+POOL_SIZES = {
+    "download": DOWNLOAD_WORKERS,
+    "transcribe": TRANSCRIBE_WORKERS,
+}
+
+
+class WorkerPool:
+    """
+    Пул воркеров: отдельные лимиты параллельности для скачивания и транскрибации.
+    Работает внутри API или отдельным процессом (python -m worker); задачи берутся из общей
+    очереди под аренду, которую пул продлевает сердцебиением, пока этап выполняется.
+    """
+
+    def __init__(self, queue: JobQueue, on_job_failed=None, pools: list[str] | None = None):
+        self.queue = queue
+        self.on_job_failed = on_job_failed
+        self._pools = {pool: POOLS[pool] for pool in (pools or POOLS)}
+        self._events = {pool: asyncio.Event() for pool in self._pools}
+        self._tasks = []
+
+    def start(self):
+        for pool in self._pools:
+            for _ in range(POOL_SIZES[pool]):
+                self._tasks.append(asyncio.create_task(self._worker(pool)))
+        self._tasks.append(asyncio.create_task(self._heartbeat()))
+        sizes = ", ".join(f"{pool}={POOL_SIZES[pool]}" for pool in self._pools)
+        logger.info(f"Запущены воркеры {self.queue.worker_id}: {sizes}")
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Прерванные этапы сразу отдаём другим воркерам, не дожидаясь истечения аренды
+        released = await asyncio.to_thread(self.queue.release_owned)
+        if released:
+            logger.info(f"Возвращено в очередь задач остановленного воркера: {released}")
+
+    async def _heartbeat(self):
+        while True:
+            try:
+                await asyncio.to_thread(self.queue.heartbeat, list(self._pools))
+                recovered = await asyncio.to_thread(self.queue.recover)
+                if recovered:
+                    logger.warning(f"Забраны задачи воркеров без сердцебиения: {recovered}")
+                    for pool in self._events:
+                        self._events[pool].set()
+                await asyncio.to_thread(self.queue.purge_workers, WORKER_FORGET_SECONDS)
+            except Exception as e:
+                logger.warning(f"Не удалось обновить аренду задач: {e}")
+            await asyncio.sleep(JOB_HEARTBEAT_INTERVAL)
+
+    def notify(self, stage: str):
+        """Будит воркеров, выполняющих этап, не дожидаясь очередного опроса очереди"""
+        for pool, stages in self._pools.items():
+            if stage in stages:
+                self._events[pool].set()
+
+    def _claimable_stages(self, pool: str) -> list[str]:
+        stages = self._pools[pool]
+        # Backpressure: не скачиваем новые записи, пока транскрибация не разгребёт очередь.
+        # Уже начатые задачи доводим до транскрибации, чтобы не держать видео на диске
+        if STAGE_DOWNLOAD_VIDEO in stages and \
+                self.queue.count(STAGE_TRANSCRIBE, STATUS_PENDING) >= MAX_TRANSCRIBE_BACKLOG:
+            return [stage for stage in stages if stage != STAGE_DOWNLOAD_VIDEO]
+        return stages
+
+    async def _wait(self, pool: str):
+        event = self._events[pool]
+        try:
+            await asyncio.wait_for(event.wait(), JOB_POLL_INTERVAL)
+        except asyncio.TimeoutError:
+            pass
+        event.clear()
+
+    async def _worker(self, pool: str):
+        while True:
+            try:
+                await self._run_next(pool)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                # Ошибка очереди или колбэка не должна навсегда уменьшать пул: логируем и пробуем снова
+                worker_errors.inc(pool=pool)
+                logger.error(f"Ошибка воркера пула {pool}: {e}", exc_info=True)
+                await asyncio.sleep(WORKER_ERROR_BACKOFF)
+
+    async def _run_next(self, pool: str):
+        """Берёт одну задачу пула и выполняет её текущий этап; без задач ждёт сигнала или опроса"""
+        # Квоты арендаторов: занятая команда не забирает всех воркеров пула
+        job = await asyncio.to_thread(self._claim, pool)
+        if job is None:
+            await self._wait(pool)
+            return
+
+        job_id = job["id"]
+        stage = job["stage"]
+        payload = job["payload"]
+        started = time.perf_counter()
+        try:
+            payload = await asyncio.to_thread(run_stage, job_id, stage, payload)
+        except Exception as e:
+            stage_errors.inc(stage=stage)
+            await self._handle_failure(job_id, stage, payload, e)
+            return
+        stage_duration.observe(time.perf_counter() - started, stage=stage)
+
+        # Чекпоинт: payload с путями к артефактам сохраняется после каждого этапа
+        following = next_stage(stage)
+        if not await asyncio.to_thread(self.queue.advance, job_id, following, payload):
+            logger.warning(f"Аренда задачи {job_id} истекла во время этапа {stage} — результат отброшен")
+            return
+        if following == STAGE_DONE:
+            job_duration.observe(time.time() - job["created_at"])
+        self.notify(following)
+        if pool == "transcribe":
+            self.notify(STAGE_DOWNLOAD_VIDEO)
+
+    def _claim(self, pool: str) -> dict | None:
+        return self.queue.claim(self._claimable_stages(pool), get_tenants().quotas())
+
+    async def _handle_failure(self, job_id: int, stage: str, payload: dict, error: Exception):
+        error_msg = f"❌ Ошибка обработки записи: {str(error)}"
+        logger.error(f"Задача {job_id} упала на этапе {stage}: {error}", exc_info=error)
+        # Рабочие файлы не удаляем: повтор продолжит задачу с упавшего этапа
+        if not await asyncio.to_thread(self.queue.fail, job_id, str(error), payload):
+            logger.warning(f"Задача {job_id} уже передана другому воркеру — ошибку не фиксирую")
+            return
+        try:
+            await asyncio.to_thread(notify_tenant, payload.get("tenant"), error_msg)
+        except Exception:
+            pass
+        self.notify(STAGE_DOWNLOAD_VIDEO)
+        if self.on_job_failed:
+            # Колбэк ходит в хранилище дедупликации (SQLite или Redis) — не в event loop
+            await asyncio.to_thread(self.on_job_failed, payload.get("meeting_uuid") or "")
@@ -0,0 +1,425 @@
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import threading
+from contextlib import contextmanager
+from collections import deque
+
+JOBS_DB_PATH = os.getenv("JOBS_DB_PATH", "jobs.db")
+# Аренда задачи воркером: воркер продлевает её сердцебиением, а задачу воркера,
+# который не продлил аренду вовремя (упал, завис, потерял сеть), забирает другой
+JOB_LEASE_SECONDS = float(os.getenv("JOB_LEASE_SECONDS", "60"))
+# Арендатор задач, поставленных без таблицы арендаторов и до её появления
+DEFAULT_TENANT = "default"
+
+# Этапы обработки записи по порядку. После каждого этапа состояние задачи сохраняется,
+# поэтому повтор или перезапуск продолжает работу с последнего незавершённого этапа
+STAGE_DOWNLOAD_VIDEO = "download_video"
+STAGE_DELIVER_VIDEO = "deliver_video"
+STAGE_OBTAIN_AUDIO = "obtain_audio"
+STAGE_TRANSCRIBE = "transcribe"
+STAGE_SUMMARIZE = "summarize"
+STAGE_DELIVER = "deliver"
+STAGE_DONE = "done"
+STAGES = [
+    STAGE_DOWNLOAD_VIDEO,
+    STAGE_DELIVER_VIDEO,
+    STAGE_OBTAIN_AUDIO,
+    STAGE_TRANSCRIBE,
+    STAGE_SUMMARIZE,
+    STAGE_DELIVER,
+]
+
+STATUS_PENDING = "pending"
+STATUS_RUNNING = "running"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+# Сколько последних ожиданий учитывать при расчёте среднего времени ожидания этапа
+WAIT_HISTORY_SIZE = 100
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    meeting_uuid TEXT,
+    tenant TEXT NOT NULL DEFAULT 'default',
+    payload TEXT NOT NULL,
+    stage TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL,
+    stage_entered_at REAL NOT NULL,
+    started_at REAL,
+    worker_id TEXT,
+    lease_expires_at REAL
+);
+CREATE INDEX IF NOT EXISTS jobs_stage_status ON jobs (stage, status, id);
+CREATE INDEX IF NOT EXISTS jobs_meeting ON jobs (meeting_uuid);
+CREATE TABLE IF NOT EXISTS workers (
+    id TEXT PRIMARY KEY,
+    hostname TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    pools TEXT NOT NULL,
+    started_at REAL NOT NULL,
+    heartbeat_at REAL NOT NULL
+);
+"""
+
+
+def next_stage(stage: str) -> str:
+    index = STAGES.index(stage)
+    return STAGES[index + 1] if index + 1 < len(STAGES) else STAGE_DONE
+
+
+def _job_from_row(row: sqlite3.Row) -> dict:
+    job = dict(row)
+    job["payload"] = json.loads(job["payload"])
+    return job
+
+
+class JobQueue:
+    """Персистентная очередь задач обработки записей на SQLite.
+
+    Задача хранит payload (описание файлов записи и артефакты этапов),
+    текущий этап и статус, поэтому переживает перезапуск процесса.
+    Очередь общая для API и отдельных воркеров (python -m worker): задачу захватывает
+    один процесс под аренду, и только владелец аренды может зафиксировать результат этапа.
+    """
+
+    def __init__(self, db_path: str = JOBS_DB_PATH, worker_id: str | None = None):
+        # Суффикс отличает перезапущенный процесс с тем же hostname и pid (PID 1 в контейнере)
+        # от предыдущего: иначе новый процесс продлевал бы аренду задач, которые не выполняет
+        self.worker_id = worker_id or f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(db_path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+        self._migrate()
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_tenant_status ON jobs (tenant, status)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_worker ON jobs (worker_id, status)")
+        self._waits = {stage: deque(maxlen=WAIT_HISTORY_SIZE) for stage in STAGES}
+        # Когда арендатор последний раз получал воркера: свободный воркер достаётся тому,
+        # кто ждёт дольше всех, и задачи разных команд выполняются по очереди
+        self._last_claimed = {}
+
+    def _migrate(self):
+        """
+        Добавляет столбцы, которых нет в базах прежних версий. Несколько процессов могут
+        стартовать одновременно, поэтому столбцы проверяются заново уже под блокировкой записи
+        """
+        with self._transaction():
+            columns = [row["name"] for row in self._conn.execute("PRAGMA table_info(jobs)")]
+            if "tenant" not in columns:
+                self._conn.execute(f"ALTER TABLE jobs ADD COLUMN tenant TEXT NOT NULL DEFAULT '{DEFAULT_TENANT}'")
+            if "worker_id" not in columns:
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN worker_id TEXT")
+            if "lease_expires_at" not in columns:
+                self._conn.execute("ALTER TABLE jobs ADD COLUMN lease_expires_at REAL")
+
+    @contextmanager
+    def _transaction(self):
+        """
+        Транзакция с блокировкой записи с самого начала: чтение и обновление в ней
+        атомарны и относительно других процессов, работающих с той же базой
+        """
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def enqueue(self, meeting_uuid: str | None, payload: dict, tenant: str = DEFAULT_TENANT) -> int | None:
+        """
+        Добавляет задачу. Возвращает None, если по встрече уже есть активная задача.
+        Упавшая задача по той же встрече не создаётся заново, а продолжается с этапа,
+        на котором упала; свежие данные webhook (например, download_token) подменяют старые.
+        """
+        now = time.time()
+        with self._transaction():
+            if meeting_uuid:
+                row = self._conn.execute(
+                    "SELECT * FROM jobs WHERE meeting_uuid = ? AND status IN (?, ?, ?) ORDER BY id DESC LIMIT 1",
+                    (meeting_uuid, STATUS_PENDING, STATUS_RUNNING, STATUS_FAILED),
+                ).fetchone()
+                if row and row["status"] != STATUS_FAILED:
+                    return None
+                if row:
+                    merged = {**json.loads(row["payload"]), **payload}
+                    self._conn.execute(
+                        "UPDATE jobs SET status = ?, error = NULL, tenant = ?, payload = ?, stage_entered_at = ?, "
+                        "updated_at = ? WHERE id = ?",
+                        (STATUS_PENDING, tenant, json.dumps(merged), now, now, row["id"]),
+                    )
+                    return row["id"]
+            cur = self._conn.execute(
+                "INSERT INTO jobs (meeting_uuid, tenant, payload, stage, status, created_at, updated_at, "
+                "stage_entered_at) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (meeting_uuid, tenant, json.dumps(payload), STAGES[0], STATUS_PENDING, now, now, now),
+            )
+            return cur.lastrowid
+
+    def claim(self, stages: list[str], quotas: dict[str, int] | None = None) -> dict | None:
+        """
+        Забирает ожидающую задачу на одном из этапов и помечает её как выполняемую.
+        Арендаторы, у которых на этих этапах уже выполняется quotas[арендатор] задач, пропускаются;
+        из остальных воркер получает тот, у кого меньше выполняемых задач и кто дольше ждал,
+        а внутри арендатора задачи идут по порядку поступления.
+        """
+        now = time.time()
+        quotas = quotas or {}
+        placeholders = ", ".join("?" for _ in stages)
+        with self._transaction():
+            oldest = self._conn.execute(
+                f"SELECT tenant, MIN(id) FROM jobs WHERE stage IN ({placeholders}) AND status = ? GROUP BY tenant",
+                (*stages, STATUS_PENDING),
+            ).fetchall()
+            if not oldest:
+                return None
+            running = dict(self._conn.execute(
+                f"SELECT tenant, COUNT(*) FROM jobs WHERE stage IN ({placeholders}) AND status = ? GROUP BY tenant",
+                (*stages, STATUS_RUNNING),
+            ).fetchall())
+            candidates = [
+                (running.get(tenant, 0), self._last_claimed.get(tenant, 0.0), job_id, tenant)
+                for tenant, job_id in oldest
+                if not quotas.get(tenant) or running.get(tenant, 0) < quotas[tenant]
+            ]
+            if not candidates:
+                return None
+            _, _, job_id, tenant = min(candidates)
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            self._last_claimed[tenant] = now
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = ?, updated_at = ?, worker_id = ?, lease_expires_at = ? "
+                "WHERE id = ?",
+                (STATUS_RUNNING, now, now, self.worker_id, now + JOB_LEASE_SECONDS, row["id"]),
+            )
+            self._waits[row["stage"]].append(now - row["stage_entered_at"])
+        return _job_from_row(row)
+
+    def advance(self, job_id: int, next_stage: str, payload: dict) -> bool:
+        """
+        Фиксирует успешный этап: сохраняет payload с артефактами и переводит задачу дальше.
+        False — аренда задачи истекла и задачу уже забрал другой воркер; результат отбрасывается
+        """
+        status = STATUS_DONE if next_stage == STAGE_DONE else STATUS_PENDING
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET stage = ?, status = ?, payload = ?, stage_entered_at = ?, started_at = NULL, "
+                "updated_at = ?, worker_id = NULL, lease_expires_at = NULL "
+                "WHERE id = ? AND status = ? AND worker_id = ?",
+                (next_stage, status, json.dumps(payload), now, now, job_id, STATUS_RUNNING, self.worker_id),
+            )
+            return cur.rowcount > 0
+
+    def fail(self, job_id: int, error: str, payload: dict | None = None) -> bool:
+        """
+        Помечает задачу упавшей; этап и артефакты сохраняются для повтора.
+        False — задача уже не принадлежит этому воркеру
+        """
+        now = time.time()
+        with self._lock:
+            if payload is None:
+                cur = self._conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, updated_at = ?, worker_id = NULL, lease_expires_at = NULL "
+                    "WHERE id = ? AND status = ? AND worker_id = ?",
+                    (STATUS_FAILED, error, now, job_id, STATUS_RUNNING, self.worker_id),
+                )
+            else:
+                cur = self._conn.execute(
+                    "UPDATE jobs SET status = ?, error = ?, payload = ?, updated_at = ?, worker_id = NULL, "
+                    "lease_expires_at = NULL WHERE id = ? AND status = ? AND worker_id = ?",
+                    (STATUS_FAILED, error, json.dumps(payload), now, job_id, STATUS_RUNNING, self.worker_id),
+                )
+            return cur.rowcount > 0
+
+    def get(self, job_id: int) -> dict | None:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return _job_from_row(row) if row else None
+
+    def list_jobs(self, status: str | None = None, limit: int = 50) -> list[dict]:
+        query = "SELECT * FROM jobs"
+        params = []
+        if status:
+            query += " WHERE status = ?"
+            params.append(status)
+        query += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(query, params).fetchall()
+        return [_job_from_row(row) for row in rows]
+
+    def rerun(self, job_id: int, stage: str, reset_fields: tuple[str, ...] = ()) -> bool:
+        """
+        Ставит задачу в очередь с указанного этапа. Выполняемую задачу не трогает.
+        reset_fields — поля payload, которые удаляются (например, отметки об уже отправленном)
+        """
+        now = time.time()
+        payload_expr = f"json_remove(payload, {', '.join('?' for _ in reset_fields)})" if reset_fields else "payload"
+        with self._lock:
+            cur = self._conn.execute(
+                f"UPDATE jobs SET stage = ?, status = ?, error = NULL, stage_entered_at = ?, started_at = NULL, "
+                f"updated_at = ?, payload = {payload_expr} WHERE id = ? AND status != ?",
+                (stage, STATUS_PENDING, now, now, *(f"$.{field}" for field in reset_fields), job_id, STATUS_RUNNING),
+            )
+            return cur.rowcount > 0
+
+    def recover(self) -> int:
+        """
+        Возвращает в очередь задачи, чей воркер перестал продлевать аренду: процесс упал,
+        перезапустился или завис. Задачи живых воркеров, в том числе других процессов, не трогает
+        """
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL, worker_id = NULL, lease_expires_at = NULL, "
+                "updated_at = ? WHERE status = ? AND (lease_expires_at IS NULL OR lease_expires_at < ?)",
+                (STATUS_PENDING, now, STATUS_RUNNING, now),
+            )
+            return cur.rowcount
+
+    def heartbeat(self, pools: list[str]) -> int:
+        """Отмечает воркер живым и продлевает аренду его задач; возвращает число продлённых задач"""
+        now = time.time()
+        with self._lock:
+            self._conn.execute(
+                "INSERT INTO workers (id, hostname, pid, pools, started_at, heartbeat_at) VALUES (?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET pools = excluded.pools, heartbeat_at = excluded.heartbeat_at",
+                (self.worker_id, socket.gethostname(), os.getpid(), ",".join(pools), now, now),
+            )
+            cur = self._conn.execute(
+                "UPDATE jobs SET lease_expires_at = ? WHERE worker_id = ? AND status = ?",
+                (now + JOB_LEASE_SECONDS, self.worker_id, STATUS_RUNNING),
+            )
+            return cur.rowcount
+
+    def release_owned(self) -> int:
+        """Возвращает в очередь задачи этого воркера и снимает его с учёта — при штатной остановке"""
+        now = time.time()
+        with self._lock:
+            cur = self._conn.execute(
+                "UPDATE jobs SET status = ?, started_at = NULL, worker_id = NULL, lease_expires_at = NULL, "
+                "updated_at = ? WHERE worker_id = ? AND status = ?",
+                (STATUS_PENDING, now, self.worker_id, STATUS_RUNNING),
+            )
+            self._conn.execute("DELETE FROM workers WHERE id = ?", (self.worker_id,))
+            return cur.rowcount
+
+    def list_workers(self) -> list[dict]:
+        """Воркеры с временем последнего сердцебиения и выполняемыми задачами"""
+        now = time.time()
+        with self._lock:
+            workers = [dict(row) for row in self._conn.execute("SELECT * FROM workers ORDER BY started_at")]
+            running = self._conn.execute(
+                "SELECT worker_id, id, stage FROM jobs WHERE status = ? AND worker_id IS NOT NULL", (STATUS_RUNNING,)
+            ).fetchall()
+        for worker in workers:
+            worker["pools"] = worker["pools"].split(",") if worker["pools"] else []
+            worker["heartbeat_age_seconds"] = round(now - worker["heartbeat_at"], 1)
+            worker["alive"] = worker["heartbeat_age_seconds"] < JOB_LEASE_SECONDS
+            worker["jobs"] = [
+                {"job_id": row["id"], "stage": row["stage"]} for row in running if row["worker_id"] == worker["id"]
+            ]
+        return workers
+
+    def purge_workers(self, max_age: float) -> int:
+        """Удаляет записи о воркерах, не подававших сердцебиения дольше max_age секунд"""
+        with self._lock:
+            cur = self._conn.execute("DELETE FROM workers WHERE heartbeat_at < ?", (time.time() - max_age,))
+            return cur.rowcount
+
+    def count(self, stage: str | None = None, status: str | None = None) -> int:
+        query = "SELECT COUNT(*) FROM jobs WHERE 1 = 1"
+        params = []
+        if stage:
+            query += " AND stage = ?"
+            params.append(stage)
+        if status:
+            query += " AND status = ?"
+            params.append(status)
+        with self._lock:
+            return self._conn.execute(query, params).fetchone()[0]
+
+    def active_count(self, tenant: str | None = None) -> int:
+        """Количество незавершённых задач (ожидающих и выполняемых), всего или у арендатора"""
+        query = "SELECT COUNT(*) FROM jobs WHERE status IN (?, ?)"
+        params = [STATUS_PENDING, STATUS_RUNNING]
+        if tenant:
+            query += " AND tenant = ?"
+            params.append(tenant)
+        with self._lock:
+            return self._conn.execute(query, params).fetchone()[0]
+
+    def stats(self) -> dict:
+        """Глубина очереди, выполняемые задачи и время ожидания по этапам"""
+        now = time.time()
+        stages = {}
+        with self._lock:
+            for stage in STAGES:
+                pending, oldest = self._conn.execute(
+                    "SELECT COUNT(*), MIN(stage_entered_at) FROM jobs WHERE stage = ? AND status = ?",
+                    (stage, STATUS_PENDING),
+                ).fetchone()
+                running = self._conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE stage = ? AND status = ?",
+                    (stage, STATUS_RUNNING),
+                ).fetchone()[0]
+                waits = self._waits[stage]
+                stages[stage] = {
+                    "pending": pending,
+                    "running": running,
+                    "oldest_pending_seconds": round(now - oldest, 1) if oldest else 0.0,
+                    "avg_wait_seconds": round(sum(waits) / len(waits), 1) if waits else 0.0,
+                }
+            done = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ?", (STATUS_DONE,)
+            ).fetchone()[0]
+            failed = self._conn.execute(
+                "SELECT COUNT(*) FROM jobs WHERE status = ?", (STATUS_FAILED,)
+            ).fetchone()[0]
+            tenants = {}
+            for tenant, status, count in self._conn.execute(
+                "SELECT tenant, status, COUNT(*) FROM jobs WHERE status IN (?, ?) GROUP BY tenant, status",
+                (STATUS_PENDING, STATUS_RUNNING),
+            ):
+                tenants.setdefault(tenant, {STATUS_PENDING: 0, STATUS_RUNNING: 0})[status] = count
+        return {
+            "queue_depth": sum(s["pending"] for s in stages.values()),
+            "in_flight": sum(s["running"] for s in stages.values()),
+            "done": done,
+            "failed": failed,
+            "stages": stages,
+            "tenants": tenants,
+        }
+
+    def collect(self) -> list[tuple]:
+        """Глубина очереди по этапам для /metrics"""
+        stats = self.stats()
+        samples = [
+            ("jobs", "gauge", "Задачи в очереди по статусам", stats["queue_depth"], {"status": STATUS_PENDING}),
+            ("jobs", "gauge", "Задачи в очереди по статусам", stats["in_flight"], {"status": STATUS_RUNNING}),
+            ("jobs", "gauge", "Задачи в очереди по статусам", stats["done"], {"status": STATUS_DONE}),
+            ("jobs", "gauge", "Задачи в очереди по статусам", stats["failed"], {"status": STATUS_FAILED}),
+        ]
+        for stage, stage_stats in stats["stages"].items():
+            samples.append(("stage_pending_jobs", "gauge", "Задачи, ожидающие этапа",
+                            stage_stats["pending"], {"stage": stage}))
+            samples.append(("stage_running_jobs", "gauge", "Задачи, выполняющие этап",
+                            stage_stats["running"], {"stage": stage}))
+            samples.append(("stage_oldest_pending_seconds", "gauge", "Возраст самой старой ожидающей задачи",
+                            stage_stats["oldest_pending_seconds"], {"stage": stage}))
+        for tenant, tenant_stats in stats["tenants"].items():
+            for status, count in tenant_stats.items():
+                samples.append(("tenant_jobs", "gauge", "Незавершённые задачи арендатора",
+                                count, {"tenant": tenant, "status": status}))
+        return samples
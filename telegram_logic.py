@@ -1,107 +1,470 @@
 import os
+import re
+import mmap
+import time
+import uuid
+import logging
+import threading
+import contextvars
 import requests
+from contextlib import contextmanager
+from requests.adapters import HTTPAdapter
+from metrics_logic import register_collector, span
+
+logger = logging.getLogger(__name__)
 
 TELEGRAM_BOT_TOKEN = os.getenv("TELEGRAM_BOT_TOKEN")
 CHAT_ID = os.getenv("TELEGRAM_CHAT_ID")
 
+# Публичный Bot API принимает файлы до 50 МБ; собственный Local Bot API server — до 2000 МБ
+TELEGRAM_PUBLIC_API_URL = "https://api.telegram.org"
+TELEGRAM_API_URL = os.getenv("TELEGRAM_API_URL", TELEGRAM_PUBLIC_API_URL).rstrip("/")
+TELEGRAM_PUBLIC_UPLOAD_LIMIT = 50 * 1024 * 1024
+TELEGRAM_LOCAL_UPLOAD_LIMIT = 2000 * 1024 * 1024
+TELEGRAM_MAX_UPLOAD_SIZE = (
+    TELEGRAM_PUBLIC_UPLOAD_LIMIT if TELEGRAM_API_URL == TELEGRAM_PUBLIC_API_URL else TELEGRAM_LOCAL_UPLOAD_LIMIT
+)
+# Размер блока, которым файл уходит в сокет при загрузке
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
 # Максимальная длина сообщения в Telegram (4096 символов)
 MAX_MESSAGE_LENGTH = 4096
+# Запас под заголовок «Часть i/n» и маркеры разметки, закрываемые на границе частей
+MESSAGE_PART_RESERVE = 100
+# Экранированный символ, блок кода и маркеры сущностей legacy Markdown
+_MARKDOWN_TOKEN = re.compile(r"\\.|```|[*_`]")
 
-def send_message_to_telegram(text: str):
-    """Отправляет текстовое сообщение в Telegram группу"""
-    if not TELEGRAM_BOT_TOKEN or not CHAT_ID:
+# Лимиты Bot API: ~30 сообщений в секунду на бота, 1 в секунду в личный чат, 20 в минуту в группу
+TELEGRAM_GLOBAL_INTERVAL = 1 / 30
+TELEGRAM_PRIVATE_CHAT_INTERVAL = 1.0
+TELEGRAM_GROUP_CHAT_INTERVAL = 3.0
+TELEGRAM_MAX_RETRIES = int(os.getenv("TELEGRAM_MAX_RETRIES", "5"))
+TELEGRAM_TIMEOUT = float(os.getenv("TELEGRAM_TIMEOUT", "60"))
+# Загрузка больших файлов может идти долго, поэтому таймаут отдельный
+TELEGRAM_UPLOAD_TIMEOUT = float(os.getenv("TELEGRAM_UPLOAD_TIMEOUT", "600"))
+
+_session = None
+_session_lock = threading.Lock()
+# Бот и чат текущей задачи: у каждого арендатора свои (см. tenant_logic)
+_target = contextvars.ContextVar("telegram_target", default=None)
+
+
+class FileTooLargeError(ValueError):
+    """Файл больше лимита загрузки текущего Bot API сервера"""
+
+
+class _TelegramAdapter(HTTPAdapter):
+    def init_poolmanager(self, *args, **kwargs):
+        # Крупный блок записи в сокет вместо 16 КБ по умолчанию ускоряет загрузку файлов
+        kwargs["blocksize"] = UPLOAD_CHUNK_SIZE
+        super().init_poolmanager(*args, **kwargs)
+
+
+def get_telegram_session() -> requests.Session:
+    """Общая сессия с пулом keep-alive соединений к Bot API"""
+    global _session
+    with _session_lock:
+        if _session is None:
+            session = requests.Session()
+            adapter = _TelegramAdapter(pool_connections=1, pool_maxsize=10)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+class MultipartFileBody:
+    """
+    Тело multipart/form-data с файлом для потоковой загрузки.
+    Файл отображается в память (mmap) и отдаётся срезами memoryview без копирования,
+    длина известна заранее, поэтому запрос уходит с Content-Length, а не chunked.
+    """
+
+    def __init__(self, fields: dict, file_field: str, file_path: str):
+        self.boundary = uuid.uuid4().hex
+        head = "".join(
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'
+            for name, value in fields.items()
+        )
+        head += (
+            f'--{self.boundary}\r\nContent-Disposition: form-data; name="{file_field}"; '
+            f'filename="{os.path.basename(file_path)}"\r\nContent-Type: application/octet-stream\r\n\r\n'
+        )
+        tail = f"\r\n--{self.boundary}--\r\n"
+
+        self._file = open(file_path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else None
+        self._parts = [
+            memoryview(head.encode("utf-8")),
+            memoryview(self._map) if self._map else memoryview(b""),
+            memoryview(tail.encode("utf-8")),
+        ]
+        self._length = sum(len(part) for part in self._parts)
+        self._part = 0
+        self._pos = 0
+
+    @property
+    def content_type(self) -> str:
+        return f"multipart/form-data; boundary={self.boundary}"
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(UPLOAD_CHUNK_SIZE)
+            if not chunk:
+                return
+            yield chunk
+
+    def read(self, size: int = -1):
+        while self._part < len(self._parts):
+            part = self._parts[self._part]
+            if self._pos < len(part):
+                end = len(part) if size is None or size < 0 else min(len(part), self._pos + size)
+                chunk = part[self._pos:end]
+                self._pos = end
+                return chunk
+            self._part += 1
+            self._pos = 0
+        return b""
+
+    def close(self):
+        for part in self._parts:
+            part.release()
+        if self._map:
+            try:
+                self._map.close()
+            except BufferError:
+                # Срезы ещё могут быть у HTTP-клиента; mmap освободится сборщиком мусора
+                pass
+        self._file.close()
+
+
+class TelegramRateLimiter:
+    """Планировщик отправки: выдерживает глобальный лимит каждого бота и лимит на каждый чат"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._global_next = {}
+        self._chat_next = {}
+
+    @staticmethod
+    def _chat_interval(chat_id) -> float:
+        # У групп и каналов отрицательный chat_id
+        return TELEGRAM_GROUP_CHAT_INTERVAL if str(chat_id).startswith("-") else TELEGRAM_PRIVATE_CHAT_INTERVAL
+
+    def acquire(self, chat_id, bot_token: str = "") -> float:
+        """Ждёт свой слот отправки и возвращает время ожидания в секундах"""
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._global_next.get(bot_token, 0.0), self._chat_next.get(chat_id, 0.0))
+            self._global_next[bot_token] = slot + TELEGRAM_GLOBAL_INTERVAL
+            self._chat_next[chat_id] = slot + self._chat_interval(chat_id)
+        wait = slot - now
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    def block(self, chat_id, seconds: float):
+        """Откладывает отправку в чат после ответа 429 с retry_after"""
+        with self._lock:
+            until = time.monotonic() + seconds
+            self._chat_next[chat_id] = max(self._chat_next.get(chat_id, 0.0), until)
+
+
+class TelegramMetrics:
+    """Счётчики отправки: число запросов, ошибки, повторы, время отправки и ожидания лимитов"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.errors = 0
+        self.retries = 0
+        self.rate_limited = 0
+        self.send_seconds_total = 0.0
+        self.send_seconds_max = 0.0
+        self.throttled_seconds_total = 0.0
+        self.uploads = 0
+        self.upload_bytes_total = 0
+
+    def observe_upload(self, size: int):
+        with self._lock:
+            self.uploads += 1
+            self.upload_bytes_total += size
+
+    def observe_send(self, seconds: float):
+        with self._lock:
+            self.requests += 1
+            self.send_seconds_total += seconds
+            self.send_seconds_max = max(self.send_seconds_max, seconds)
+
+    def observe_throttle(self, seconds: float):
+        with self._lock:
+            self.throttled_seconds_total += seconds
+
+    def increment(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "errors": self.errors,
+                "retries": self.retries,
+                "rate_limited": self.rate_limited,
+                "send_seconds_avg": round(self.send_seconds_total / self.requests, 3) if self.requests else 0.0,
+                "send_seconds_max": round(self.send_seconds_max, 3),
+                "throttled_seconds_total": round(self.throttled_seconds_total, 3),
+                "uploads": self.uploads,
+                "upload_bytes_total": self.upload_bytes_total,
+            }
+
+    def collect(self) -> list[tuple]:
+        """Счётчики для /metrics"""
+        with self._lock:
+            return [
+                ("telegram_requests_total", "counter", "Запросы к Bot API", self.requests, None),
+                ("telegram_errors_total", "counter", "Запросы к Bot API, завершившиеся ошибкой", self.errors, None),
+                ("telegram_retries_total", "counter", "Повторы запросов к Bot API", self.retries, None),
+                ("telegram_rate_limited_total", "counter", "Ответы 429 от Bot API", self.rate_limited, None),
+                ("telegram_send_seconds_total", "counter", "Суммарное время запросов к Bot API",
+                 round(self.send_seconds_total, 3), None),
+                ("telegram_throttled_seconds_total", "counter", "Суммарное ожидание лимитов Telegram",
+                 round(self.throttled_seconds_total, 3), None),
+                ("telegram_upload_bytes_total", "counter", "Байты файлов, отправленных в Telegram",
+                 self.upload_bytes_total, None),
+            ]
+
+
+rate_limiter = TelegramRateLimiter()
+metrics = TelegramMetrics()
+register_collector(metrics.collect)
+
+
+@contextmanager
+def telegram_target(bot_token: str | None, chat_id: str | None):
+    """Направляет отправку в текущем потоке в указанные бот и чат вместо заданных в окружении"""
+    token = _target.set((bot_token or TELEGRAM_BOT_TOKEN, chat_id or CHAT_ID))
+    try:
+        yield
+    finally:
+        _target.reset(token)
+
+
+def _current_target() -> tuple[str | None, str | None]:
+    return _target.get() or (TELEGRAM_BOT_TOKEN, CHAT_ID)
+
+
+def _check_config() -> str:
+    """Проверяет, что бот и чат заданы, и возвращает chat_id для отправки"""
+    bot_token, chat_id = _current_target()
+    if not bot_token or not chat_id:
         raise ValueError("TELEGRAM_BOT_TOKEN и TELEGRAM_CHAT_ID должны быть установлены")
-    
-    url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-    
-    # Если сообщение слишком длинное, разбиваем на части
-    if len(text) > MAX_MESSAGE_LENGTH:
-        # Разбиваем по абзацам, стараясь не разрывать структуру
-        parts = []
-        current_part = ""
-        
-        for line in text.split('\n'):
-            if len(current_part) + len(line) + 1 > MAX_MESSAGE_LENGTH - 100:
-                if current_part:
-                    parts.append(current_part)
-                    current_part = line + '\n'
+    return chat_id
+
+
+def call_telegram_api(method: str, data: dict, file_field: str | None = None, file_path: str | None = None) -> dict:
+    """
+    Вызывает метод Bot API через общую сессию с учётом лимитов.
+    На 429 ждёт retry_after, на сетевые ошибки и 5xx повторяет с экспоненциальной паузой.
+    """
+    bot_token = _current_target()[0]
+    url = f"{TELEGRAM_API_URL}/bot{bot_token}/{method}"
+    chat_id = data.get("chat_id")
+    session = get_telegram_session()
+    timeout = TELEGRAM_UPLOAD_TIMEOUT if file_path else TELEGRAM_TIMEOUT
+    upload_size = os.path.getsize(file_path) if file_path else 0
+
+    with span(f"telegram.{method}", bytes=upload_size) as attributes:
+        for attempt in range(TELEGRAM_MAX_RETRIES + 1):
+            metrics.observe_throttle(rate_limiter.acquire(chat_id, bot_token))
+            started = time.monotonic()
+            try:
+                if file_path:
+                    # Тело собираем на каждой попытке, чтобы повтор отправлял файл с начала
+                    body = MultipartFileBody(data, file_field, file_path)
+                    try:
+                        resp = session.post(
+                            url, data=body, headers={"Content-Type": body.content_type}, timeout=timeout
+                        )
+                    finally:
+                        body.close()
                 else:
-                    # Если одна строка слишком длинная, обрезаем
-                    parts.append(line[:MAX_MESSAGE_LENGTH - 100] + '...')
-                    current_part = ''
-            else:
-                current_part += line + '\n'
-        
-        if current_part:
-            parts.append(current_part)
-        
-        # Отправляем все части
-        results = []
-        for i, part in enumerate(parts, 1):
-            if len(parts) > 1:
-                part = f"*Часть {i}/{len(parts)}*\n\n{part}"
-            payload = {"chat_id": CHAT_ID, "text": part, "parse_mode": "Markdown"}
-            resp = requests.post(url, json=payload)
+                    resp = session.post(url, json=data, timeout=timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == TELEGRAM_MAX_RETRIES:
+                    metrics.increment("errors")
+                    raise
+                delay = min(2 ** attempt, 60)
+                logger.warning(f"Telegram {method}: сетевая ошибка ({e}), повтор через {delay} с")
+                metrics.increment("retries")
+                time.sleep(delay)
+                continue
+            finally:
+                metrics.observe_send(time.monotonic() - started)
+                attributes["attempts"] = attempt + 1
+
+            if resp.status_code == 429 and attempt < TELEGRAM_MAX_RETRIES:
+                retry_after = resp.json().get("parameters", {}).get("retry_after", 1)
+                logger.warning(f"Telegram {method}: лимит запросов, повтор через {retry_after} с")
+                metrics.increment("rate_limited")
+                metrics.increment("retries")
+                rate_limiter.block(chat_id, retry_after)
+                continue
+            if resp.status_code >= 500 and attempt < TELEGRAM_MAX_RETRIES:
+                delay = min(2 ** attempt, 60)
+                logger.warning(f"Telegram {method}: ошибка сервера {resp.status_code}, повтор через {delay} с")
+                metrics.increment("retries")
+                time.sleep(delay)
+                continue
+
+            if not resp.ok:
+                metrics.increment("errors")
             resp.raise_for_status()
-            results.append(resp.json())
-        
-        return results
-    else:
-        payload = {"chat_id": CHAT_ID, "text": text, "parse_mode": "Markdown"}
-        resp = requests.post(url, json=payload)
-        resp.raise_for_status()
-        return resp.json()
+            if upload_size:
+                metrics.observe_upload(upload_size)
+            return resp.json()
+
+
+def _markdown_state(text: str, state: str | None) -> str | None:
+    """
+    Открытая сущность legacy Markdown Bot API после text: "*", "_", "`", "```" или None.
+    Сущности не вкладываются друг в друга, внутри кода другие маркеры — обычные символы.
+    """
+    for match in _MARKDOWN_TOKEN.finditer(text):
+        token = match.group()
+        if token.startswith("\\"):
+            continue
+        if token == "```":
+            if state in (None, "```"):
+                state = None if state else "```"
+        elif state != "```" and state in (None, token):
+            state = None if state else token
+    return state
+
+
+def _split_long_line(line: str, width: int) -> list[str]:
+    """Режет строку длиннее width по пробелам, а слова длиннее width — посимвольно"""
+    pieces = []
+    start = 0
+    while len(line) - start > width:
+        cut = line.rfind(" ", start, start + width)
+        if cut <= start:
+            cut = start + width
+        pieces.append(line[start:cut])
+        start = cut + 1 if line[cut:cut + 1] == " " else cut
+    pieces.append(line[start:])
+    return pieces
+
+
+def split_message(text: str, limit: int = MAX_MESSAGE_LENGTH - MESSAGE_PART_RESERVE) -> list[str]:
+    """
+    Делит текст на части не длиннее limit за один проход: по строкам, длинные строки — по словам.
+    Разметка не ломается: сущность, открытая на границе части, закрывается в её конце
+    и открывается заново в начале следующей.
+    """
+    marker_reserve = 8
+    parts = []
+    current = []
+    current_length = 0
+    state = None
+
+    for line in text.split("\n"):
+        for piece in _split_long_line(line, limit - marker_reserve):
+            reopen = ""
+            if current and current_length + 1 + len(piece) + marker_reserve > limit:
+                if state == "```":
+                    current.append(state)
+                elif state:
+                    current[-1] += state
+                parts.append("\n".join(current))
+                current = [state] if state == "```" else []
+                current_length = len(state) if state == "```" else 0
+                reopen = state if state and state != "```" else ""
+            current_length += len(reopen) + len(piece) + (1 if current else 0)
+            current.append(reopen + piece)
+            state = _markdown_state(piece, state)
+    if current:
+        parts.append("\n".join(current))
+    return parts
+
+
+def send_message_to_telegram(text: str):
+    """Отправляет текстовое сообщение в Telegram группу"""
+    chat_id = _check_config()
+
+    if len(text) <= MAX_MESSAGE_LENGTH:
+        payload = {"chat_id": chat_id, "text": text, "parse_mode": "Markdown"}
+        return call_telegram_api("sendMessage", payload)
+
+    # Длинное сообщение уходит частями; темп отправки выдерживает планировщик
+    parts = split_message(text)
+    results = []
+    for i, part in enumerate(parts, 1):
+        if len(parts) > 1:
+            part = f"*Часть {i}/{len(parts)}*\n\n{part}"
+        payload = {"chat_id": chat_id, "text": part, "parse_mode": "Markdown"}
+        results.append(call_telegram_api("sendMessage", payload))
+    return results
 
 
 def send_file_to_telegram(file_path: str, caption: str = None):
-    """Отправляет файл (видео/аудио) в Telegram группу"""
-    if not TELEGRAM_BOT_TOKEN or not CHAT_ID:
-        raise ValueError("TELEGRAM_BOT_TOKEN и TELEGRAM_CHAT_ID должны быть установлены")
+    """
+    Отправляет файл (видео/аудио) в Telegram группу.
+    Файлы больше лимита сервера (50 МБ для публичного Bot API) не отправляются — см. delivery_logic.
+    """
+    chat_id = _check_config()
     
-    # Проверяем размер файла (лимит для sendVideo/sendAudio - 50MB, для sendDocument - 50MB)
     file_size = os.path.getsize(file_path)
-    max_size = 50 * 1024 * 1024  # 50MB
+    if file_size > TELEGRAM_MAX_UPLOAD_SIZE:
+        raise FileTooLargeError(
+            f"Файл {os.path.basename(file_path)} ({file_size // (1024 * 1024)} МБ) больше лимита "
+            f"Bot API ({TELEGRAM_MAX_UPLOAD_SIZE // (1024 * 1024)} МБ)"
+        )
     
     # Определяем тип файла по расширению
     file_ext = os.path.splitext(file_path)[1].lower()
-    file_name = os.path.basename(file_path)
     
-    # Для больших файлов используем sendDocument
-    if file_size > max_size:
-        url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendDocument"
-        with open(file_path, 'rb') as f:
-            files = {'document': (file_name, f)}
-            data = {'chat_id': CHAT_ID}
-            if caption:
-                data['caption'] = caption
-            resp = requests.post(url, files=files, data=data)
     # Для аудио файлов используем sendAudio
-    elif file_ext in ['.mp3', '.m4a', '.wav', '.ogg']:
-        url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendAudio"
-        with open(file_path, 'rb') as f:
-            files = {'audio': (file_name, f)}
-            data = {'chat_id': CHAT_ID}
-            if caption:
-                data['caption'] = caption
-            resp = requests.post(url, files=files, data=data)
+    if file_ext in ['.mp3', '.m4a', '.wav', '.ogg']:
+        method, field = "sendAudio", "audio"
     # Для видео файлов используем sendVideo
     elif file_ext in ['.mp4', '.mov', '.avi', '.mkv']:
-        url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendVideo"
-        with open(file_path, 'rb') as f:
-            files = {'video': (file_name, f)}
-            data = {'chat_id': CHAT_ID}
-            if caption:
-                data['caption'] = caption
-            resp = requests.post(url, files=files, data=data)
+        method, field = "sendVideo", "video"
     # Для остальных файлов используем sendDocument
     else:
-        url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendDocument"
-        with open(file_path, 'rb') as f:
-            files = {'document': (file_name, f)}
-            data = {'chat_id': CHAT_ID}
-            if caption:
-                data['caption'] = caption
-            resp = requests.post(url, files=files, data=data)
+        method, field = "sendDocument", "document"
     
-    resp.raise_for_status()
-    return resp.json()
+    data = {'chat_id': chat_id}
+    if caption:
+        data['caption'] = caption
+    return call_telegram_api(method, data, file_field=field, file_path=file_path)
+
+
+class StatusMessage:
+    """
+    Одно статусное сообщение на встречу, которое редактируется на месте
+    вместо отдельного сообщения на каждый шаг обработки.
+    """
+
+    def __init__(self, message_id: int | None = None):
+        self.message_id = message_id
+
+    def update(self, text: str):
+        chat_id = _check_config()
+        if self.message_id is not None:
+            payload = {"chat_id": chat_id, "message_id": self.message_id, "text": text, "parse_mode": "Markdown"}
+            try:
+                call_telegram_api("editMessageText", payload)
+                return
+            except requests.HTTPError as e:
+                # Текст не изменился — редактировать нечего
+                if "message is not modified" in e.response.text:
+                    return
+                # Сообщение удалили или оно слишком старое — отправляем новое
+                logger.warning(f"Не удалось обновить статусное сообщение: {e.response.text}")
+        result = call_telegram_api("sendMessage", {"chat_id": chat_id, "text": text, "parse_mode": "Markdown"})
+        self.message_id = result["result"]["message_id"]
@@ -0,0 +1,144 @@
+import os
+import re
+import json
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+# Таблица маршрутизации арендаторов (JSON). Без неё весь трафик идёт единственному
+# арендатору default, собранному из TELEGRAM_BOT_TOKEN, TELEGRAM_CHAT_ID и ZOOM_WEBHOOK_SECRET_TOKEN
+TENANTS_FILE = os.getenv("TENANTS_FILE", "")
+DEFAULT_TENANT = "default"
+
+_registry = None
+_registry_lock = threading.Lock()
+
+
+class Tenant:
+    """
+    Команда, обслуживаемая общим инстансом: по каким признакам webhook относится к ней,
+    каким секретом Zoom он подписан, куда отправлять результаты и сколько воркеров ей можно занять.
+    """
+
+    def __init__(self, config: dict):
+        self.name = config["name"]
+        self.account_ids = set(config.get("zoom_account_ids", []))
+        self.host_ids = set(config.get("zoom_host_ids", []))
+        self.host_emails = {email.lower() for email in config.get("zoom_host_emails", [])}
+        topic_pattern = config.get("topic_pattern")
+        self.topic_pattern = re.compile(topic_pattern, re.IGNORECASE) if topic_pattern else None
+        self.is_default = bool(config.get("default", False))
+        # Секреты можно не хранить в файле, а сослаться на переменную окружения: "$SALES_BOT_TOKEN"
+        self.webhook_secret = os.path.expandvars(
+            config.get("webhook_secret", os.getenv("ZOOM_WEBHOOK_SECRET_TOKEN", ""))
+        )
+        self.telegram_bot_token = os.path.expandvars(
+            config.get("telegram_bot_token", os.getenv("TELEGRAM_BOT_TOKEN", ""))
+        )
+        self.telegram_chat_id = str(config.get("telegram_chat_id", os.getenv("TELEGRAM_CHAT_ID", "")))
+        self.summary_prompt = config.get("summary_prompt")
+        # Квоты в общем пуле: сколько задач арендатора выполняется одновременно в каждом пуле
+        # воркеров и сколько может ждать в очереди; 0 — без ограничения
+        self.max_concurrent_jobs = int(config.get("max_concurrent_jobs", 0))
+        self.max_queued_jobs = int(config.get("max_queued_jobs", 0))
+
+    def matches(self, account_id: str | None, host_id: str | None, host_email: str | None, topic: str) -> bool:
+        """Webhook относится к арендатору, если совпал хотя бы один из заданных признаков"""
+        if account_id and account_id in self.account_ids:
+            return True
+        if host_id and host_id in self.host_ids:
+            return True
+        if host_email and host_email.lower() in self.host_emails:
+            return True
+        return bool(self.topic_pattern and self.topic_pattern.search(topic or ""))
+
+    def snapshot(self) -> dict:
+        """Настройки арендатора без секретов"""
+        return {
+            "name": self.name,
+            "default": self.is_default,
+            "telegram_chat_id": self.telegram_chat_id,
+            "signed": bool(self.webhook_secret),
+            "custom_prompt": bool(self.summary_prompt),
+            "max_concurrent_jobs": self.max_concurrent_jobs,
+            "max_queued_jobs": self.max_queued_jobs,
+        }
+
+
+class TenantRegistry:
+    """Таблица маршрутизации: арендаторы проверяются по порядку, первый совпавший получает встречу"""
+
+    def __init__(self, tenants: list[Tenant]):
+        names = [tenant.name for tenant in tenants]
+        if len(set(names)) != len(names):
+            raise ValueError(f"Имена арендаторов повторяются: {', '.join(names)}")
+        self.tenants = tenants
+        self._by_name = {tenant.name: tenant for tenant in tenants}
+        self._default = next((tenant for tenant in tenants if tenant.is_default), None)
+
+    def get(self, name: str | None) -> Tenant | None:
+        return self._by_name.get(name or DEFAULT_TENANT)
+
+    def route(self, data: dict) -> Tenant | None:
+        """Арендатор для webhook Zoom: по аккаунту, организатору или теме встречи, иначе арендатор по умолчанию"""
+        payload = data.get("payload", {})
+        object_data = payload.get("object", {})
+        account_id = payload.get("account_id") or object_data.get("account_id")
+        host_id = object_data.get("host_id")
+        host_email = object_data.get("host_email")
+        topic = object_data.get("topic", "")
+        for tenant in self.tenants:
+            if tenant.matches(account_id, host_id, host_email, topic):
+                return tenant
+        return self._default
+
+    def webhook_secrets(self) -> list[str]:
+        """Различные секреты Zoom, которыми может быть подписан webhook"""
+        return list(dict.fromkeys(tenant.webhook_secret for tenant in self.tenants if tenant.webhook_secret))
+
+    def allows_unsigned(self) -> bool:
+        """Есть арендатор без секрета — неподписанные webhook могут относиться к нему"""
+        return any(not tenant.webhook_secret for tenant in self.tenants)
+
+    def quotas(self) -> dict[str, int]:
+        return {tenant.name: tenant.max_concurrent_jobs for tenant in self.tenants if tenant.max_concurrent_jobs}
+
+
+def load_tenants(path: str = TENANTS_FILE) -> TenantRegistry:
+    """
+    Загружает таблицу арендаторов из JSON-файла {"tenants": [...]}.
+    Без файла — один арендатор default из переменных окружения, получающий все встречи.
+    """
+    if not path:
+        return TenantRegistry([Tenant({"name": DEFAULT_TENANT, "default": True})])
+    with open(path, encoding="utf-8") as f:
+        config = json.load(f)
+    tenants = [Tenant(tenant) for tenant in config.get("tenants", [])]
+    if not tenants:
+        raise ValueError(f"В {path} не описано ни одного арендатора")
+    for tenant in tenants:
+        if not tenant.telegram_bot_token or not tenant.telegram_chat_id:
+            raise ValueError(f"У арендатора {tenant.name} не заданы telegram_bot_token и telegram_chat_id")
+    logger.info(f"Загружено арендаторов: {len(tenants)} ({', '.join(tenant.name for tenant in tenants)})")
+    return TenantRegistry(tenants)
+
+
+def get_tenants() -> TenantRegistry:
+    """Ленивая загрузка таблицы арендаторов"""
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = load_tenants()
+        return _registry
+
+
+def get_tenant(name: str | None) -> Tenant:
+    """
+    Арендатор задачи. Если арендатора убрали из таблицы, пока задача ждала в очереди,
+    задача падает: отдавать запись и отчёт другому арендатору нельзя.
+    """
+    tenant = get_tenants().get(name)
+    if tenant is None:
+        raise ValueError(f"Арендатор {name} не найден в таблице арендаторов")
+    return tenant
@@ -1,8 +1,54 @@
 import os
+import re
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
 from openai import OpenAI
+from cache_logic import get_cache
+from metrics_logic import span, summary_duration
+
+logger = logging.getLogger(__name__)
+
+SUMMARY_MODEL = os.getenv("SUMMARY_MODEL", "gpt-4o-mini")
+# Совместимый с OpenAI сервер (прокси, локальная модель); пусто — api.openai.com
+OPENAI_BASE_URL = os.getenv("OPENAI_BASE_URL", "")
+OPENAI_TIMEOUT = float(os.getenv("OPENAI_TIMEOUT", "120"))
+OPENAI_MAX_RETRIES = int(os.getenv("OPENAI_MAX_RETRIES", "3"))
+# Размер фрагмента транскрипта в токенах: длинная встреча делится на фрагменты,
+# которые обрабатываются параллельно, а затем сводятся в один отчёт
+SUMMARY_CHUNK_TOKENS = int(os.getenv("SUMMARY_CHUNK_TOKENS", "6000"))
+SUMMARY_CONCURRENCY = int(os.getenv("SUMMARY_CONCURRENCY", "4"))
+SUMMARY_MAX_TOKENS = int(os.getenv("SUMMARY_MAX_TOKENS", "1000"))
+SUMMARY_PARTIAL_MAX_TOKENS = int(os.getenv("SUMMARY_PARTIAL_MAX_TOKENS", "600"))
+# Запас на заголовок «Фрагмент N:» и разделители, которыми выжимки склеиваются перед сворачиванием
+SUMMARY_PARTIAL_OVERHEAD_TOKENS = 16
+# Без tiktoken считаем токены грубо по символам; для кириллицы оценка с запасом
+CHARS_PER_TOKEN = 3
+# Заголовок раздела отчёта: «2. ✅ Решения», «## Задачи» или строка целиком жирным
+SECTION_HEADING = re.compile(r"^\s*(?:(\d+)[.)]\s|#{1,6}\s|\*[^*\n]+\*:?\s*$)")
+
+SUMMARY_SYSTEM_PROMPT = (
+    "Ты выступаешь как проджект-менеджер. На основе транскрипции встречи "
+    "сформируй понятный отчёт, который состоит из трёх блоков:\n"
+    "1. 📌 Краткое резюме (2-3 предложения о цели и статусе).\n"
+    "2. ✅ Принятые решения/согласованные моменты (буллеты).\n"
+    "3. 🧱 Планы и задачи (каждая строка в формате: • Задача — ответственный — срок/статус).\n"
+    "Указывай конкретику, избегай бессмысленных пунктов. Если информации нет — явно напиши 'нет данных'.\n"
+    "Реплики транскрипции начинаются с времени и метки говорящего («Спикер 2: ...»). Ответственным "
+    "указывай того, кто взял задачу или кому её поручили, — по имени, если оно прозвучало, иначе по метке "
+    "спикера. Не угадывай ответственного; если его не видно из реплик, пиши 'не назначен'."
+)
+SUMMARY_PARTIAL_PROMPT = (
+    "Ты помогаешь проджект-менеджеру разобрать длинную встречу. Тебе дан фрагмент транскрипции. "
+    "Выпиши кратко и по делу: о чём говорили, какие решения приняли, какие задачи поставили "
+    "(задача — ответственный — срок, если они названы). Ответственного бери из метки спикера "
+    "(«Спикер 2») или прозвучавшего имени. Не додумывай то, чего нет во фрагменте. "
+    "Если во фрагменте нет содержательного обсуждения — напиши 'нет данных'."
+)
 
 # Инициализация OpenAI клиента
 _openai_client = None
+_encoding = None
 
 def get_openai_client():
     """Ленивая инициализация OpenAI клиента"""
@@ -10,48 +56,288 @@ def get_openai_client():
     if _openai_client is None:
         api_key = os.getenv("OPENAI_API_KEY")
         if api_key:
-            _openai_client = OpenAI(api_key=api_key)
+            _openai_client = OpenAI(
+                api_key=api_key,
+                base_url=OPENAI_BASE_URL or None,
+                timeout=OPENAI_TIMEOUT,
+                max_retries=OPENAI_MAX_RETRIES,
+            )
     return _openai_client
 
-def convert_to_plans_and_tasks(transcription: str) -> str:
+
+def count_tokens(text: str) -> int:
+    """Количество токенов в тексте: точно через tiktoken, если он установлен, иначе оценка по длине"""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    return len(text) // CHARS_PER_TOKEN + 1
+
+
+def check_summary_config():
     """
-    Преобразует транскрипцию встречи в формат "планы и задачи"
+    Проверяет при старте, что сворачивание выжимок сходится: в фрагмент должны помещаться
+    хотя бы две выжимки, иначе число фрагментов от раунда к раунду не уменьшается
+    """
+    partial_tokens = SUMMARY_PARTIAL_MAX_TOKENS + SUMMARY_PARTIAL_OVERHEAD_TOKENS
+    if SUMMARY_CHUNK_TOKENS < 2 * partial_tokens:
+        raise ValueError(
+            f"SUMMARY_CHUNK_TOKENS={SUMMARY_CHUNK_TOKENS} должен быть не меньше "
+            f"{2 * partial_tokens}: вдвое больше SUMMARY_PARTIAL_MAX_TOKENS={SUMMARY_PARTIAL_MAX_TOKENS} "
+            f"с заголовком выжимки"
+        )
+
+
+def split_into_chunks(text: str, max_tokens: int = SUMMARY_CHUNK_TOKENS) -> list[str]:
+    """
+    Делит текст на фрагменты не длиннее max_tokens.
+    Режет по строкам (в транскрипте строка — реплика спикера с таймкодом),
+    слишком длинные строки — по словам.
+    """
+    chunks = []
+    current = []
+    current_tokens = 0
+
+    def flush():
+        nonlocal current, current_tokens
+        if current:
+            chunks.append("\n".join(current))
+        current = []
+        current_tokens = 0
+
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        line_tokens = count_tokens(line)
+        if line_tokens > max_tokens:
+            flush()
+            words = []
+            words_tokens = 0
+            for word in line.split():
+                word_tokens = count_tokens(word) + 1
+                if words and words_tokens + word_tokens > max_tokens:
+                    chunks.append(" ".join(words))
+                    words = []
+                    words_tokens = 0
+                words.append(word)
+                words_tokens += word_tokens
+            if words:
+                chunks.append(" ".join(words))
+            continue
+        if current_tokens + line_tokens > max_tokens:
+            flush()
+        current.append(line)
+        current_tokens += line_tokens + 1
+    flush()
+    return chunks
+
+
+class SectionStream:
+    """
+    Собирает текст, приходящий кусками, в разделы отчёта и отдаёт в on_section каждый раздел,
+    как только начался следующий. Раздел начинается с заголовка после пустой строки;
+    нумерованный заголовок должен продолжать нумерацию разделов, чтобы списки задач не дробились.
+    """
+
+    def __init__(self, on_section):
+        self.on_section = on_section
+        self.error = None
+        self._lines = []
+        self._partial = []
+        self._next_number = 1
+
+    def feed(self, text: str):
+        start = 0
+        while True:
+            end = text.find("\n", start)
+            if end < 0:
+                self._partial.append(text[start:])
+                return
+            self._partial.append(text[start:end])
+            self._add_line("".join(self._partial))
+            self._partial = []
+            start = end + 1
+
+    def close(self):
+        if self._partial:
+            self._add_line("".join(self._partial))
+            self._partial = []
+        self._emit()
+
+    def _is_heading(self, line: str) -> bool:
+        if self._lines and self._lines[-1].strip():
+            return False
+        match = SECTION_HEADING.match(line)
+        if not match:
+            return False
+        if match.group(1) is None:
+            return True
+        if int(match.group(1)) != self._next_number:
+            return False
+        self._next_number += 1
+        return True
+
+    def _add_line(self, line: str):
+        if self._is_heading(line) and any(previous.strip() for previous in self._lines):
+            self._emit()
+        self._lines.append(line)
+
+    def _emit(self):
+        section = "\n".join(self._lines).strip()
+        self._lines = []
+        if not section:
+            return
+        try:
+            self.on_section(section)
+        except BaseException as e:
+            # Ошибку доставки отличаем от ошибки модели: её нельзя подменять текстом отчёта
+            self.error = e
+            raise
+
+
+def split_sections(text: str) -> list[str]:
+    """Разделы готового отчёта — те же, что отдаёт SectionStream при потоковом получении"""
+    sections = []
+    stream = SectionStream(sections.append)
+    stream.feed(text)
+    stream.close()
+    return sections
+
+
+def _complete(system_prompt: str, user_content: str, max_tokens: int, on_delta=None) -> str:
+    """
+    Один запрос к модели с кэшем по модели, промптам и тексту.
+    С on_delta ответ запрашивается потоком, и каждый полученный кусок текста сразу передаётся в on_delta
+    """
+    cache = get_cache()
+    cache_key = cache.make_key("summary", SUMMARY_MODEL, system_prompt, user_content, max_tokens)
+    cached = cache.get(cache_key)
+    if cached is not None:
+        if on_delta:
+            on_delta(cached)
+        return cached
+
+    request = {
+        "model": SUMMARY_MODEL,
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_content},
+        ],
+        "temperature": 0.2,
+        "max_tokens": max_tokens,
+    }
+    if on_delta is None:
+        result = get_openai_client().chat.completions.create(**request).choices[0].message.content
+    else:
+        pieces = []
+        for chunk in get_openai_client().chat.completions.create(**request, stream=True):
+            delta = chunk.choices[0].delta.content if chunk.choices else None
+            if delta:
+                pieces.append(delta)
+                on_delta(delta)
+        result = "".join(pieces)
+    cache.set(cache_key, result)
+    return result
+
+
+def _summarize_partial(args: tuple[int, int, str]) -> str:
+    index, total, chunk = args
+    return _complete(
+        SUMMARY_PARTIAL_PROMPT,
+        f"Фрагмент {index} из {total}.\n\n{chunk}",
+        SUMMARY_PARTIAL_MAX_TOKENS,
+    )
+
+
+def _map_chunks(chunks: list[str]) -> list[str]:
+    """Параллельно выжимает фрагменты, не больше SUMMARY_CONCURRENCY запросов одновременно"""
+    jobs = [(i, len(chunks), chunk) for i, chunk in enumerate(chunks, 1)]
+    with ThreadPoolExecutor(max_workers=max(1, min(SUMMARY_CONCURRENCY, len(jobs)))) as executor:
+        return list(executor.map(_summarize_partial, jobs))
+
+
+def summarize_transcription(transcription: str, system_prompt: str = SUMMARY_SYSTEM_PROMPT, on_delta=None) -> str:
+    """
+    Отчёт по транскрипции в формате map-reduce: короткая встреча уходит в модель целиком,
+    длинная делится на фрагменты по SUMMARY_CHUNK_TOKENS, фрагменты выжимаются параллельно,
+    а выжимки сводятся в итоговый отчёт. Если выжимок слишком много для одного запроса,
+    они сворачиваются тем же способом ещё раз. on_delta получает итоговый отчёт потоком.
+    """
+    text = transcription
+    chunks = split_into_chunks(text)
+    rounds = 0
+    while len(chunks) > 1:
+        rounds += 1
+        logger.info(f"Саммари: раунд {rounds}, фрагментов {len(chunks)}")
+        partials = _map_chunks(chunks)
+        text = "\n\n".join(f"Фрагмент {i}:\n{partial}" for i, partial in enumerate(partials, 1))
+        folded = split_into_chunks(text)
+        if len(folded) >= len(chunks):
+            raise RuntimeError(
+                f"Саммари не сходится: после раунда {rounds} фрагментов {len(folded)} из {len(chunks)}, "
+                f"увеличьте SUMMARY_CHUNK_TOKENS или уменьшите SUMMARY_PARTIAL_MAX_TOKENS"
+            )
+        chunks = folded
+
+    if rounds:
+        user_content = (
+            "Ниже выжимки из последовательных фрагментов одной встречи. Сведи их в единый отчёт, "
+            "объединив повторы. Если встреча не несёт смысла (тест, шутки), напрямую напиши, "
+            "что содержательного обсуждения не было.\n\n"
+            f"{text}"
+        )
+    else:
+        user_content = (
+            "Сформируй отчёт по транскрипции ниже. Если встреча не несёт смысла (тест, шутки), "
+            "напрямую напиши, что содержательного обсуждения не было.\n\n"
+            f"{text}"
+        )
+    return _complete(system_prompt, user_content, SUMMARY_MAX_TOKENS, on_delta)
+
+
+def convert_to_plans_and_tasks(transcription: str, system_prompt: str | None = None, on_section=None) -> str:
+    """
+    Преобразует транскрипцию встречи в формат "планы и задачи".
+    system_prompt заменяет стандартный промпт итогового отчёта (свой у каждого арендатора).
+    on_section получает разделы отчёта по мере их готовности, не дожидаясь конца ответа модели
     """
     client = get_openai_client()
-    
+    sections = SectionStream(on_section) if on_section else None
+
     if not client:
         # Если нет API ключа, возвращаем простую обработку
-        return f"📋 Планы и задачи из встречи:\n\n{transcription}"
-    
+        result = f"📋 Планы и задачи из встречи:\n\n{transcription}"
+        if sections:
+            sections.feed(result)
+            sections.close()
+        return result
+
+    started = time.perf_counter()
     try:
-        response = client.chat.completions.create(
-            model="gpt-4o-mini",
-            messages=[
-                {
-                    "role": "system",
-                    "content": (
-                        "Ты выступаешь как проджект-менеджер. На основе транскрипции встречи "
-                        "сформируй понятный отчёт, который состоит из трёх блоков:\n"
-                        "1. 📌 Краткое резюме (2-3 предложения о цели и статусе).\n"
-                        "2. ✅ Принятые решения/согласованные моменты (буллеты).\n"
-                        "3. 🧱 Планы и задачи (каждая строка в формате: • Задача — ответственный — срок/статус).\n"
-                        "Указывай конкретику, избегай бессмысленных пунктов. Если информации нет — явно напиши 'нет данных'."
-                    ),
-                },
-                {
-                    "role": "user",
-                    "content": (
-                        "Сформируй отчёт по транскрипции ниже. Если встреча не несёт смысла (тест, шутки), "
-                        "напрямую напиши, что содержательного обсуждения не было.\n\n"
-                        f"{transcription}"
-                    ),
-                },
-            ],
-            temperature=0.2,
-            max_tokens=1000,
-        )
-        
-        return response.choices[0].message.content
+        with span("openai.summary", model=SUMMARY_MODEL, transcript_tokens=count_tokens(transcription)):
+            summary = summarize_transcription(
+                transcription, system_prompt or SUMMARY_SYSTEM_PROMPT, sections.feed if sections else None
+            )
+            if sections:
+                sections.close()
+        summary_duration.observe(time.perf_counter() - started)
+        return summary
     except Exception as e:
-        # Если ошибка с OpenAI, возвращаем транскрипцию с базовым форматированием
-        return f"📋 Планы и задачи из встречи:\n\n{transcription}\n\n(Ошибка обработки через AI: {str(e)})"
+        if sections and sections.error is not None:
+            raise
+        # Полная транскрибация уже отправлена файлом, поэтому не дублируем её в сообщении
+        logger.error(f"Ошибка обработки через AI: {e}")
+        message = f"Не удалось сформировать отчёт через AI: {str(e)}\nПолная транскрибация отправлена файлом выше."
+        if sections:
+            # Разделы, полученные до обрыва, уже отправлены; сообщение об ошибке идёт следующим разделом
+            sections.close()
+            sections.feed(message)
+            sections.close()
+        return message
@@ -0,0 +1,154 @@
+import os
+import json
+
+# Какие файлы транскрипта отправлять в Telegram; создаются всегда все форматы из FORMATS
+TRANSCRIPT_FORMATS = [name.strip() for name in os.getenv("TRANSCRIPT_FORMATS", "txt,srt").split(",") if name.strip()]
+FORMATS = ("txt", "srt", "vtt", "json")
+# Абзац текстового транскрипта: реплика одного спикера, но не длиннее минуты и без долгих пауз
+PARAGRAPH_MAX_SECONDS = 60
+PARAGRAPH_PAUSE_SECONDS = 3
+# Версия формата transcript.json
+TRANSCRIPT_VERSION = 1
+
+# Сегмент транскрипта — компактный массив [начало, конец, спикер, текст]:
+# время в секундах от начала записи, спикер — номер с нуля или None без диаризации
+START, END, SPEAKER, TEXT = range(4)
+
+
+def make_segment(start: float, end: float, text: str, speaker: int | None = None) -> list:
+    return [round(start, 2), round(end, 2), speaker, text]
+
+
+def speaker_label(speaker: int) -> str:
+    return f"Спикер {speaker + 1}"
+
+
+def format_timestamp(seconds: float, separator: str = ",") -> str:
+    """00:01:02,345 для SRT, 00:01:02.345 для VTT"""
+    milliseconds = int(round(seconds * 1000))
+    hours, milliseconds = divmod(milliseconds, 3600 * 1000)
+    minutes, milliseconds = divmod(milliseconds, 60 * 1000)
+    seconds, milliseconds = divmod(milliseconds, 1000)
+    return f"{hours:02d}:{minutes:02d}:{seconds:02d}{separator}{milliseconds:03d}"
+
+
+def assign_speakers(segments, turns: list[tuple[float, float, int]]):
+    """
+    Проставляет сегментам спикера реплики, с которой сегмент пересекается дольше всего,
+    а сегментам вне реплик — спикера ближайшей. Сегменты и реплики идут по времени,
+    поэтому сегменты обрабатываются потоком. Спикеры нумеруются по первой реплике,
+    чтобы в тексте не было пропущенных номеров
+    """
+    first = 0
+    numbers = {}
+    for segment in segments:
+        if not turns:
+            yield segment
+            continue
+        start, end = segment[START], segment[END]
+        while first < len(turns) - 1 and turns[first][1] <= start:
+            first += 1
+        overlaps = {}
+        i = first
+        while i < len(turns) and turns[i][0] < end:
+            overlap = min(end, turns[i][1]) - max(start, turns[i][0])
+            if overlap > 0:
+                overlaps[turns[i][2]] = overlaps.get(turns[i][2], 0) + overlap
+            i += 1
+        if overlaps:
+            speaker = max(overlaps, key=overlaps.get)
+        else:
+            nearest = [turns[j] for j in (first - 1, first) if 0 <= j < len(turns)]
+            speaker = min(nearest, key=lambda turn: max(turn[0] - end, start - turn[1], 0))[2]
+        segment[SPEAKER] = numbers.setdefault(speaker, len(numbers))
+        yield segment
+
+
+def iter_paragraphs(segments):
+    """Склеивает подряд идущие сегменты одного спикера в абзацы (начало, спикер, текст)"""
+    paragraph = None
+    for segment in segments:
+        if paragraph and paragraph["speaker"] == segment[SPEAKER] \
+                and segment[START] - paragraph["end"] < PARAGRAPH_PAUSE_SECONDS \
+                and segment[END] - paragraph["start"] <= PARAGRAPH_MAX_SECONDS:
+            paragraph["texts"].append(segment[TEXT])
+            paragraph["end"] = segment[END]
+            continue
+        if paragraph:
+            yield paragraph["start"], paragraph["speaker"], " ".join(paragraph["texts"])
+        paragraph = {"start": segment[START], "end": segment[END], "speaker": segment[SPEAKER],
+                     "texts": [segment[TEXT]]}
+    if paragraph:
+        yield paragraph["start"], paragraph["speaker"], " ".join(paragraph["texts"])
+
+
+def format_paragraph(start: float, speaker: int | None, text: str) -> str:
+    """
+    Абзац текстового транскрипта с временем и меткой спикера: по ним саммари берёт
+    ответственных из разметки, а не угадывает по тексту
+    """
+    label = f"{speaker_label(speaker)}: " if speaker is not None else ""
+    return f"[{format_timestamp(start)[:8]}] {label}{text}"
+
+
+def _cue_text(segment: list, vtt: bool) -> str:
+    if segment[SPEAKER] is None:
+        return segment[TEXT]
+    if vtt:
+        return f"<v {speaker_label(segment[SPEAKER])}>{segment[TEXT]}"
+    return f"{speaker_label(segment[SPEAKER])}: {segment[TEXT]}"
+
+
+def write_transcript(segments, base_path: str) -> dict[str, str]:
+    """
+    Сохраняет транскрипт во всех форматах рядом: base_path.txt, .srt, .vtt, .json.
+    Сегменты читаются потоком, а в файлы пишутся по реплике и по абзацу, поэтому
+    память не растёт с длиной встречи. В json сегменты идут по одному на строку
+    """
+    paths = {name: f"{base_path}.{name}" for name in FORMATS}
+    files = {name: open(path, "w", encoding="utf-8") for name, path in paths.items()}
+    try:
+        files["vtt"].write("WEBVTT\n\n")
+        header = json.dumps({"version": TRANSCRIPT_VERSION, "fields": ["start", "end", "speaker", "text"]})
+        files["json"].write(f'{header[:-1]}, "segments": [')
+        speakers = set()
+        count = 0
+
+        def cues():
+            nonlocal count
+            for segment in segments:
+                count += 1
+                files["srt"].write(
+                    f"{count}\n{format_timestamp(segment[START])} --> {format_timestamp(segment[END])}\n"
+                    f"{_cue_text(segment, False)}\n\n"
+                )
+                files["vtt"].write(
+                    f"{format_timestamp(segment[START], '.')} --> {format_timestamp(segment[END], '.')}\n"
+                    f"{_cue_text(segment, True)}\n\n"
+                )
+                separator = ",\n" if count > 1 else "\n"
+                files["json"].write(f"{separator}  {json.dumps(segment, ensure_ascii=False)}")
+                if segment[SPEAKER] is not None:
+                    speakers.add(segment[SPEAKER])
+                yield segment
+
+        for paragraph in iter_paragraphs(cues()):
+            files["txt"].write(format_paragraph(*paragraph) + "\n")
+        labels = json.dumps([speaker_label(speaker) for speaker in sorted(speakers)], ensure_ascii=False)
+        files["json"].write(f'\n], "speakers": {labels}}}\n')
+    finally:
+        for f in files.values():
+            f.close()
+    return paths
+
+
+def iter_segments(path: str):
+    """
+    Сегменты по одному из JSON Lines, который пишется во время распознавания,
+    или из transcript.json (в нём сегмент тоже занимает строку)
+    """
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.strip().rstrip(",")
+            if line.startswith("["):
+                yield json.loads(line)
@@ -0,0 +1,114 @@
+import os
+import time
+import numpy as np
+from abc import ABC, abstractmethod
+
+# Движок распознавания и его параметры задаются на уровне деплоя
+TRANSCRIBE_BACKEND = os.getenv("TRANSCRIBE_BACKEND", "whisper")
+WHISPER_MODEL_SIZE = os.getenv("WHISPER_MODEL_SIZE", "base")
+# Тип вычислений для faster-whisper: int8 заметно быстрее на CPU при небольшой потере качества
+WHISPER_COMPUTE_TYPE = os.getenv("WHISPER_COMPUTE_TYPE", "int8")
+# 0 — поделить ядра поровну между процессами пула транскрибации
+WHISPER_THREADS = int(os.getenv("WHISPER_THREADS", "0"))
+# Сколько процессорного времени заглушка тратит на секунду аудио, имитируя модель (0 — нисколько)
+STUB_REAL_TIME_FACTOR = float(os.getenv("STUB_REAL_TIME_FACTOR", "0"))
+
+
+class TranscriptionBackend(ABC):
+    """
+    Движок распознавания: загружает модель и транскрибирует 16 кГц моно float32.
+    Результат — сегменты (начало, конец, текст) со временем в секундах от начала клипа
+    """
+
+    name = ""
+
+    def __init__(self, model_size: str = WHISPER_MODEL_SIZE, compute_type: str = WHISPER_COMPUTE_TYPE,
+                 threads: int = 1):
+        self.model_size = model_size
+        self.compute_type = compute_type
+        self.threads = threads
+
+    @abstractmethod
+    def load(self):
+        ...
+
+    @abstractmethod
+    def transcribe_segments(self, audio: np.ndarray, language: str = "ru") -> list[tuple[float, float, str]]:
+        ...
+
+    def transcribe(self, audio: np.ndarray, language: str = "ru") -> str:
+        return "".join(text for _, _, text in self.transcribe_segments(audio, language))
+
+
+class OpenAIWhisperBackend(TranscriptionBackend):
+    """Исходная реализация на openai-whisper (PyTorch)"""
+
+    name = "whisper"
+
+    def load(self):
+        import torch
+        import whisper
+
+        torch.set_num_threads(self.threads)
+        self._model = whisper.load_model(self.model_size)
+
+    def transcribe_segments(self, audio: np.ndarray, language: str = "ru") -> list[tuple[float, float, str]]:
+        result = self._model.transcribe(audio, language=language)
+        return [(segment["start"], segment["end"], segment["text"]) for segment in result["segments"]]
+
+
+class FasterWhisperBackend(TranscriptionBackend):
+    """CTranslate2-движок faster-whisper с квантизацией (int8 по умолчанию)"""
+
+    name = "faster-whisper"
+
+    def load(self):
+        from faster_whisper import WhisperModel
+
+        self._model = WhisperModel(
+            self.model_size,
+            device="cpu",
+            compute_type=self.compute_type,
+            cpu_threads=self.threads,
+        )
+
+    def transcribe_segments(self, audio: np.ndarray, language: str = "ru") -> list[tuple[float, float, str]]:
+        segments, _ = self._model.transcribe(audio, language=language, beam_size=1)
+        return [(segment.start, segment.end, segment.text) for segment in segments]
+
+
+class StubBackend(TranscriptionBackend):
+    """Заглушка без модели для тестов и замеров остального конвейера"""
+
+    name = "stub"
+
+    def load(self):
+        pass
+
+    def transcribe_segments(self, audio: np.ndarray, language: str = "ru") -> list[tuple[float, float, str]]:
+        duration = len(audio) / 16000
+        deadline = time.process_time() + duration * STUB_REAL_TIME_FACTOR
+        while time.process_time() < deadline:
+            sum(i * i for i in range(10000))
+        return [(0.0, duration, f"Фрагмент речи длительностью {duration:.1f} секунд.")]
+
+
+BACKENDS = {
+    backend.name: backend
+    for backend in (OpenAIWhisperBackend, FasterWhisperBackend, StubBackend)
+}
+
+
+def create_backend(name: str = TRANSCRIBE_BACKEND, **kwargs) -> TranscriptionBackend:
+    if name not in BACKENDS:
+        raise ValueError(f"Неизвестный движок транскрибации: {name}. Доступны: {', '.join(BACKENDS)}")
+    return BACKENDS[name](**kwargs)
+
+
+def backend_config() -> dict:
+    """Текущая конфигурация движка — влияет на результат транскрибации"""
+    return {
+        "backend": TRANSCRIBE_BACKEND,
+        "model_size": WHISPER_MODEL_SIZE,
+        "compute_type": WHISPER_COMPUTE_TYPE if TRANSCRIBE_BACKEND == FasterWhisperBackend.name else None,
+    }
@@ -0,0 +1,119 @@
+"""
+Отдельный процесс воркеров конвейера: берёт задачи из общей очереди и выполняет этапы
+скачивания, транскрибации, саммари и отправки, не принимая webhook.
+
+    python -m worker                        # оба пула
+    python -m worker --pools transcribe     # только транскрибация и саммари
+    python -m worker --pools download --metrics-port 9101
+
+API при этом запускается с RUN_EMBEDDED_WORKERS=0 и только ставит задачи в очередь.
+Процессы работают на одной машине (SQLite в режиме WAL не работает через сетевые ФС)
+и делят JOBS_DB_PATH, JOBS_WORK_DIR и CACHE_DIR; задача захватывается под аренду,
+а задачи упавшего воркера после JOB_LEASE_SECONDS забирают остальные.
+"""
+import os
+import json
+import signal
+import asyncio
+import logging
+import argparse
+import threading
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+from zoom_logic import shutdown_transcription_pool, warm_up_transcription_pool, model_readiness, PRELOAD_MODEL
+from queue_logic import JobQueue
+from metrics_logic import render_metrics
+from dedup_logic import release_meeting
+from pipeline_logic import WorkerPool, POOLS
+from text_logic import check_summary_config
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Порт для /metrics и /ready воркера; 0 — не поднимать HTTP
+WORKER_METRICS_PORT = int(os.getenv("WORKER_METRICS_PORT", "0"))
+
+
+class _StatusHandler(BaseHTTPRequestHandler):
+    """Метрики Prometheus и готовность воркера для оркестратора"""
+
+    needs_model = True
+
+    def do_GET(self):
+        if self.path == "/metrics":
+            self._reply(200, render_metrics().encode(), "text/plain; version=0.0.4; charset=utf-8")
+        elif self.path == "/ready":
+            model = model_readiness.snapshot()
+            is_ready = model["state"] == "ready" or not PRELOAD_MODEL or not self.needs_model
+            body = json.dumps({"ready": is_ready, "model": model}).encode()
+            self._reply(200 if is_ready else 503, body, "application/json")
+        else:
+            self._reply(404, b"", "text/plain")
+
+    def _reply(self, status: int, body: bytes, content_type: str):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def start_status_server(port: int, needs_model: bool) -> ThreadingHTTPServer:
+    handler = type("StatusHandler", (_StatusHandler,), {"needs_model": needs_model})
+    server = ThreadingHTTPServer(("0.0.0.0", port), handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logger.info(f"Метрики воркера доступны на :{port}/metrics")
+    return server
+
+
+async def run(pools: list[str], metrics_port: int):
+    if "transcribe" in pools:
+        check_summary_config()
+    job_queue = JobQueue()
+    worker_pool = WorkerPool(job_queue, on_job_failed=release_meeting, pools=pools)
+    needs_model = "transcribe" in pools
+    server = start_status_server(metrics_port, needs_model) if metrics_port else None
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGTERM, signal.SIGINT):
+        loop.add_signal_handler(sig, stopping.set)
+
+    worker_pool.start()
+    warmup = None
+    if needs_model and PRELOAD_MODEL:
+        warmup = asyncio.create_task(asyncio.to_thread(warm_up_transcription_pool))
+    await stopping.wait()
+
+    logger.info(f"Останавливаю воркер {job_queue.worker_id}")
+    if warmup:
+        # Прогрев не должен пережить остановку: ждать загрузку модели перед выходом незачем
+        warmup.cancel()
+        await asyncio.gather(warmup, return_exceptions=True)
+    await worker_pool.stop()
+    if needs_model:
+        shutdown_transcription_pool()
+    if server:
+        server.shutdown()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--pools", default=",".join(POOLS),
+                        help=f"пулы через запятую: {', '.join(POOLS)} (по умолчанию все)")
+    parser.add_argument("--metrics-port", type=int, default=WORKER_METRICS_PORT,
+                        help="порт для /metrics и /ready; 0 — без HTTP")
+    args = parser.parse_args()
+
+    pools = [pool.strip() for pool in args.pools.split(",") if pool.strip()]
+    unknown = [pool for pool in pools if pool not in POOLS]
+    if unknown or not pools:
+        parser.error(f"неизвестные пулы: {', '.join(unknown) or '(пусто)'}")
+    asyncio.run(run(pools, args.metrics_port))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,18 +1,110 @@
 import os
+import re
+import json
+import time
+import queue
+import logging
+import threading
+import tempfile
+import subprocess
+import multiprocessing
 import requests
-import whisper
+import numpy as np
+from collections import deque
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
 from urllib.parse import urlparse, parse_qs, urlencode, urlunparse
+from metrics_logic import register_collector, span, audio_seconds, transcription_rtf
+from transcription_backends import create_backend, backend_config, TRANSCRIBE_BACKEND, WHISPER_THREADS
 
-# Инициализация модели Whisper (загружается один раз)
-_model = None
+logger = logging.getLogger(__name__)
 
+# Скачивание: файл делится на сегменты, которые качаются параллельно Range-запросами.
+# Прогресс сегментов сохраняется рядом с файлом, поэтому прерванная загрузка продолжается с места обрыва
+DOWNLOAD_SEGMENTS = int(os.getenv("DOWNLOAD_SEGMENTS", "4"))
+DOWNLOAD_MIN_SEGMENT_SIZE = 8 * 1024 * 1024
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+DOWNLOAD_MAX_RETRIES = int(os.getenv("DOWNLOAD_MAX_RETRIES", "5"))
+# (таймаут соединения, таймаут чтения) в секундах
+DOWNLOAD_TIMEOUT = (10, 60)
+# Как часто сбрасывать прогресс на диск
+DOWNLOAD_PROGRESS_INTERVAL = 2.0
 
-def get_whisper_model():
-    """Ленивая загрузка модели Whisper"""
-    global _model
-    if _model is None:
-        _model = whisper.load_model("base")
-    return _model
+# Распознавание выполняется в отдельных процессах (по умолчанию по числу ядер),
+# чтобы инференс не занимал GIL веб-сервера и фрагменты распознавались параллельно
+WHISPER_PROCESSES = int(os.getenv("WHISPER_PROCESSES", str(os.cpu_count() or 1)))
+
+# Потоковая транскрибация: ffmpeg декодирует запись по мере скачивания в 16 кГц моно,
+# поток режется на фрагменты не длиннее окна, в памяти держится не больше N фрагментов
+SAMPLE_RATE = 16000
+STREAM_WINDOW_SECONDS = int(os.getenv("STREAM_WINDOW_SECONDS", "30"))
+STREAM_BUFFER_WINDOWS = int(os.getenv("STREAM_BUFFER_WINDOWS", "4"))
+
+# Детектор речи по энергии: фрагмент режется в самой тихой точке последних
+# VAD_SEARCH_SECONDS окна, фрагменты без речи пропускаются
+VAD_FRAME_SECONDS = 0.03
+VAD_SEARCH_SECONDS = float(os.getenv("VAD_SEARCH_SECONDS", "10"))
+VAD_SILENCE_RMS = float(os.getenv("VAD_SILENCE_RMS", "0.005"))
+VAD_MIN_SPEECH_FRAMES = 10
+
+# Загружать модель при старте сервиса, а не при первой встрече после деплоя
+PRELOAD_MODEL = os.getenv("PRELOAD_MODEL", "1") == "1"
+# Длина клипа тишины для прогревочного распознавания
+WARMUP_CLIP_SECONDS = 1
+
+_download_session = None
+_download_session_lock = threading.Lock()
+
+# Движок распознавания (модель загружается один раз в каждом процессе пула)
+_backend = None
+_backend_load_seconds = None
+_pool = None
+_pool_lock = threading.Lock()
+# Идёт прогрев пула: сбой процесса во время прогрева не запускает ещё один прогрев
+_warming_up = threading.Event()
+
+
+def get_transcription_backend():
+    """Ленивая загрузка движка распознавания, выбранного через TRANSCRIBE_BACKEND"""
+    global _backend, _backend_load_seconds
+    if _backend is None:
+        started = time.perf_counter()
+        threads = WHISPER_THREADS or max(1, (os.cpu_count() or 1) // WHISPER_PROCESSES)
+        backend = create_backend(TRANSCRIBE_BACKEND, threads=threads)
+        backend.load()
+        _backend_load_seconds = time.perf_counter() - started
+        _backend = backend
+    return _backend
+
+
+class ModelReadiness:
+    """Состояние загрузки модели в пуле распознавания для /ready"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = {"state": "not_loaded"}
+
+    def set(self, state: str, **fields):
+        with self._lock:
+            self._state = {"state": state, **fields}
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self._state)
+
+
+model_readiness = ModelReadiness()
+
+
+def transcription_config() -> dict:
+    """Параметры, от которых зависит текст транскрипта (входят в ключ кэша)"""
+    return {
+        **backend_config(),
+        "window_seconds": STREAM_WINDOW_SECONDS,
+        "vad_search_seconds": VAD_SEARCH_SECONDS,
+        "vad_silence_rms": VAD_SILENCE_RMS,
+    }
 
 
 def _append_access_token(download_url: str, access_token: str | None) -> str:
@@ -26,24 +118,532 @@ def _append_access_token(download_url: str, access_token: str | None) -> str:
     return urlunparse(parsed._replace(query=new_query))
 
 
-def download_zoom_file(download_url: str, save_path: str, access_token: str | None = None):
-    """Скачивает файл записи Zoom по download_url, используя access_token при необходимости"""
+_ACCESS_TOKEN_PARAM = re.compile(r"(access_token=)[^&\s'\"]+")
+
+
+def _redact_access_token(text: str) -> str:
+    """Скрывает access_token в URL: текст ошибок уходит в логи и в Telegram"""
+    return _ACCESS_TOKEN_PARAM.sub(r"\1***", text)
+
+
+class DownloadIntegrityError(RuntimeError):
+    """Скачанный файл не совпадает по размеру с file_size из webhook Zoom"""
+
+
+class _RetryableDownloadError(RuntimeError):
+    pass
+
+
+class DownloadMetrics:
+    """Счётчики скачивания: объём, время, повторы и пропускная способность последней загрузки"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.downloads = 0
+        self.failures = 0
+        self.retries = 0
+        self.bytes_total = 0
+        self.seconds_total = 0.0
+        self.last_throughput_mbps = 0.0
+
+    def observe(self, size: int, seconds: float):
+        with self._lock:
+            self.downloads += 1
+            self.bytes_total += size
+            self.seconds_total += seconds
+            self.last_throughput_mbps = size * 8 / max(seconds, 1e-6) / 1e6
+
+    def increment(self, name: str):
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return {
+                "downloads": self.downloads,
+                "failures": self.failures,
+                "retries": self.retries,
+                "bytes_total": self.bytes_total,
+                "avg_throughput_mbps": round(self.bytes_total * 8 / self.seconds_total / 1e6, 2)
+                if self.seconds_total else 0.0,
+                "last_throughput_mbps": round(self.last_throughput_mbps, 2),
+            }
+
+    def collect(self) -> list[tuple]:
+        """Счётчики для /metrics"""
+        with self._lock:
+            return [
+                ("downloads_total", "counter", "Скачанные файлы записей", self.downloads, None),
+                ("download_failures_total", "counter", "Неудачные скачивания", self.failures, None),
+                ("download_retries_total", "counter", "Повторы сегментов после обрыва", self.retries, None),
+                ("download_bytes_total", "counter", "Скачанные байты", self.bytes_total, None),
+                ("download_seconds_total", "counter", "Суммарное время скачивания",
+                 round(self.seconds_total, 3), None),
+            ]
+
+
+download_metrics = DownloadMetrics()
+register_collector(download_metrics.collect)
+
+
+def get_download_session() -> requests.Session:
+    global _download_session
+    with _download_session_lock:
+        if _download_session is None:
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=4, pool_maxsize=DOWNLOAD_SEGMENTS * 4)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _download_session = session
+        return _download_session
+
+
+def _probe_download(session: requests.Session, url: str) -> tuple[str, int | None, bool]:
+    """Возвращает итоговый URL после редиректов, размер файла и поддержку Range-запросов"""
+    with session.get(url, headers={"Range": "bytes=0-0"}, stream=True, timeout=DOWNLOAD_TIMEOUT) as resp:
+        resp.raise_for_status()
+        if resp.status_code == 206:
+            total = resp.headers.get("Content-Range", "").rsplit("/", 1)[-1]
+            if total.isdigit():
+                return resp.url, int(total), True
+        length = resp.headers.get("Content-Length")
+        return resp.url, int(length) if length and resp.status_code == 200 else None, False
+
+
+class _DownloadProgress:
+    """Прогресс сегментов [начало, конец, скачано байт], сохраняемый в файл рядом с загрузкой"""
+
+    def __init__(self, path: str, total: int, segments: list[list[int]]):
+        self.path = path
+        self.total = total
+        self.segments = segments
+        self._lock = threading.Lock()
+        self._saved_at = 0.0
+
+    @classmethod
+    def load_or_create(cls, path: str, save_path: str, total: int) -> "_DownloadProgress":
+        try:
+            with open(path, encoding="utf-8") as f:
+                state = json.load(f)
+            if state["total"] == total and os.path.getsize(save_path) == total:
+                return cls(path, total, state["segments"])
+        except (OSError, ValueError, KeyError):
+            pass
+        count = max(1, min(DOWNLOAD_SEGMENTS, total // DOWNLOAD_MIN_SEGMENT_SIZE))
+        size = -(-total // count)
+        segments = [[start, min(start + size, total) - 1, 0] for start in range(0, total, size)]
+        return cls(path, total, segments)
+
+    def save(self, force: bool = False):
+        with self._lock:
+            now = time.monotonic()
+            if not force and now - self._saved_at < DOWNLOAD_PROGRESS_INTERVAL:
+                return
+            self._saved_at = now
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({"total": self.total, "segments": self.segments}, f)
+            os.replace(tmp_path, self.path)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+def _download_segment(session, url: str, fd: int, segment: list[int], progress: _DownloadProgress, stop: threading.Event):
+    start, end, _ = segment
+    attempt = 0
+    while segment[2] < end - start + 1 and not stop.is_set():
+        offset = start + segment[2]
+        try:
+            with session.get(url, headers={"Range": f"bytes={offset}-{end}"}, stream=True, timeout=DOWNLOAD_TIMEOUT) as resp:
+                if resp.status_code >= 500:
+                    raise _RetryableDownloadError(f"HTTP {resp.status_code}")
+                resp.raise_for_status()
+                if resp.status_code != 206:
+                    raise RuntimeError("Сервер перестал поддерживать Range-запросы")
+                for chunk in resp.iter_content(DOWNLOAD_CHUNK_SIZE):
+                    if stop.is_set():
+                        return
+                    position = start + segment[2]
+                    chunk = chunk[: end + 1 - position]
+                    os.pwrite(fd, chunk, position)
+                    segment[2] += len(chunk)
+                    progress.save()
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError,
+                _RetryableDownloadError) as e:
+            attempt += 1
+            if attempt > DOWNLOAD_MAX_RETRIES:
+                raise
+            delay = min(2 ** attempt, 30)
+            logger.warning(f"Сегмент {start}-{end}: {e}, продолжаю с {start + segment[2]} через {delay} с")
+            download_metrics.increment("retries")
+            time.sleep(delay)
+
+
+def _download_ranged(session, url: str, save_path: str, total: int):
+    progress = _DownloadProgress.load_or_create(f"{save_path}.progress", save_path, total)
+    # Файл выделяется сразу целиком, сегменты пишутся в свои смещения через pwrite
+    fd = os.open(save_path, os.O_RDWR | os.O_CREAT, 0o644)
+    stop = threading.Event()
+    try:
+        os.ftruncate(fd, total)
+        pending = [segment for segment in progress.segments if segment[2] < segment[1] - segment[0] + 1]
+        with ThreadPoolExecutor(max_workers=max(1, len(pending))) as executor:
+            futures = [
+                executor.submit(_download_segment, session, url, fd, segment, progress, stop)
+                for segment in pending
+            ]
+            try:
+                for future in futures:
+                    future.result()
+            except BaseException:
+                stop.set()
+                raise
+    finally:
+        os.close(fd)
+        progress.save(force=True)
+    progress.remove()
+
+
+def _download_single(session, url: str, save_path: str):
+    """Запасной вариант для серверов без Range: один поток, при обрыве — заново"""
+    for attempt in range(DOWNLOAD_MAX_RETRIES + 1):
+        try:
+            with session.get(url, stream=True, timeout=DOWNLOAD_TIMEOUT) as resp:
+                resp.raise_for_status()
+                with open(save_path, "wb", buffering=DOWNLOAD_CHUNK_SIZE) as f:
+                    for chunk in resp.iter_content(DOWNLOAD_CHUNK_SIZE):
+                        f.write(chunk)
+            return
+        except (requests.ConnectionError, requests.Timeout, requests.exceptions.ChunkedEncodingError) as e:
+            if attempt == DOWNLOAD_MAX_RETRIES:
+                raise
+            delay = min(2 ** (attempt + 1), 30)
+            logger.warning(f"Скачивание прервано: {e}, повтор через {delay} с")
+            download_metrics.increment("retries")
+            time.sleep(delay)
+
+
+def download_zoom_file(download_url: str, save_path: str, access_token: str | None = None,
+                       expected_size: int | None = None):
+    """
+    Скачивает файл записи Zoom по download_url, используя access_token при необходимости.
+    Если сервер поддерживает Range, файл качается параллельными сегментами с докачкой
+    после обрывов. Итоговый размер сверяется с expected_size (file_size из webhook).
+    """
     url_with_token = _append_access_token(download_url, access_token)
-    resp = requests.get(url_with_token, stream=True)
-    resp.raise_for_status()
+    session = get_download_session()
 
     os.makedirs(os.path.dirname(save_path) if os.path.dirname(save_path) else ".", exist_ok=True)
 
-    with open(save_path, "wb") as f:
-        for chunk in resp.iter_content(8192):
-            if chunk:
-                f.write(chunk)
+    started = time.monotonic()
+    try:
+        with span("download_zoom_file", file=os.path.basename(save_path)) as attributes:
+            url, total, ranged = _probe_download(session, url_with_token)
+            if expected_size and total and total != expected_size:
+                raise DownloadIntegrityError(f"Сервер отдаёт {total} байт, а Zoom сообщил {expected_size}")
+            if ranged and total:
+                _download_ranged(session, url, save_path, total)
+            else:
+                _download_single(session, url, save_path)
 
+            size = os.path.getsize(save_path)
+            attributes.update(bytes=size, ranged=ranged)
+            if (expected_size and size != expected_size) or (total and size != total):
+                os.remove(save_path)
+                raise DownloadIntegrityError(
+                    f"Размер скачанного файла {size} байт, ожидалось {expected_size or total}"
+                )
+    except Exception:
+        download_metrics.increment("failures")
+        raise
+
+    elapsed = time.monotonic() - started
+    download_metrics.observe(size, elapsed)
+    logger.info(
+        f"Скачано {os.path.basename(save_path)}: {size / 1024 / 1024:.1f} МБ за {elapsed:.1f} с "
+        f"({size * 8 / max(elapsed, 1e-6) / 1e6:.1f} Мбит/с)"
+    )
     return save_path
 
 
+def get_transcription_pool() -> ProcessPoolExecutor:
+    """Ленивое создание пула процессов распознавания; модель загружается при старте процесса"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                max_workers=WHISPER_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=get_transcription_backend,
+            )
+        return _pool
+
+
+def shutdown_transcription_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _submit(fn, *args):
+    return get_transcription_pool().submit(fn, *args)
+
+
+def _result(future):
+    global _pool
+    try:
+        result = future.result()
+    except BrokenProcessPool:
+        # Процесс пула упал (например, по OOM) — пул создаётся заново и снова прогревается,
+        # чтобы /ready вернулся к 200, не дожидаясь следующей встречи
+        with _pool_lock:
+            _pool = None
+        model_readiness.set("not_loaded", error="Пул распознавания перезапускается после сбоя процесса")
+        if PRELOAD_MODEL and not _warming_up.is_set():
+            threading.Thread(target=warm_up_transcription_pool, name="transcription-warmup", daemon=True).start()
+        raise
+    if model_readiness.snapshot()["state"] in ("not_loaded", "failed"):
+        # Пересозданный пул ответил — значит, модель в нём загружена
+        model_readiness.set("ready", **backend_config())
+    return result
+
+
+def _warm_up_in_worker() -> dict:
+    backend = get_transcription_backend()
+    started = time.perf_counter()
+    backend.transcribe(np.zeros(WARMUP_CLIP_SECONDS * SAMPLE_RATE, dtype=np.float32), language="ru")
+    return {
+        "pid": os.getpid(),
+        "load_seconds": _backend_load_seconds,
+        "warmup_seconds": time.perf_counter() - started,
+    }
+
+
+def warm_up_transcription_pool():
+    """
+    Поднимает пул распознавания: каждый процесс загружает модель и прогоняет
+    короткий клип, чтобы первая встреча после деплоя не ждала загрузки.
+    """
+    _warming_up.set()
+    model_readiness.set("loading", **backend_config())
+    started = time.perf_counter()
+    try:
+        futures = [_submit(_warm_up_in_worker) for _ in range(WHISPER_PROCESSES)]
+        results = [_result(future) for future in futures]
+    except Exception as e:
+        logger.error(f"Не удалось загрузить модель распознавания: {e}", exc_info=True)
+        model_readiness.set("failed", error=str(e), **backend_config())
+        return
+    finally:
+        _warming_up.clear()
+    total_seconds = time.perf_counter() - started
+    model_readiness.set(
+        "ready",
+        processes=len({result["pid"] for result in results}),
+        load_seconds=round(max(result["load_seconds"] or 0.0 for result in results), 2),
+        warmup_seconds=round(max(result["warmup_seconds"] for result in results), 2),
+        total_seconds=round(total_seconds, 2),
+        **backend_config(),
+    )
+    logger.info(f"Модель распознавания загружена и прогрета за {total_seconds:.1f} с")
+
+
+def _transcribe_pcm_in_worker(pcm: bytes) -> list[tuple[float, float, str]]:
+    audio = np.frombuffer(pcm, np.int16).astype(np.float32) / 32768.0
+    return get_transcription_backend().transcribe_segments(audio, language="ru")
+
+
 def transcribe_audio(audio_path: str) -> str:
-    """Транскрибирует аудио файл в текст используя Whisper"""
-    model = get_whisper_model()
-    result = model.transcribe(audio_path, language="ru")
-    return result["text"]
+    """Транскрибирует аудио файл в текст в пуле процессов распознавания"""
+    return stream_transcribe(audio_path)
+
+
+def decode_audio(source: str) -> np.ndarray:
+    """Декодирует файл целиком в 16 кГц моно float32 (для замеров и коротких клипов)"""
+    proc = _open_pcm_stream(source, subprocess.PIPE)
+    pcm, error = proc.communicate()
+    if proc.returncode != 0:
+        raise _ffmpeg_error(proc.returncode, error)
+    return np.frombuffer(pcm, np.int16).astype(np.float32) / 32768.0
+
+
+def _frame_rms(samples: np.ndarray) -> np.ndarray:
+    frame = int(SAMPLE_RATE * VAD_FRAME_SECONDS)
+    count = len(samples) // frame
+    frames = samples[: count * frame].astype(np.float32).reshape(count, frame) / 32768.0
+    return np.sqrt((frames ** 2).mean(axis=1))
+
+
+def _find_silence_cut(samples: np.ndarray) -> int:
+    """Индекс отсчёта для разреза: самая тихая пауза в последних VAD_SEARCH_SECONDS окна"""
+    frame = int(SAMPLE_RATE * VAD_FRAME_SECONDS)
+    search_start = max(0, len(samples) - int(VAD_SEARCH_SECONDS * SAMPLE_RATE))
+    rms = _frame_rms(samples[search_start:])
+    if len(rms) == 0:
+        return len(samples)
+    # Сглаживаем энергию (~0.3 с), чтобы резать в паузе между фразами, а не между слогами
+    width = min(len(rms), 10)
+    smoothed = np.convolve(rms, np.ones(width) / width, mode="same")
+    return search_start + int(np.argmin(smoothed)) * frame + frame // 2
+
+
+def _has_speech(samples: np.ndarray) -> bool:
+    """Фрагменты без речи не отправляем в Whisper: на тишине он галлюцинирует"""
+    rms = _frame_rms(samples)
+    return int(np.count_nonzero(rms >= VAD_SILENCE_RMS)) >= VAD_MIN_SPEECH_FRAMES
+
+
+def _ffmpeg_audio_args(source: str) -> list[str]:
+    """Аргументы ffmpeg: вход и выбор первой аудиодорожки без декодирования видео, 16 кГц моно"""
+    input_args = []
+    if source.startswith(("http://", "https://")):
+        # При обрыве соединения ffmpeg сам переподключается с той же позиции
+        input_args = ["-reconnect", "1", "-reconnect_delay_max", "30"]
+    return [
+        "ffmpeg", "-nostdin", "-loglevel", "error", "-xerror",
+        *input_args,
+        "-i", source,
+        "-map", "0:a:0", "-vn", "-sn", "-dn",
+        "-ac", "1", "-ar", str(SAMPLE_RATE),
+    ]
+
+
+def extract_audio(source: str, save_path: str, access_token: str | None = None) -> str:
+    """Извлекает из записи аудиодорожку в компактный 16 кГц моно FLAC — этого достаточно для транскрибации"""
+    if source.startswith(("http://", "https://")):
+        source = _append_access_token(source, access_token)
+    result = subprocess.run(
+        [*_ffmpeg_audio_args(source), "-c:a", "flac", "-y", save_path],
+        stdin=subprocess.DEVNULL,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.PIPE,
+    )
+    if result.returncode != 0:
+        raise _ffmpeg_error(result.returncode, result.stderr)
+    return save_path
+
+
+def _ffmpeg_error(returncode: int, stderr: bytes) -> RuntimeError:
+    """Ошибка ffmpeg с его выводом; вход — URL с access_token, поэтому токен скрывается"""
+    error = _redact_access_token(stderr.decode("utf-8", errors="ignore").strip())
+    return RuntimeError(f"ffmpeg завершился с кодом {returncode}: {error}")
+
+
+def _open_pcm_stream(source: str, stderr) -> subprocess.Popen:
+    """
+    Запускает ffmpeg, который отдаёт 16 кГц моно PCM в stdout по мере чтения источника.
+    stderr — PIPE только вместе с communicate(): при потоковом чтении stdout заполненный
+    pipe stderr остановил бы ffmpeg, поэтому туда передаётся файл
+    """
+    return subprocess.Popen(
+        [*_ffmpeg_audio_args(source), "-f", "s16le", "pipe:1"],
+        stdout=subprocess.PIPE,
+        stderr=stderr,
+    )
+
+
+def _read_chunks(proc: subprocess.Popen, chunks: queue.Queue, stats: dict):
+    """Режет PCM-поток ffmpeg на фрагменты не длиннее окна, разрезая по паузам речи"""
+    window = STREAM_WINDOW_SECONDS * SAMPLE_RATE
+    buffer = np.empty(0, dtype=np.int16)
+    offset = 0
+    try:
+        while True:
+            data = proc.stdout.read((window - len(buffer)) * 2)
+            if data:
+                buffer = np.concatenate([buffer, np.frombuffer(data, np.int16)])
+            eof = len(buffer) < window
+            cut = len(buffer) if eof else _find_silence_cut(buffer)
+            chunk = buffer[:cut]
+            if len(chunk) and _has_speech(chunk):
+                # Очередь ограничена: если Whisper не успевает, ffmpeg ждёт на записи в pipe
+                chunks.put((offset / SAMPLE_RATE, chunk.tobytes()))
+            offset += cut
+            buffer = buffer[cut:]
+            if eof:
+                break
+    finally:
+        stats["audio_seconds"] = offset / SAMPLE_RATE
+        chunks.put(None)
+
+
+def stream_transcribe(source: str, access_token: str | None = None, on_segment=None, diarizer=None) -> str | None:
+    """
+    Транскрибирует запись фрагментами, не дожидаясь окончания скачивания.
+    Фрагменты режутся по паузам и распознаются параллельно в пуле процессов,
+    текст собирается в порядке времени — по строке на фрагмент.
+    source — download_url Zoom или локальный путь. Если задан on_segment, он получает сегменты
+    (начало, конец, текст) со временем от начала записи по порядку, весь текст в памяти не копится
+    и функция возвращает None. diarizer получает те же фрагменты аудио и разбирает их по спикерам
+    параллельно с распознаванием.
+    """
+    if source.startswith(("http://", "https://")):
+        source = _append_access_token(source, access_token)
+
+    started = time.perf_counter()
+    with tempfile.TemporaryFile() as stderr:
+        proc = _open_pcm_stream(source, stderr)
+        chunks = queue.Queue(maxsize=STREAM_BUFFER_WINDOWS)
+        stats = {}
+        reader = threading.Thread(target=_read_chunks, args=(proc, chunks, stats), daemon=True)
+        reader.start()
+
+        parts = []
+        in_flight = deque()
+        reader_done = False
+
+        def emit_next():
+            offset, future = in_flight.popleft()
+            segments = [(offset + start, offset + end, text.strip()) for start, end, text in _result(future)]
+            segments = [segment for segment in segments if segment[2]]
+            if on_segment:
+                for segment in segments:
+                    on_segment(*segment)
+            elif segments:
+                parts.append(" ".join(text for _, _, text in segments))
+
+        try:
+            while True:
+                item = chunks.get()
+                if item is None:
+                    reader_done = True
+                    break
+                offset, pcm = item
+                in_flight.append((offset, _submit(_transcribe_pcm_in_worker, pcm)))
+                if diarizer:
+                    diarizer.feed(offset, pcm)
+                # Отдаём готовые фрагменты по порядку и не держим в работе больше, чем процессов в пуле
+                while in_flight and (in_flight[0][1].done() or len(in_flight) > WHISPER_PROCESSES):
+                    emit_next()
+            while in_flight:
+                emit_next()
+        except BaseException:
+            proc.kill()
+            for _, future in in_flight:
+                future.cancel()
+            # Освобождаем очередь, чтобы читатель дописал маркер конца и завершился; если маркер уже
+            # получен, читатель закончил и ждать в очереди нечего
+            while not reader_done and chunks.get() is not None:
+                pass
+            raise
+        finally:
+            reader.join()
+
+        returncode = proc.wait()
+        if returncode != 0:
+            stderr.seek(0)
+            raise _ffmpeg_error(returncode, stderr.read())
+
+    elapsed = time.perf_counter() - started
+    duration = stats.get("audio_seconds", 0.0)
+    if duration:
+        audio_seconds.inc(duration)
+        transcription_rtf.observe(elapsed / duration)
+        logger.info(f"Распознано {duration:.0f} с аудио за {elapsed:.0f} с (RTF {elapsed / duration:.2f})")
+    return None if on_segment else "\n".join(parts)